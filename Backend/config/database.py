@@ -1,4 +1,5 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker, AsyncConnection
+from sqlalchemy import text
 from sqlalchemy.pool import NullPool
 import os
 from typing import AsyncGenerator
@@ -42,6 +43,24 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+# Cột/index thêm vào model sau khi bảng đã tồn tại.
+# create_all không ALTER bảng cũ nên cần chạy thêm các lệnh idempotent này.
+SCHEMA_UPGRADES = [
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(100)",
+    "ALTER TABLE posts ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITHOUT TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_posts_status_scheduled_at ON posts (status, scheduled_at)",
+    "CREATE INDEX IF NOT EXISTS ix_pages_token_expires_at ON pages (token_expires_at)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_platform_page ON pages (platform_id, page_id)",
+    "ALTER TABLE pages ADD COLUMN IF NOT EXISTS instagram_account_id VARCHAR(100)",
+]
+
+
+async def upgrade_schema(conn: AsyncConnection):
+    """Apply idempotent schema upgrades for tables created by older versions"""
+    for statement in SCHEMA_UPGRADES:
+        await conn.execute(text(statement))
+
+
 # Initialize database
 async def init_db():
     """
@@ -51,6 +70,7 @@ async def init_db():
     from models.model import Base
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await upgrade_schema(conn)
 
 
 # Close database connection
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from services.facebook_page_service import facebook_callback_service, post_to_facebook_page
-import requests
+from services.http_client import http_client
 from fastapi import APIRouter, Request, HTTPException
 from dotenv import load_dotenv
 import os
@@ -71,7 +71,7 @@ async def facebook_callback_controller(code: str, db: AsyncSession, user_id: int
         "code": code
     }
 
-    response = requests.get(token_url, params=params)
+    response = await http_client.get(token_url, params=params)
     if response.status_code != 200:
         print("Token exchange error:", response.text)
         raise HTTPException(status_code=400, detail="Failed to get access token")
@@ -87,7 +87,7 @@ async def facebook_callback_controller(code: str, db: AsyncSession, user_id: int
         "access_token": access_token,
         "fields": "id,name,access_token,instagram_business_account{id,username,profile_picture_url}"
     }
-    pages_response = requests.get(get_pages_url, params=page_params)
+    pages_response = await http_client.get(get_pages_url, params=page_params)
     
     if pages_response.status_code != 200:
         print("Get pages error:", pages_response.text)
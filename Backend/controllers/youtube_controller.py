@@ -1,9 +1,11 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from services.youtube_service import YouTubeService
+from services.youtube_token_manager import youtube_token_manager
 from fastapi import HTTPException
 from sqlalchemy import select
 from models.model import Page, Platform, PageStatus
-import requests
+from services.http_client import http_client
+from core.config import settings
 import tempfile
 import os
 
@@ -86,6 +88,13 @@ async def youtube_upload_controller(
             print("Warning: No refresh token found, may encounter token refresh issues")
             print("Consider reconnecting YouTube account to get refresh token")
         
+        # Token theo page lấy từ cache (refresh nền trước khi hết hạn), không cần validate lại
+        try:
+            access_token = await youtube_token_manager.get_access_token(page)
+        except Exception as e:
+            raise HTTPException(status_code=401, detail=f"YouTube credentials error: {str(e)}")
+        validate_credentials = False
+        
     else:
         # Fallback: sử dụng token từ params (để test)
         if isinstance(video_data, dict) and 'access_token' in video_data:
@@ -93,6 +102,7 @@ async def youtube_upload_controller(
             refresh_token = video_data.get('refresh_token')
             # Update video_data to actual URL
             video_data = video_data.get('url', video_data)
+            validate_credentials = True
         else:
             raise HTTPException(status_code=400, detail="Database not available and no access_token provided")
     
@@ -119,7 +129,8 @@ async def youtube_upload_controller(
             description=description,
             tags=tags_list,
             category_id=category_id,
-            privacy_status=privacy_status
+            privacy_status=privacy_status,
+            validate_credentials=validate_credentials
         )
         
         return result
@@ -141,16 +152,16 @@ async def download_video_from_url(video_url: str) -> str:
         str: Đường dẫn file tạm
     """
     try:
-        response = requests.get(video_url, stream=True)
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Không tải được video từ URL")
-        
-        # Lưu tạm vào file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp_file:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    tmp_file.write(chunk)
-            return tmp_file.name
+        async with http_client.stream("GET", video_url, timeout=settings.HTTP_UPLOAD_TIMEOUT_SECONDS) as response:
+            if response.status_code != 200:
+                raise HTTPException(status_code=400, detail="Không tải được video từ URL")
+            
+            # Lưu tạm vào file
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp_file:
+                async for chunk in response.aiter_bytes(chunk_size=65536):
+                    if chunk:
+                        tmp_file.write(chunk)
+                return tmp_file.name
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Download error: {str(e)}")
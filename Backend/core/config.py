@@ -35,6 +35,141 @@ class Settings:
     
     # Timezone
     TIMEZONE: str = "Asia/Ho_Chi_Minh"  # GMT+7
+    
+    # Scheduler - số post được đăng đồng thời tối đa cho từng platform
+    PUBLISH_CONCURRENCY: dict = {
+        "facebook": int(os.getenv("PUBLISH_CONCURRENCY_FACEBOOK", "5")),
+        "instagram": int(os.getenv("PUBLISH_CONCURRENCY_INSTAGRAM", "5")),
+        "threads": int(os.getenv("PUBLISH_CONCURRENCY_THREADS", "5")),
+        "tiktok": int(os.getenv("PUBLISH_CONCURRENCY_TIKTOK", "3")),
+        "youtube": int(os.getenv("PUBLISH_CONCURRENCY_YOUTUBE", "2")),
+    }
+    
+    # Scheduler lease - thời gian một instance giữ quyền đăng post đã claim
+    # (được gia hạn liên tục khi worker còn chạy; hết hạn -> instance khác claim lại)
+    SCHEDULER_LEASE_SECONDS: int = int(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))
+    
+    # Scheduler mode:
+    # - "interval": quét bảng posts mỗi phút (mặc định)
+    # - "event": ngủ đến scheduled_at gần nhất, nhận thay đổi lịch qua Postgres LISTEN/NOTIFY
+    SCHEDULER_MODE: str = os.getenv("SCHEDULER_MODE", "interval").lower()
+    SCHEDULER_NOTIFY_CHANNEL: str = "post_schedule_changed"
+    # Event mode: đồng bộ lại toàn bộ lịch định kỳ (phòng mất NOTIFY, thu hồi lease hết hạn)
+    SCHEDULER_RESYNC_MINUTES: int = int(os.getenv("SCHEDULER_RESYNC_MINUTES", "15"))
+    # Event mode: chu kỳ kiểm tra connection LISTEN (SELECT 1), mất kết nối -> LISTEN lại và resync ngay
+    SCHEDULER_LISTENER_CHECK_SECONDS: int = int(os.getenv("SCHEDULER_LISTENER_CHECK_SECONDS", "30"))
+    
+    # Retry đăng bài khi gặp lỗi tạm thời (exponential backoff + jitter)
+    PUBLISH_RETRY_MAX_ATTEMPTS: int = int(os.getenv("PUBLISH_RETRY_MAX_ATTEMPTS", "5"))
+    PUBLISH_RETRY_BASE_SECONDS: int = int(os.getenv("PUBLISH_RETRY_BASE_SECONDS", "60"))
+    PUBLISH_RETRY_MAX_SECONDS: int = int(os.getenv("PUBLISH_RETRY_MAX_SECONDS", "3600"))
+    
+    # HTTP client dùng chung (httpx) cho các platform service
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+    HTTP_UPLOAD_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_UPLOAD_TIMEOUT_SECONDS", "300"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_SECONDS: float = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+    
+    # Số ảnh upload song song khi đăng album Facebook
+    FACEBOOK_PHOTO_UPLOAD_CONCURRENCY: int = int(os.getenv("FACEBOOK_PHOTO_UPLOAD_CONCURRENCY", "4"))
+    
+    # Facebook video: dùng resumable upload (start/transfer/finish) cho bytes lớn hơn ngưỡng và file trên disk
+    FACEBOOK_VIDEO_RESUMABLE_THRESHOLD: int = int(os.getenv("FACEBOOK_VIDEO_RESUMABLE_THRESHOLD", str(20 * 1024 * 1024)))
+    FACEBOOK_CHUNK_MAX_RETRIES: int = int(os.getenv("FACEBOOK_CHUNK_MAX_RETRIES", "3"))
+    
+    # Cache ảnh frame/watermark của template đã decode: dung lượng tối đa, số biến thể resize mỗi asset,
+    # thời gian dùng lại asset HTTP trước khi revalidate (ETag / Last-Modified)
+    TEMPLATE_ASSET_CACHE_MAX_MB: int = int(os.getenv("TEMPLATE_ASSET_CACHE_MAX_MB", "256"))
+    TEMPLATE_ASSET_CACHE_MAX_VARIANTS: int = int(os.getenv("TEMPLATE_ASSET_CACHE_MAX_VARIANTS", "8"))
+    TEMPLATE_ASSET_REVALIDATE_SECONDS: float = float(os.getenv("TEMPLATE_ASSET_REVALIDATE_SECONDS", "300"))
+    
+    # Process pool xử lý ảnh template (frame/watermark): số process (0 = số core CPU)
+    IMAGE_PROCESSING_WORKERS: int = int(os.getenv("IMAGE_PROCESSING_WORKERS", "0"))
+    
+    # Xử lý video bằng ffmpeg: số job chạy đồng thời, số job tối đa chờ (0 = không giới hạn), timeout mỗi job,
+    # encoder preset mặc định (fast / balanced / quality) và số thread encoder (0 = ffmpeg tự chọn)
+    VIDEO_PROCESSING_CONCURRENCY: int = int(os.getenv("VIDEO_PROCESSING_CONCURRENCY", "1"))
+    VIDEO_PROCESSING_MAX_QUEUE: int = int(os.getenv("VIDEO_PROCESSING_MAX_QUEUE", "10"))
+    VIDEO_PROCESSING_TIMEOUT_SECONDS: float = float(os.getenv("VIDEO_PROCESSING_TIMEOUT_SECONDS", "1800"))
+    VIDEO_ENCODER_PRESET: str = os.getenv("VIDEO_ENCODER_PRESET", "balanced")
+    VIDEO_ENCODER_THREADS: int = int(os.getenv("VIDEO_ENCODER_THREADS", "0"))
+    
+    # Upload file khi tạo post: ghi ra disk theo chunk, dung lượng tối đa mỗi ảnh / mỗi video (MB)
+    POST_UPLOAD_CHUNK_SIZE: int = int(os.getenv("POST_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    POST_UPLOAD_MAX_IMAGE_MB: int = int(os.getenv("POST_UPLOAD_MAX_IMAGE_MB", "30"))
+    POST_UPLOAD_MAX_VIDEO_MB: int = int(os.getenv("POST_UPLOAD_MAX_VIDEO_MB", "1024"))
+    
+    # Carousel Instagram/Threads: số item container tạo song song và polling trạng thái container
+    CAROUSEL_ITEM_CONCURRENCY: int = int(os.getenv("CAROUSEL_ITEM_CONCURRENCY", "10"))
+    CONTAINER_POLL_INTERVAL_SECONDS: float = float(os.getenv("CONTAINER_POLL_INTERVAL_SECONDS", "1"))
+    CONTAINER_POLL_MAX_INTERVAL_SECONDS: float = float(os.getenv("CONTAINER_POLL_MAX_INTERVAL_SECONDS", "10"))
+    CONTAINER_POLL_TIMEOUT_SECONDS: float = float(os.getenv("CONTAINER_POLL_TIMEOUT_SECONDS", "300"))
+    
+    # Video container Instagram/Threads: container_poller poll nền với backoff tăng dần
+    VIDEO_CONTAINER_POLL_INITIAL_SECONDS: float = float(os.getenv("VIDEO_CONTAINER_POLL_INITIAL_SECONDS", "5"))
+    VIDEO_CONTAINER_POLL_MAX_SECONDS: float = float(os.getenv("VIDEO_CONTAINER_POLL_MAX_SECONDS", "60"))
+    VIDEO_CONTAINER_TIMEOUT_SECONDS: int = int(os.getenv("VIDEO_CONTAINER_TIMEOUT_SECONDS", "1800"))
+    
+    # TikTok FILE_UPLOAD: kích thước chunk (5MB-64MB) và số lần retry mỗi chunk
+    TIKTOK_UPLOAD_CHUNK_SIZE: int = int(os.getenv("TIKTOK_UPLOAD_CHUNK_SIZE", str(10 * 1024 * 1024)))
+    TIKTOK_CHUNK_MAX_RETRIES: int = int(os.getenv("TIKTOK_CHUNK_MAX_RETRIES", "3"))
+    
+    # TikTok status tracker: interval check publish status (tăng dần), timeout và số check đồng thời
+    TIKTOK_STATUS_POLL_INITIAL_SECONDS: float = float(os.getenv("TIKTOK_STATUS_POLL_INITIAL_SECONDS", "5"))
+    TIKTOK_STATUS_POLL_MAX_SECONDS: float = float(os.getenv("TIKTOK_STATUS_POLL_MAX_SECONDS", "60"))
+    TIKTOK_STATUS_TIMEOUT_SECONDS: int = int(os.getenv("TIKTOK_STATUS_TIMEOUT_SECONDS", "1800"))
+    TIKTOK_STATUS_CHECK_CONCURRENCY: int = int(os.getenv("TIKTOK_STATUS_CHECK_CONCURRENCY", "5"))
+    
+    # YouTube resumable upload: chunk size ban đầu, giới hạn (bội số 256KB) và thời gian mục tiêu mỗi chunk
+    YOUTUBE_UPLOAD_CHUNK_SIZE: int = int(os.getenv("YOUTUBE_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    YOUTUBE_UPLOAD_MIN_CHUNK_SIZE: int = int(os.getenv("YOUTUBE_UPLOAD_MIN_CHUNK_SIZE", str(1024 * 1024)))
+    YOUTUBE_UPLOAD_MAX_CHUNK_SIZE: int = int(os.getenv("YOUTUBE_UPLOAD_MAX_CHUNK_SIZE", str(128 * 1024 * 1024)))
+    YOUTUBE_UPLOAD_CHUNK_TARGET_SECONDS: float = float(os.getenv("YOUTUBE_UPLOAD_CHUNK_TARGET_SECONDS", "10"))
+    
+    # YouTube upload executor: số upload chạy đồng thời và số job tối đa chờ trong hàng đợi (0 = không giới hạn)
+    YOUTUBE_UPLOAD_WORKERS: int = int(os.getenv("YOUTUBE_UPLOAD_WORKERS", "2"))
+    YOUTUBE_UPLOAD_MAX_QUEUE: int = int(os.getenv("YOUTUBE_UPLOAD_MAX_QUEUE", "50"))
+    
+    # YouTube token trong cache: khoảng an toàn trước khi hết hạn (ít hơn thì refresh trước khi dùng)
+    YOUTUBE_TOKEN_EXPIRY_MARGIN_SECONDS: int = int(os.getenv("YOUTUBE_TOKEN_EXPIRY_MARGIN_SECONDS", "60"))
+    
+    # Token sweeper: chu kỳ quét, refresh token hết hạn trong khoảng này và số refresh song song mỗi platform
+    TOKEN_SWEEP_INTERVAL_SECONDS: int = int(os.getenv("TOKEN_SWEEP_INTERVAL_SECONDS", "120"))
+    TOKEN_REFRESH_AHEAD_SECONDS: int = int(os.getenv("TOKEN_REFRESH_AHEAD_SECONDS", "600"))
+    TOKEN_REFRESH_CONCURRENCY: int = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "5"))
+    
+    # TikTok OAuth app (đổi code / refresh token), bắt buộc đặt qua biến môi trường
+    TIKTOK_CLIENT_KEY: Optional[str] = os.getenv("TIKTOK_CLIENT_KEY")
+    TIKTOK_CLIENT_SECRET: Optional[str] = os.getenv("TIKTOK_CLIENT_SECRET")
+    
+    # Permalink Instagram/Threads: chu kỳ gửi batch, số lần thử và số GET Threads song song
+    PERMALINK_BATCH_INTERVAL_SECONDS: float = float(os.getenv("PERMALINK_BATCH_INTERVAL_SECONDS", "5"))
+    PERMALINK_MAX_ATTEMPTS: int = int(os.getenv("PERMALINK_MAX_ATTEMPTS", "3"))
+    PERMALINK_THREADS_CONCURRENCY: int = int(os.getenv("PERMALINK_THREADS_CONCURRENCY", "5"))
+    
+    # Rate limiter: số request/giây của mỗi app và mỗi page/account (token bucket)
+    RATE_LIMIT_META_APP_PER_SECOND: float = float(os.getenv("RATE_LIMIT_META_APP_PER_SECOND", "20"))
+    RATE_LIMIT_THREADS_APP_PER_SECOND: float = float(os.getenv("RATE_LIMIT_THREADS_APP_PER_SECOND", "10"))
+    RATE_LIMIT_PAGE_PER_SECOND: float = float(os.getenv("RATE_LIMIT_PAGE_PER_SECOND", "2"))
+    RATE_LIMIT_TIKTOK_PER_SECOND: float = float(os.getenv("RATE_LIMIT_TIKTOK_PER_SECOND", "5"))
+    RATE_LIMIT_YOUTUBE_PER_SECOND: float = float(os.getenv("RATE_LIMIT_YOUTUBE_PER_SECOND", "5"))
+    RATE_LIMIT_BURST_SECONDS: float = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "2"))
+    # Usage (%) bắt đầu giảm tốc, thời gian chặn khi bị throttle và thời gian chờ tối đa của một request
+    RATE_LIMIT_USAGE_SOFT: float = float(os.getenv("RATE_LIMIT_USAGE_SOFT", "60"))
+    RATE_LIMIT_BLOCK_SECONDS: float = float(os.getenv("RATE_LIMIT_BLOCK_SECONDS", "60"))
+    RATE_LIMIT_MAX_BLOCK_SECONDS: float = float(os.getenv("RATE_LIMIT_MAX_BLOCK_SECONDS", "900"))
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "120"))
+    RATE_LIMIT_YOUTUBE_QUOTA_BLOCK_SECONDS: float = float(os.getenv("RATE_LIMIT_YOUTUBE_QUOTA_BLOCK_SECONDS", "3600"))
+    
+    # Circuit breaker theo platform/loại media: số lỗi tạm thời liên tiếp để ngắt, thời gian ngắt và probe
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_OPEN_SECONDS: float = float(os.getenv("CIRCUIT_OPEN_SECONDS", "60"))
+    CIRCUIT_OPEN_MAX_SECONDS: float = float(os.getenv("CIRCUIT_OPEN_MAX_SECONDS", "900"))
+    CIRCUIT_HALF_OPEN_RETRY_SECONDS: float = float(os.getenv("CIRCUIT_HALF_OPEN_RETRY_SECONDS", "30"))
+    CIRCUIT_PROBE_TIMEOUT_SECONDS: float = float(os.getenv("CIRCUIT_PROBE_TIMEOUT_SECONDS", "900"))
 
 
 settings = Settings()
@@ -8,7 +8,7 @@ from fastapi.responses import PlainTextResponse
 
 # Import models to register them with Base
 from models.model import Base
-from config.database import engine
+from config.database import engine, upgrade_schema
 
 
 # Import routers
@@ -84,6 +84,7 @@ async def startup_event():
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await upgrade_schema(conn)
         print("✅ Database tables initialized successfully!")
         
         # Start scheduler for scheduled posts
@@ -91,6 +92,22 @@ async def startup_event():
         await start_scheduler()
         print("✅ Scheduler started successfully!")
         
+        # Poll media container video (Instagram/Threads) đang chờ xử lý
+        from services.container_poller import container_poller
+        await container_poller.start()
+        
+        # Theo dõi video TikTok đang xử lý (PROCESSING -> PUBLISH_COMPLETE / FAILED)
+        from services.tiktok_status_tracker import tiktok_status_tracker
+        await tiktok_status_tracker.start()
+        
+        # Lấy permalink Instagram/Threads theo batch sau khi đăng
+        from services.permalink_service import permalink_resolver
+        permalink_resolver.start()
+        
+        # Refresh token sắp hết hạn của các page (YouTube, TikTok, Threads)
+        from services.token_sweeper import token_sweeper
+        token_sweeper.start()
+        
     except Exception as e:
         print(f"⚠️ Warning: Could not initialize database or scheduler: {e}")
 
@@ -102,6 +119,34 @@ async def shutdown_event():
     from services.scheduler_service import stop_scheduler
     await stop_scheduler()
     
+    from services.container_poller import container_poller
+    await container_poller.shutdown()
+    
+    from services.tiktok_status_tracker import tiktok_status_tracker
+    await tiktok_status_tracker.shutdown()
+    
+    # Dừng hàng đợi upload YouTube (job đang chạy dừng sau chunk hiện tại)
+    from services.upload_executor import youtube_upload_executor
+    youtube_upload_executor.shutdown()
+    
+    # Kill các job ffmpeg đang chạy
+    from services.video_processing_service import video_processing_service
+    await video_processing_service.shutdown()
+    
+    # Dừng process pool xử lý ảnh
+    from services.image_process_pool import image_process_pool
+    image_process_pool.shutdown()
+    
+    from services.permalink_service import permalink_resolver
+    await permalink_resolver.shutdown()
+    
+    from services.token_sweeper import token_sweeper
+    await token_sweeper.shutdown()
+    
+    # Đóng HTTP client dùng chung
+    from services.http_client import http_client
+    await http_client.close()
+    
     await engine.dispose()
     print("👋 Application shutdown complete")
 
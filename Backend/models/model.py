@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Column, Integer, String, Text, Boolean, DateTime, Float,
-    ForeignKey, BigInteger, Enum as SQLEnum, UniqueConstraint, JSON
+    ForeignKey, BigInteger, Enum as SQLEnum, UniqueConstraint, Index, JSON
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -114,6 +114,7 @@ class Page(Base, TimestampMixin):
     __tablename__ = "pages"
     __table_args__ = (
         UniqueConstraint('platform_id', 'page_id', name='uq_platform_page'),
+        Index('ix_pages_token_expires_at', 'token_expires_at'),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -125,6 +126,8 @@ class Page(Base, TimestampMixin):
     access_token = Column(Text, nullable=True)
     refresh_token = Column(Text, nullable=True)
     token_expires_at = Column(DateTime, nullable=True)
+    # Facebook Page: Instagram Business Account liên kết (lưu lúc connect, dùng khi đăng Instagram)
+    instagram_account_id = Column(String(100), nullable=True)
     status = Column(SQLEnum(PageStatus), default=PageStatus.connected, nullable=False)
     follower_count = Column(Integer, default=0, nullable=False)
     created_by = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -278,6 +281,9 @@ class Hashtag(Base):
 
 class Post(Base, TimestampMixin):
     __tablename__ = "posts"
+    __table_args__ = (
+        Index('ix_posts_status_scheduled_at', 'status', 'scheduled_at'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -294,6 +300,9 @@ class Post(Base, TimestampMixin):
     error_message = Column(Text, nullable=True)
     retry_count = Column(Integer, default=0, nullable=False)
     post_metadata = Column('metadata', JSON, nullable=True)
+    # Scheduler lease: instance nào đang đăng post và lease hết hạn lúc nào
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
 
     # Relationships
     user = relationship("User", back_populates="posts")
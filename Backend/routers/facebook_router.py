@@ -5,7 +5,6 @@ from config.database import get_db
 from controllers import facebook_page_controller
 from core.auth import get_current_user
 from models.model import User
-import requests
 from fastapi.responses import RedirectResponse
 from dotenv import load_dotenv
 import os
@@ -1,7 +1,20 @@
-from fastapi import APIRouter, Depends, Query, Body, UploadFile, File, Form
+from fastapi import APIRouter, Depends, Query, Body, UploadFile, File, Form, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
+from core.config import settings
 from controllers.post_controller import PostController
+from services.storage_service import storage_service, UploadTooLargeError
+from services.scheduler_service import scheduler_service
+from services.container_poller import container_poller
+from services.tiktok_status_tracker import tiktok_status_tracker
+from services.upload_executor import youtube_upload_executor
+from services.permalink_service import permalink_resolver
+from services.rate_limiter import rate_limiter
+from services.circuit_breaker import circuit_breakers
+from services.youtube_token_manager import youtube_token_manager
+from services.token_sweeper import token_sweeper
+from services.image_process_pool import image_process_pool
+from services.video_processing_service import video_processing_service
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
@@ -120,6 +133,7 @@ async def create_post(
     image_frame_template_id: Optional[int] = Form(None),  # ID của frame cho ảnh
     video_frame_template_id: Optional[int] = Form(None),  # ID của frame cho video
     watermark_template_id: Optional[int] = Form(None),  # ID của watermark
+    video_preset: Optional[str] = Form(None),  # Encoder preset khi ghép frame video (fast / balanced / quality)
     files: List[UploadFile] = File(None),
     db: AsyncSession = Depends(get_db)
 ):
@@ -139,18 +153,25 @@ async def create_post(
     print(f"  - video_frame_template_id: {video_frame_template_id}")
     print(f"  - watermark_template_id: {watermark_template_id}")
     
-    # Đọc file data từ uploads hoặc sử dụng video URL
+    # Lấy file từ uploads hoặc sử dụng video URL
     media_files = []
     media_url_list = []
+    uploaded_paths = []
     
     if video_url:
         # Nếu có video_url từ thư viện, dùng URL thay vì file
         media_files = [video_url]  # Facebook API hỗ trợ URL
     elif files:
-        # Nếu có files upload, đọc file data
-        for file in files:
-            file_data = await file.read()
-            media_files.append(file_data)
+        # Ghi từng file upload ra disk theo chunk (không đọc cả file vào RAM), pipeline dùng Path
+        max_mb = settings.POST_UPLOAD_MAX_VIDEO_MB if media_type == 'video' else settings.POST_UPLOAD_MAX_IMAGE_MB
+        try:
+            for file in files:
+                uploaded_paths.append(await storage_service.save_upload(file, max_bytes=max_mb * 1024 * 1024))
+        except UploadTooLargeError as e:
+            for path in uploaded_paths:
+                path.unlink(missing_ok=True)
+            raise HTTPException(status_code=413, detail=str(e))
+        media_files = list(uploaded_paths)
     
     # Nhận media_urls cho Instagram
     if media_urls:
@@ -165,13 +186,14 @@ async def create_post(
         "post_type": post_type,
         "status": status,
         "media_type": media_type,
-        "media_files": media_files,  # Truyền file data (cho FB, TikTok, YouTube)
+        "media_files": media_files,  # Truyền Path tới file đã upload (cho FB, TikTok, YouTube)
         "media_urls": media_url_list,  # Truyền URLs (cho Instagram)
         "template_id": template_id,
         "title": title,
         "image_frame_template_id": image_frame_template_id,
         "video_frame_template_id": video_frame_template_id,
         "watermark_template_id": watermark_template_id,
+        "video_preset": video_preset,
     }
     
     # Parse scheduled_at từ Frontend (GMT+7) → UTC để lưu DB
@@ -180,7 +202,12 @@ async def create_post(
         print(f"⏰ Scheduled time (GMT+7 input): {scheduled_at}")
         print(f"⏰ Scheduled time (UTC stored): {post_data['scheduled_at']}")
     
-    return await controller.create(post_data)
+    try:
+        return await controller.create(post_data)
+    finally:
+        # Post scheduled / retry đã copy media vào storage, file upload tạm không cần nữa
+        for path in uploaded_paths:
+            path.unlink(missing_ok=True)
 
 
 @router.put("/{post_id}")
@@ -241,7 +268,6 @@ async def get_upcoming_scheduled_posts(
     limit: int = Query(10, ge=1, le=100),
 ):
     """Get upcoming scheduled posts"""
-    from services.scheduler_service import scheduler_service
     posts = await scheduler_service.get_upcoming_scheduled_posts(limit)
     return {
         "success": True,
@@ -250,18 +276,39 @@ async def get_upcoming_scheduled_posts(
     }
 
 
+@router.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Get scheduler worker pool and retry queue stats"""
+    stats = scheduler_service.get_worker_stats()
+    stats["retry_queue"] = await scheduler_service.get_retry_queue_stats()
+    stats["containers"] = container_poller.get_stats()
+    stats["tiktok_status"] = tiktok_status_tracker.get_stats()
+    stats["youtube_uploads"] = youtube_upload_executor.get_stats()
+    stats["permalinks"] = permalink_resolver.get_stats()
+    stats["rate_limits"] = rate_limiter.get_stats()
+    stats["circuits"] = circuit_breakers.get_stats()
+    stats["youtube_tokens"] = youtube_token_manager.get_stats()
+    stats["tokens"] = token_sweeper.get_stats()
+    stats["image_processing"] = image_process_pool.get_stats()
+    stats["video_processing"] = video_processing_service.get_stats()
+    return {
+        "success": True,
+        "message": "Scheduler stats retrieved successfully",
+        "data": stats
+    }
+
+
 @router.post("/{post_id}/trigger-now")
 async def trigger_scheduled_post_now(
     post_id: int,
 ):
     """Trigger a scheduled post to publish immediately (bypass scheduled_at)"""
-    from services.scheduler_service import scheduler_service
     success = await scheduler_service.trigger_scheduled_post_now(post_id)
     
     if success:
         return {
             "success": True,
-            "message": f"Post {post_id} triggered successfully"
+            "message": f"Post {post_id} dispatched for publishing"
         }
     else:
         return {
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-import requests
 import os
 from urllib.parse import urlencode
 from config.database import get_db
 from services.page_service import PageService
+from services.http_client import http_client
+from services.tiktok_service import get_client_credentials
+from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/tiktok", tags=["TikTok"])
 
@@ -13,17 +15,15 @@ router = APIRouter(prefix="/tiktok", tags=["TikTok"])
 # CLIENT_SECRET = os.getenv("TIKTOK_CLIENT_SECRET")
 # REDIRECT_URI = os.getenv("TIKTOK_REDIRECT_URI")
 
-CLIENT_KEY = "sbaw7q53fi2sp7s8lx"
-CLIENT_SECRET = "iXXyqL5mJt1jBUiM2ouFGowv4w6D2ohq"
-
 REDIRECT_URI = "https://8a7c47cd4eed.ngrok-free.app/tiktok/callback"
 
 # 1️⃣ Route: Bắt đầu đăng nhập TikTok
 @router.get("/login")
 def login_tiktok():
+    client_key, _ = get_client_credentials()
     base_url = "https://www.tiktok.com/v2/auth/authorize/"
     params = {
-        "client_key": CLIENT_KEY,
+        "client_key": client_key,
         "response_type": "code",
         "scope": "user.info.basic,video.upload,video.publish",
         "redirect_uri": REDIRECT_URI,
@@ -43,18 +43,19 @@ async def tiktok_callback(
     if not code:
         return {"error": "Missing authorization code"}
 
+    client_key, client_secret = get_client_credentials()
     token_url = "https://open.tiktokapis.com/v2/oauth/token/"
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     data = {
-        "client_key": CLIENT_KEY,
-        "client_secret": CLIENT_SECRET,
+        "client_key": client_key,
+        "client_secret": client_secret,
         "code": code,
         "grant_type": "authorization_code",
         "redirect_uri": REDIRECT_URI,
     }
 
     # 3️⃣ Đổi code lấy access_token
-    response = requests.post(token_url, data=data, headers=headers)
+    response = await http_client.post(token_url, data=data, headers=headers)
     token_info = response.json()
     
     print("🎯 TikTok Token Response:", token_info)
@@ -78,7 +79,7 @@ async def tiktok_callback(
         try:
             user_url = "https://open.tiktokapis.com/v2/user/info/?fields=open_id,union_id,avatar_url,display_name"
             user_headers = {"Authorization": f"Bearer {access_token}"}
-            user_res = requests.get(user_url, headers=user_headers)
+            user_res = await http_client.get(user_url, headers=user_headers)
             user_data = user_res.json()
             if user_data.get("data") and user_data["data"].get("user"):
                 user_info = user_data["data"]["user"]
@@ -99,12 +100,17 @@ async def tiktok_callback(
             else:
                 avatar_url = raw_url
         
+        # Access token TikTok sống 24h -> lưu refresh token + hạn để token_sweeper refresh trước khi hết hạn
+        token_expires_at = datetime.utcnow() + timedelta(seconds=int(expires_in))
+        
         # Tạo page data
         page_data = {
             "page_name": user_info.get("display_name", f"TikTok User {open_id[:8]}") if user_info else f"TikTok User {open_id[:8]}",
             "platform_id": 15,  # TikTok platform ID
             "page_id": open_id,
             "access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_expires_at": token_expires_at,
             "avatar_url": avatar_url,
             "status": "connected",
             "created_by": 13  # TODO: Get from auth context
@@ -124,6 +130,8 @@ async def tiktok_callback(
                 # Update existing page - Chỉ update token và status
                 update_data = {
                     "access_token": access_token,
+                    "refresh_token": refresh_token,
+                    "token_expires_at": token_expires_at,
                     "status": "connected"
                 }
                 # Update name và avatar nếu có user_info mới
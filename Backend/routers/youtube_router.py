@@ -1,4 +1,5 @@
 import os
+import asyncio
 import tempfile
 from dotenv import load_dotenv
 from fastapi.responses import RedirectResponse
@@ -7,7 +8,6 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from config.database import get_db
 from core.auth import get_current_user
 from models.model import User
-import requests
 from services.youtube_service import YouTubeService
 from pydantic import BaseModel
 from typing import List, Optional
@@ -70,16 +70,16 @@ async def youtube_callback(
             }
         
         # Đổi code lấy token
-        token_info = youtube_service.exchange_code_for_token(code)
+        token_info = await youtube_service.exchange_code_for_token(code)
         access_token = token_info.get("access_token")
         refresh_token = token_info.get("refresh_token")
         expires_in = token_info.get("expires_in", 3600)
         
         # Lấy thông tin user
-        user_info = youtube_service.get_user_info(access_token)
+        user_info = await youtube_service.get_user_info(access_token)
         
         # Lấy thông tin YouTube channels
-        youtube_channels = youtube_service.get_youtube_channels(access_token, refresh_token)
+        youtube_channels = await asyncio.to_thread(youtube_service.get_youtube_channels, access_token, refresh_token)
         
         # Chuẩn bị dữ liệu page với refresh token
         page_data = youtube_service.prepare_page_data(
@@ -97,31 +97,17 @@ async def youtube_callback(
             from services.page_service import PageService
             page_service = PageService(db)
             
-            # Kiểm tra xem page đã tồn tại chưa (tránh duplicate)
-            existing_pages = await page_service.get_by_platform(platform_id=3)
-            channel_id = page_data.get('page_id')
-            
-            existing_page = None
-            for page in existing_pages:
-                if page['page_id'] == channel_id:
-                    existing_page = page
-                    break
-            
-            if existing_page:
-                print(f"Page already exists with ID {existing_page['id']}, updating tokens...")
-                # Update existing page với tokens mới
-                updated_page = await page_service.update_tokens(
-                    page_id=existing_page['id'],
-                    access_token=page_data['access_token'],
-                    refresh_token=page_data['refresh_token'],
-                    expires_at=page_data.get('token_expires_at')
-                )
-                print("Page updated successfully:", updated_page)
-                created_page = updated_page
-            else:
-                print("Creating new page with data:", page_data)
-                created_page = await page_service.create(page_data)
-                print("Page created successfully:", created_page)
+            # Upsert theo (platform_id, page_id): channel đã tồn tại chỉ cập nhật token
+            # (refresh_token cũ được giữ nếu Google không trả refresh_token mới)
+            pages = await page_service.bulk_upsert(
+                [page_data],
+                update_fields=[
+                    "access_token", "refresh_token", "token_expires_at",
+                    "page_name", "avatar_url", "status", "follower_count"
+                ]
+            )
+            created_page = pages[0] if pages else None
+            print("Page saved successfully:", created_page)
             
         except Exception as e:
             print(f"Error creating/updating page: {e}")
@@ -361,7 +347,7 @@ async def upload_video_manual(
 @router.get("/test")
     
 @router.post("/refresh-token")
-def refresh_youtube_token(payload: dict = Body(...)):
+async def refresh_youtube_token(payload: dict = Body(...)):
     """
     Refresh YouTube access token using refresh token
     """
@@ -372,7 +358,7 @@ def refresh_youtube_token(payload: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Thiếu refresh_token")
         
         # Gọi service để refresh token
-        token_info = youtube_service.refresh_access_token(refresh_token)
+        token_info = await youtube_service.refresh_access_token(refresh_token)
         
         return {
             "success": True,
@@ -390,7 +376,7 @@ def refresh_youtube_token(payload: dict = Body(...)):
         raise HTTPException(status_code=500, detail=f"Refresh token error: {str(e)}")
 
 @router.post("/validate-token")
-def validate_youtube_token(payload: dict = Body(...)):
+async def validate_youtube_token(payload: dict = Body(...)):
     """
     Validate YouTube access token and return token info
     """
@@ -401,7 +387,7 @@ def validate_youtube_token(payload: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Thiếu access_token")
         
         # Gọi service để validate token
-        token_info = youtube_service.validate_access_token(access_token)
+        token_info = await youtube_service.validate_access_token(access_token)
         
         return {
             "success": True,
@@ -415,7 +401,7 @@ def validate_youtube_token(payload: dict = Body(...)):
         raise HTTPException(status_code=500, detail=f"Token validation error: {str(e)}")
 
 @router.post("/revoke-token")
-def revoke_youtube_token(payload: dict = Body(...)):
+async def revoke_youtube_token(payload: dict = Body(...)):
     """
     Revoke YouTube access token
     """
@@ -426,7 +412,7 @@ def revoke_youtube_token(payload: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Thiếu access_token")
         
         # Gọi service để revoke token
-        result = youtube_service.revoke_access_token(access_token)
+        result = await youtube_service.revoke_access_token(access_token)
         
         return {
             "success": True,
@@ -440,7 +426,7 @@ def revoke_youtube_token(payload: dict = Body(...)):
         raise HTTPException(status_code=500, detail=f"Token revocation error: {str(e)}")
 
 @router.post("/token-expiry")
-def check_token_expiry(payload: dict = Body(...)):
+async def check_token_expiry(payload: dict = Body(...)):
     """
     Check YouTube access token expiry information
     """
@@ -451,7 +437,7 @@ def check_token_expiry(payload: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Thiếu access_token")
         
         # Gọi service để check token expiry
-        expiry_info = youtube_service.get_token_expiry_info(access_token)
+        expiry_info = await youtube_service.get_token_expiry_info(access_token)
         
         return {
             "success": True,
@@ -465,7 +451,7 @@ def check_token_expiry(payload: dict = Body(...)):
         raise HTTPException(status_code=500, detail=f"Token expiry check error: {str(e)}")
 
 @router.post("/auto-refresh")
-def auto_refresh_token(payload: dict = Body(...)):
+async def auto_refresh_token(payload: dict = Body(...)):
     """
     Automatically refresh token if needed
     """
@@ -478,7 +464,7 @@ def auto_refresh_token(payload: dict = Body(...)):
             raise HTTPException(status_code=400, detail="Thiếu access_token hoặc refresh_token")
         
         # Gọi service để auto refresh
-        result = youtube_service.auto_refresh_token_if_needed(
+        result = await youtube_service.auto_refresh_token_if_needed(
             access_token, 
             refresh_token, 
             threshold_minutes
@@ -495,6 +481,32 @@ def auto_refresh_token(payload: dict = Body(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Auto refresh error: {str(e)}")
 
+@router.get("/uploads/queue")
+async def get_upload_queue(current_user: User = Depends(get_current_user)):
+    """
+    Trạng thái hàng đợi upload YouTube (slot, độ sâu hàng đợi, thời gian chờ)
+    """
+    from services.upload_executor import youtube_upload_executor
+    return {
+        "success": True,
+        "message": "Upload queue retrieved successfully",
+        "data": youtube_upload_executor.get_stats()
+    }
+
+@router.delete("/uploads/{job_id}")
+async def cancel_upload(job_id: str, current_user: User = Depends(get_current_user)):
+    """
+    Cancel upload YouTube đang chờ hoặc đang chạy (job_id của post: post-{post_id})
+    Upload đang chạy dừng sau chunk hiện tại
+    """
+    from services.upload_executor import youtube_upload_executor
+    if not youtube_upload_executor.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"Upload job {job_id} not found")
+    return {
+        "success": True,
+        "message": f"Upload {job_id} cancellation requested"
+    }
+
 @router.get("/test")
 def test_youtube_router():
     """Test endpoint để kiểm tra YouTube router"""
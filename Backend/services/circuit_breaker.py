@@ -0,0 +1,121 @@
+"""
+Circuit Breaker - Ngắt tạm thời việc đăng bài lên platform/endpoint đang gặp sự cố
+
+- Mỗi cặp (platform, endpoint) có một breaker; endpoint là loại media (text, image, video, ...)
+- closed: đăng bình thường; CIRCUIT_FAILURE_THRESHOLD lỗi tạm thời liên tiếp -> open
+- open: không gọi API, post được hoãn về 'scheduled'; hết thời gian open -> half_open
+- half_open: chỉ cho một post thử (probe); thành công -> closed, lỗi -> open lại với thời gian gấp đôi
+- Chỉ lỗi tạm thời (retry_service.is_retryable) mới tính; lỗi dữ liệu/token không làm ngắt platform
+"""
+
+import sys
+sys.path.append('..')
+
+import logging
+import time
+from typing import Dict, Tuple
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Breaker cho một (platform, endpoint)"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.state = CLOSED
+        self.failures = 0
+        self.open_seconds = settings.CIRCUIT_OPEN_SECONDS
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.trips = 0
+
+    def allow(self) -> Tuple[bool, float]:
+        """
+        Có được gọi API không
+
+        Returns:
+            (allowed, retry_after): retry_after là số giây nên hoãn post nếu không được gọi
+        """
+        now = time.monotonic()
+        if self.state == CLOSED:
+            return True, 0.0
+
+        if self.state == OPEN:
+            remaining = self.opened_at + self.open_seconds - now
+            if remaining > 0:
+                return False, remaining
+            self.state = HALF_OPEN
+            self.probe_started_at = None
+            logger.info(f"🟡 Circuit {self.key} half-open, sending probe")
+
+        # HALF_OPEN: một probe tại một thời điểm (probe treo quá lâu thì cho probe mới)
+        if self.probe_started_at is None or now - self.probe_started_at > settings.CIRCUIT_PROBE_TIMEOUT_SECONDS:
+            self.probe_started_at = now
+            return True, 0.0
+        return False, settings.CIRCUIT_HALF_OPEN_RETRY_SECONDS
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"🟢 Circuit {self.key} closed")
+        self.state = CLOSED
+        self.failures = 0
+        self.open_seconds = settings.CIRCUIT_OPEN_SECONDS
+        self.probe_started_at = None
+
+    def record_failure(self):
+        if self.state == HALF_OPEN:
+            # Probe lỗi -> open lại, thời gian open tăng gấp đôi
+            self.open_seconds = min(self.open_seconds * 2, settings.CIRCUIT_OPEN_MAX_SECONDS)
+            self._trip()
+            return
+
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= settings.CIRCUIT_FAILURE_THRESHOLD:
+            self._trip()
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probe_started_at = None
+        self.trips += 1
+        logger.warning(f"🔴 Circuit {self.key} open for {self.open_seconds:.0f}s ({self.failures} consecutive failures)")
+
+    def get_stats(self) -> dict:
+        stats = {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips
+        }
+        if self.state == OPEN:
+            stats["retry_after"] = round(max(0.0, self.opened_at + self.open_seconds - time.monotonic()), 1)
+        return stats
+
+
+class CircuitBreakerRegistry:
+    """Các breaker theo (platform, endpoint)"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, platform: str, endpoint: str) -> CircuitBreaker:
+        key = f"{(platform or '').lower()}:{endpoint}"
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(key)
+            self._breakers[key] = breaker
+        return breaker
+
+    def get_stats(self) -> dict:
+        return {key: breaker.get_stats() for key, breaker in sorted(self._breakers.items())}
+
+
+# Global instance
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,390 @@
+"""
+Container Poller - Theo dõi media container video của Instagram/Threads
+
+Video container cần thời gian xử lý (IN_PROGRESS) trước khi publish được.
+Thay vì chờ trong worker đăng bài, post được giữ ở 'publishing' và poller:
+- Poll trạng thái container với backoff tăng dần (không busy-wait, không giữ DB session khi chờ)
+- Publish khi container FINISHED rồi cập nhật post (published / retry / failed)
+- Giữ lease trên post; instance khởi động sau tiếp quản container của instance đã chết
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import heapq
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update
+
+from config.database import async_session_maker
+from core.config import settings
+from models.model import Post, Page, PostStatus
+from services import instagram_service, threads_service
+from services import retry_service
+from services.permalink_service import permalink_resolver
+from services.post_service import PostService
+from utils.timezone_utils import now_utc
+
+logger = logging.getLogger(__name__)
+
+
+CONTAINER_SERVICES = {
+    "instagram": instagram_service,
+    "threads": threads_service,
+}
+
+
+@dataclass
+class PendingContainer:
+    """Một container đang chờ xử lý"""
+    post_id: int
+    platform: str
+    account_id: str
+    access_token: str
+    container_id: str
+    created_at: datetime
+    media_urls: List[str] = field(default_factory=list)
+    interval: float = 0.0
+    due_at: float = 0.0  # loop.time() của lần check kế tiếp; entry khác trong heap là stale
+
+
+class ContainerPoller:
+    """Background poller cho media container (một task cho toàn bộ container đang chờ)"""
+
+    def __init__(self):
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_duration = timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        self._pending: Dict[int, PendingContainer] = {}
+        # Heap (thời điểm check tiếp theo theo loop.time(), post_id)
+        self._heap: List[tuple] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Tiếp quản container đang chờ và chạy poll loop"""
+        if self._task and not self._task.done():
+            return
+        await self._adopt_orphans()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🎞️ Container poller started ({len(self._pending)} pending)")
+
+    async def shutdown(self):
+        """Dừng poll loop và trả lease để instance khác tiếp quản ngay"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._pending:
+            try:
+                async with async_session_maker() as session:
+                    await session.execute(
+                        update(Post)
+                        .where(Post.id.in_(list(self._pending)))
+                        .where(Post.lease_owner == self.instance_id)
+                        .values(lease_owner=None, lease_expires_at=None)
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not release container leases: {str(e)}")
+        self._pending.clear()
+        self._heap.clear()
+
+    def lease_expiry(self) -> datetime:
+        return now_utc() + self.lease_duration
+
+    def register(
+        self,
+        post_id: int,
+        platform: str,
+        account_id: str,
+        access_token: str,
+        container_id: str,
+        media_urls: Optional[List[str]] = None,
+        created_at: Optional[datetime] = None
+    ):
+        """
+        Theo dõi container của post (post đã được set 'publishing' + lease của poller)
+        Post đang được theo dõi thì bỏ qua (VD: tự adopt lại post của mình khi renew lease lỗi),
+        tránh 2 entry trong heap cùng check / publish một container
+        """
+        if post_id in self._pending:
+            return
+        entry = PendingContainer(
+            post_id=post_id,
+            platform=platform,
+            account_id=account_id,
+            access_token=access_token,
+            container_id=container_id,
+            created_at=created_at or now_utc(),
+            media_urls=media_urls or [],
+            interval=settings.VIDEO_CONTAINER_POLL_INITIAL_SECONDS
+        )
+        self._pending[post_id] = entry
+        self._schedule(entry, entry.interval)
+        logger.info(f"🎞️ Tracking {platform} container {container_id} for post {post_id}")
+
+    def get_stats(self) -> dict:
+        return {
+            "instance_id": self.instance_id,
+            "pending": len(self._pending),
+            "by_platform": {
+                platform: sum(1 for e in self._pending.values() if e.platform == platform)
+                for platform in CONTAINER_SERVICES
+            }
+        }
+
+    def _schedule(self, entry: PendingContainer, delay: float):
+        loop = asyncio.get_running_loop()
+        entry.due_at = loop.time() + delay
+        heapq.heappush(self._heap, (entry.due_at, entry.post_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        heartbeat_every = self.lease_duration.total_seconds() / 3
+        next_heartbeat = loop.time() + heartbeat_every
+
+        while True:
+            try:
+                self._wakeup.clear()
+                now = loop.time()
+
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due_at, post_id = heapq.heappop(self._heap)
+                    entry = self._pending.get(post_id)
+                    if entry and entry.due_at == due_at:
+                        due.append(entry)
+                if due:
+                    await asyncio.gather(*[self._check(entry) for entry in due])
+
+                if loop.time() >= next_heartbeat:
+                    await self._renew_leases()
+                    await self._adopt_orphans()
+                    next_heartbeat = loop.time() + heartbeat_every
+
+                timeout = next_heartbeat - loop.time()
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - loop.time())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Container poller error: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _check(self, entry: PendingContainer):
+        service = CONTAINER_SERVICES[entry.platform]
+        try:
+            status = await service.get_container_status(entry.container_id, entry.access_token)
+        except Exception as e:
+            if retry_service.is_retryable(entry.platform, error=e):
+                self._backoff(entry)
+            else:
+                await self._finish_failed(entry, f"{entry.platform} container status exception: {str(e)}", error=e)
+            return
+
+        if not status.get("success"):
+            if retry_service.is_retryable(entry.platform, result=status):
+                self._backoff(entry)
+            else:
+                error_msg = (status.get("error") or {}).get("error", {}).get("message", "Unknown error")
+                await self._finish_failed(entry, f"{entry.platform} container status error: {error_msg}", result=status)
+            return
+
+        status_code = status.get("status_code")
+
+        if status_code == "FINISHED":
+            await self._publish(entry)
+        elif status_code == "PUBLISHED":
+            # Đã publish trước khi instance cũ kịp cập nhật DB
+            await self._finish_published(entry, {"container_id": entry.container_id})
+        elif status_code in ("ERROR", "EXPIRED"):
+            await self._finish_failed(
+                entry,
+                f"{entry.platform} container {status_code}: {status.get('status') or ''}".strip()
+            )
+        elif now_utc() - entry.created_at > timedelta(seconds=settings.VIDEO_CONTAINER_TIMEOUT_SECONDS):
+            await self._finish_failed(
+                entry,
+                f"{entry.platform} container {entry.container_id} still {status_code} after timeout",
+                result={"error": {"message": "Container processing timeout", "is_transient": True}}
+            )
+        else:
+            self._backoff(entry)
+
+    def _backoff(self, entry: PendingContainer):
+        """Check lại sau interval hiện tại, interval tăng dần x1.5 tới mức tối đa"""
+        delay = entry.interval
+        entry.interval = min(entry.interval * 1.5, settings.VIDEO_CONTAINER_POLL_MAX_SECONDS)
+        self._schedule(entry, delay)
+
+    async def _publish(self, entry: PendingContainer):
+        service = CONTAINER_SERVICES[entry.platform]
+        try:
+            result = await service.publish_container(entry.account_id, entry.access_token, entry.container_id)
+        except Exception as e:
+            await self._finish_failed(entry, f"{entry.platform} publish exception: {str(e)}", error=e)
+            return
+
+        if result.get("success"):
+            await self._finish_published(entry, result)
+        else:
+            error_msg = (result.get("error") or {}).get("error", {}).get("message", "Unknown error")
+            await self._finish_failed(entry, f"{entry.platform} error at publish_container: {error_msg}", result=result)
+
+    async def _finish_published(self, entry: PendingContainer, result: dict):
+        self._pending.pop(entry.post_id, None)
+        default_urls = {"instagram": "https://www.instagram.com/", "threads": "https://www.threads.net/"}
+        try:
+            async with async_session_maker() as session:
+                post = await session.get(Post, entry.post_id)
+                if not post or post.lease_owner != self.instance_id:
+                    logger.warning(f"⚠️ Lost lease on post {entry.post_id}, skip update")
+                    return
+
+                values = {
+                    "status": "published",
+                    "published_at": datetime.utcnow(),
+                    "error_message": None,
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "post_metadata": self._without_container(post.post_metadata)
+                }
+                if result.get("post_id"):
+                    values["platform_post_id"] = result["post_id"]
+                    values["platform_post_url"] = result.get("permalink") or default_urls[entry.platform]
+
+                await PostService(session).update(entry.post_id, values)
+                logger.info(f"✅ Post {entry.post_id} published to {entry.platform}: {values.get('platform_post_url')}")
+                if result.get("post_id"):
+                    permalink_resolver.enqueue(entry.post_id, entry.platform, result["post_id"], entry.access_token)
+        except Exception as e:
+            logger.error(f"❌ Could not update published post {entry.post_id}: {str(e)}")
+
+    async def _finish_failed(
+        self,
+        entry: PendingContainer,
+        error_message: str,
+        result: Optional[dict] = None,
+        error: Optional[Exception] = None
+    ):
+        self._pending.pop(entry.post_id, None)
+        try:
+            async with async_session_maker() as session:
+                post = await session.get(Post, entry.post_id)
+                if not post or post.lease_owner != self.instance_id:
+                    logger.warning(f"⚠️ Lost lease on post {entry.post_id}, skip update")
+                    return
+
+                # Bỏ container cũ + trả lease, sau đó để PostService quyết định retry/failed
+                await session.execute(
+                    update(Post)
+                    .where(Post.id == entry.post_id)
+                    .values(
+                        post_metadata=self._without_container(post.post_metadata),
+                        lease_owner=None,
+                        lease_expires_at=None
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+                await session.refresh(post)
+
+                await PostService(session)._mark_failed(
+                    post, entry.platform, error_message, result=result, error=error,
+                    media_type="video", media_urls=entry.media_urls
+                )
+                logger.error(f"❌ Post {entry.post_id} container failed: {error_message}")
+        except Exception as e:
+            logger.error(f"❌ Could not update failed post {entry.post_id}: {str(e)}")
+
+    @staticmethod
+    def _without_container(metadata: Optional[dict]) -> dict:
+        metadata = dict(metadata or {})
+        metadata.pop("container", None)
+        return metadata
+
+    async def _renew_leases(self):
+        """Gia hạn lease cho các post đang theo dõi; bỏ các post đã mất lease"""
+        if not self._pending:
+            return
+        try:
+            async with async_session_maker() as session:
+                result = await session.execute(
+                    update(Post)
+                    .where(Post.id.in_(list(self._pending)))
+                    .where(Post.lease_owner == self.instance_id)
+                    .values(lease_expires_at=self.lease_expiry())
+                    .returning(Post.id)
+                    .execution_options(synchronize_session=False)
+                )
+                renewed = set(result.scalars().all())
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not renew container leases: {str(e)}")
+            return
+
+        for post_id in list(self._pending):
+            if post_id not in renewed:
+                logger.warning(f"⚠️ Lost lease on post {post_id}, stop tracking container")
+                self._pending.pop(post_id, None)
+
+    async def _adopt_orphans(self):
+        """Tiếp quản container của post 'publishing' không còn instance nào giữ lease"""
+        try:
+            async with async_session_maker() as session:
+                now = now_utc()
+                claimed = await session.execute(
+                    update(Post)
+                    .where(Post.status == PostStatus.publishing)
+                    .where(Post.post_metadata['container'].isnot(None))
+                    .where((Post.lease_owner.is_(None)) | (Post.lease_expires_at < now))
+                    .values(lease_owner=self.instance_id, lease_expires_at=self.lease_expiry())
+                    .returning(Post.id)
+                    .execution_options(synchronize_session=False)
+                )
+                post_ids = list(claimed.scalars().all())
+                await session.commit()
+                if not post_ids:
+                    return
+
+                rows = await session.execute(
+                    select(Post, Page).join(Page, Post.page_id == Page.id).where(Post.id.in_(post_ids))
+                )
+                for post, page in rows.all():
+                    container = (post.post_metadata or {}).get("container") or {}
+                    if container.get("platform") not in CONTAINER_SERVICES:
+                        continue
+                    created_at = container.get("created_at")
+                    self.register(
+                        post_id=post.id,
+                        platform=container.get("platform"),
+                        account_id=container.get("account_id") or page.page_id,
+                        access_token=page.access_token,
+                        container_id=container.get("id"),
+                        media_urls=(post.post_metadata or {}).get("media_urls", []),
+                        created_at=datetime.fromisoformat(created_at) if created_at else None
+                    )
+                logger.info(f"🎞️ Adopted {len(post_ids)} pending container(s)")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not adopt pending containers: {str(e)}")
+
+
+# Global instance
+container_poller = ContainerPoller()
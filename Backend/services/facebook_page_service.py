@@ -1,8 +1,14 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models.model import Page, Platform, PageStatus
+import asyncio
 import json
+from pathlib import Path
+import httpx
 from datetime import datetime
+from services.http_client import http_client
+from services.page_service import PageService
+from core.config import settings
 
 
 async def facebook_callback_service(payload: dict, db: AsyncSession, user_id: int):
@@ -17,7 +23,8 @@ async def facebook_callback_service(payload: dict, db: AsyncSession, user_id: in
                 'category_list': [...],
                 'name': '...',
                 'id': '...',
-                'tasks': [...]
+                'tasks': [...],
+                'instagram_business_account': {'id': '...', ...}  # nếu page có liên kết IG
             }
         ],
         'paging': {...}
@@ -44,59 +51,35 @@ async def facebook_callback_service(payload: dict, db: AsyncSession, user_id: in
     
     # Lấy danh sách pages từ payload
     pages_data = payload.get("data", [])
-    saved_pages = []
+    now = datetime.utcnow()
+    rows = []
     
     for page_data in pages_data:
-        page_access_token = page_data.get("access_token")
         page_id = page_data.get("id")
-        page_name = page_data.get("name")
-        page_category = page_data.get("category", "")
+        ig_account = page_data.get("instagram_business_account") or {}
         
-        # Tạo page_url từ page_id
-        page_url = f"https://www.facebook.com/{page_id}"
-        
-        # Kiểm tra xem page đã tồn tại chưa
-        result = await db.execute(
-            select(Page).filter(
-                Page.platform_id == platform_id,
-                Page.page_id == page_id
-            )
-        )
-        existing_page = result.scalar_one_or_none()
-        
-        if existing_page:
-            # Cập nhật page đã tồn tại
-            existing_page.access_token = page_access_token
-            existing_page.page_name = page_name
-            existing_page.page_url = page_url
-            existing_page.status = PageStatus.connected
-            existing_page.last_sync_at = datetime.utcnow()
-            
-            await db.commit()
-            await db.refresh(existing_page)
-            saved_pages.append(existing_page)
-            
-        else:
-            # Tạo page mới
-            new_page = Page(
-                platform_id=platform_id,
-                page_id=page_id,
-                page_name=page_name,
-                page_url=page_url,
-                avatar_url=None,  # Facebook Graph API không trả về avatar trong /me/accounts
-                access_token=page_access_token,
-                token_expires_at=None,  # Có thể tính toán từ expires_in nếu có
-                status=PageStatus.connected,
-                follower_count=0,  # Cần gọi API riêng để lấy
-                created_by=user_id,
-                connected_at=datetime.utcnow(),
-                last_sync_at=datetime.utcnow()
-            )
-            
-            db.add(new_page)
-            await db.commit()
-            await db.refresh(new_page)
-            saved_pages.append(new_page)
+        rows.append({
+            "platform_id": platform_id,
+            "page_id": page_id,
+            "page_name": page_data.get("name"),
+            "page_url": f"https://www.facebook.com/{page_id}",  # Tạo page_url từ page_id
+            "avatar_url": None,  # Facebook Graph API không trả về avatar trong /me/accounts
+            "access_token": page_data.get("access_token"),
+            "token_expires_at": None,  # Có thể tính toán từ expires_in nếu có
+            # IG Business Account liên kết: lưu lúc connect để lúc đăng Instagram không phải resolve lại
+            "instagram_account_id": ig_account.get("id"),
+            "status": PageStatus.connected,
+            "follower_count": 0,  # Cần gọi API riêng để lấy
+            "created_by": user_id,
+            "connected_at": now,
+            "last_sync_at": now
+        })
+    
+    # Một câu INSERT ... ON CONFLICT cho tất cả pages (page đã tồn tại chỉ cập nhật token, tên, status)
+    saved_pages = await PageService(db).bulk_upsert(
+        rows,
+        update_fields=["access_token", "page_name", "page_url", "instagram_account_id", "status", "last_sync_at"]
+    )
     
     return {
         "success": True,
@@ -120,7 +103,9 @@ async def post_to_facebook_page(
     access_token: str,
     message: str,
     media_files: list = None,
-    media_type: str = "image"  # "image" or "video"
+    media_type: str = "image",  # "image" or "video"
+    upload_state: dict = None,
+    on_progress=None
 ):
     """
     Đăng bài lên Facebook Page
@@ -130,14 +115,14 @@ async def post_to_facebook_page(
         page_id: ID của Facebook Page
         access_token: Access token của page
         message: Nội dung bài đăng
-        media_files: Danh sách file data (bytes) hoặc URLs của media
+        media_files: Danh sách file data (bytes), Path tới file trên disk hoặc URLs của media
         media_type: Loại media ("image" hoặc "video")
+        upload_state: Upload session video đã lưu để upload tiếp (optional)
+        on_progress: Async callback(state) sau mỗi chunk video đã transfer (optional)
     
     Returns:
         dict: Response từ Facebook API
     """
-    import requests
-    
     # Case 1: Đăng text only (không có media)
     if not media_files or len(media_files) == 0:
         return await post_text_only(page_id, access_token, message)
@@ -153,7 +138,10 @@ async def post_to_facebook_page(
     
     # Case 3: Đăng với video
     elif media_type == "video":
-        return await post_video(page_id, access_token, message, media_files[0])
+        return await post_video(
+            page_id, access_token, message, media_files[0],
+            upload_state=upload_state, on_progress=on_progress
+        )
     
     else:
         raise ValueError(f"Unsupported media type: {media_type}")
@@ -165,8 +153,6 @@ async def post_text_only(page_id: str, access_token: str, message: str):
     
     API Endpoint: POST /v21.0/{page-id}/feed
     """
-    import requests
-    
     url = f"https://graph.facebook.com/v21.0/{page_id}/feed"
     
     data = {
@@ -174,7 +160,7 @@ async def post_text_only(page_id: str, access_token: str, message: str):
         "access_token": access_token
     }
     
-    response = requests.post(url, json=data)
+    response = await http_client.post(url, json=data)
     
     if response.status_code == 200:
         result = response.json()
@@ -202,12 +188,14 @@ async def post_single_image(page_id: str, access_token: str, message: str, image
         page_id: Facebook Page ID
         access_token: Page access token
         message: Nội dung bài đăng
-        image_data: File data (bytes) hoặc URL của ảnh
+        image_data: File data (bytes), Path tới file ảnh hoặc URL của ảnh
     """
-    import requests
-    
     url = f"https://graph.facebook.com/v21.0/{page_id}/photos"
     
+    if isinstance(image_data, Path):
+        # Ảnh trên disk: chỉ đọc vào RAM lúc upload
+        image_data = await asyncio.to_thread(image_data.read_bytes)
+    
     # Nếu image_data là bytes (file upload), dùng files parameter
     if isinstance(image_data, bytes):
         files = {
@@ -218,7 +206,7 @@ async def post_single_image(page_id: str, access_token: str, message: str, image
             "access_token": access_token,
             "published": "true"
         }
-        response = requests.post(url, data=data, files=files)
+        response = await http_client.post(url, data=data, files=files, timeout=settings.HTTP_UPLOAD_TIMEOUT_SECONDS)
     else:
         # Nếu là URL (fallback)
         data = {
@@ -227,7 +215,7 @@ async def post_single_image(page_id: str, access_token: str, message: str, image
             "access_token": access_token,
             "published": "true"
         }
-        response = requests.post(url, data=data)
+        response = await http_client.post(url, data=data)
     
     if response.status_code == 200:
         result = response.json()
@@ -251,7 +239,7 @@ async def post_multiple_images(page_id: str, access_token: str, message: str, im
     Upload ảnh trực tiếp từ file (không qua server)
     
     Steps:
-    1. Upload từng ảnh lên FB (unpublished)
+    1. Upload các ảnh lên FB (unpublished) song song, tối đa FACEBOOK_PHOTO_UPLOAD_CONCURRENCY
     2. Tạo post với các ảnh đã upload
     
     API Endpoint: 
@@ -264,44 +252,34 @@ async def post_multiple_images(page_id: str, access_token: str, message: str, im
         message: Nội dung bài đăng
         images_data: List of file data (bytes) hoặc URLs
     """
-    import requests
+    # Step 1: Upload các ảnh lên Facebook (unpublished) song song, giới hạn số request đồng thời
+    semaphore = asyncio.Semaphore(settings.FACEBOOK_PHOTO_UPLOAD_CONCURRENCY)
+    results = await asyncio.gather(
+        *[
+            _upload_unpublished_photo(page_id, access_token, idx, image_data, semaphore)
+            for idx, image_data in enumerate(images_data)
+        ],
+        return_exceptions=True
+    )
     
-    # Step 1: Upload các ảnh lên Facebook (unpublished)
-    uploaded_media = []
+    # gather giữ nguyên thứ tự -> attached_media đúng thứ tự ảnh
+    uploaded_ids = [r["media_fbid"] for r in results if isinstance(r, dict) and r.get("success")]
+    failed = [(idx, r) for idx, r in enumerate(results) if not (isinstance(r, dict) and r.get("success"))]
     
-    for idx, image_data in enumerate(images_data):
-        upload_url = f"https://graph.facebook.com/v21.0/{page_id}/photos"
-        
-        # Nếu image_data là bytes (file upload)
-        if isinstance(image_data, bytes):
-            files = {
-                'source': (f'image_{idx}.jpg', image_data, 'image/jpeg')
-            }
-            upload_data = {
-                "access_token": access_token,
-                "published": "false"  # Không publish ngay
-            }
-            upload_response = requests.post(upload_url, data=upload_data, files=files)
-        else:
-            # Nếu là URL (fallback)
-            upload_data = {
-                "url": image_data,
-                "access_token": access_token,
-                "published": "false"
-            }
-            upload_response = requests.post(upload_url, data=upload_data)
+    if failed:
+        # Xóa các ảnh đã upload để không để lại ảnh mồ côi trên page
+        await _delete_uploaded_photos(uploaded_ids, access_token)
         
-        if upload_response.status_code == 200:
-            result = upload_response.json()
-            uploaded_media.append({
-                "media_fbid": result.get("id")
-            })
-        else:
-            return {
-                "success": False,
-                "error": upload_response.json(),
-                "message": f"Upload ảnh {idx + 1} thất bại"
-            }
+        idx, error = failed[0]
+        if isinstance(error, Exception):
+            raise error
+        return {
+            "success": False,
+            "error": error.get("error"),
+            "message": f"Upload ảnh {idx + 1} thất bại"
+        }
+    
+    uploaded_media = [{"media_fbid": media_fbid} for media_fbid in uploaded_ids]
     
     # Step 2: Tạo post với các ảnh đã upload
     post_url = f"https://graph.facebook.com/v21.0/{page_id}/feed"
@@ -311,7 +289,7 @@ async def post_multiple_images(page_id: str, access_token: str, message: str, im
         "attached_media": uploaded_media
     }
     
-    post_response = requests.post(post_url, json=post_data)
+    post_response = await http_client.post(post_url, json=post_data)
     
     if post_response.status_code == 200:
         result = post_response.json()
@@ -321,6 +299,7 @@ async def post_multiple_images(page_id: str, access_token: str, message: str, im
             "message": f"Đăng bài với {len(images_data)} ảnh thành công"
         }
     else:
+        await _delete_uploaded_photos(uploaded_ids, access_token)
         return {
             "success": False,
             "error": post_response.json(),
@@ -328,34 +307,111 @@ async def post_multiple_images(page_id: str, access_token: str, message: str, im
         }
 
 
-async def post_video(page_id: str, access_token: str, message: str, video_data):
+async def _upload_unpublished_photo(
+    page_id: str,
+    access_token: str,
+    idx: int,
+    image_data,
+    semaphore: asyncio.Semaphore
+) -> dict:
+    """
+    Upload 1 ảnh unpublished (dùng cho album nhiều ảnh)
+    
+    API Endpoint: POST /v21.0/{page-id}/photos (published=false)
+    """
+    upload_url = f"https://graph.facebook.com/v21.0/{page_id}/photos"
+    
+    async with semaphore:
+        if isinstance(image_data, Path):
+            # Ảnh trên disk: chỉ đọc vào RAM khi tới lượt upload
+            image_data = await asyncio.to_thread(image_data.read_bytes)
+        
+        # Nếu image_data là bytes (file upload)
+        if isinstance(image_data, bytes):
+            files = {
+                'source': (f'image_{idx}.jpg', image_data, 'image/jpeg')
+            }
+            upload_data = {
+                "access_token": access_token,
+                "published": "false"  # Không publish ngay
+            }
+            upload_response = await http_client.post(upload_url, data=upload_data, files=files, timeout=settings.HTTP_UPLOAD_TIMEOUT_SECONDS)
+        else:
+            # Nếu là URL (fallback)
+            upload_data = {
+                "url": image_data,
+                "access_token": access_token,
+                "published": "false"
+            }
+            upload_response = await http_client.post(upload_url, data=upload_data)
+    
+    if upload_response.status_code == 200:
+        return {
+            "success": True,
+            "media_fbid": upload_response.json().get("id")
+        }
+    return {
+        "success": False,
+        "error": upload_response.json()
+    }
+
+
+async def _delete_uploaded_photos(photo_ids: list, access_token: str):
+    """Xóa các ảnh unpublished đã upload khi đăng album thất bại (best-effort)"""
+    if not photo_ids:
+        return
+    
+    async def _delete(photo_id: str):
+        try:
+            response = await http_client.delete(
+                f"https://graph.facebook.com/v21.0/{photo_id}",
+                params={"access_token": access_token}
+            )
+            if response.status_code != 200:
+                print(f"⚠️ Không thể xóa ảnh {photo_id}: {response.text[:200]}")
+        except Exception as e:
+            print(f"⚠️ Không thể xóa ảnh {photo_id}: {str(e)}")
+    
+    await asyncio.gather(*[_delete(photo_id) for photo_id in photo_ids])
+    print(f"🗑️ Đã xóa {len(photo_ids)} ảnh đã upload của album thất bại")
+
+
+async def post_video(page_id: str, access_token: str, message: str, video_data, upload_state: dict = None, on_progress=None):
     """
     Đăng bài với video lên Facebook Page
     Upload video trực tiếp từ file (không qua server)
     
     API Endpoint: POST /v21.0/{page-id}/videos
+    - File trên disk (Path) hoặc bytes lớn: resumable upload start/transfer/finish
+    - Bytes nhỏ: một request multipart
+    - URL: Facebook tự tải video (file_url)
     
     Args:
         page_id: Facebook Page ID
         access_token: Page access token
         message: Nội dung bài đăng
-        video_data: File data (bytes) hoặc URL của video
+        video_data: File data (bytes), Path tới file video hoặc URL của video
+        upload_state: Upload session đã lưu {"upload_session_id", "video_id", "start_offset", ...} (optional)
+        on_progress: Async callback(state) sau mỗi chunk đã transfer, dùng để lưu session (optional)
     """
-    import requests
+    if isinstance(video_data, Path) or (
+        isinstance(video_data, bytes) and len(video_data) > settings.FACEBOOK_VIDEO_RESUMABLE_THRESHOLD
+    ):
+        return await _post_video_resumable(page_id, access_token, message, video_data, upload_state, on_progress)
     
     url = f"https://graph.facebook.com/v21.0/{page_id}/videos"
     
-    # Nếu video_data là bytes (file upload)
+    # Nếu video_data là bytes (file upload nhỏ)
     if isinstance(video_data, bytes):
-        files = {
-            'source': ('video.mp4', video_data, 'video/mp4')
-        }
         data = {
             "description": message,
             "access_token": access_token,
             "published": "true"
         }
-        response = requests.post(url, data=data, files=files)
+        files = {
+            'source': ('video.mp4', video_data, 'video/mp4')
+        }
+        response = await http_client.post(url, data=data, files=files, timeout=settings.HTTP_UPLOAD_TIMEOUT_SECONDS)
     else:
         # Nếu là URL (fallback)
         data = {
@@ -364,7 +420,7 @@ async def post_video(page_id: str, access_token: str, message: str, video_data):
             "access_token": access_token,
             "published": "true"
         }
-        response = requests.post(url, data=data)
+        response = await http_client.post(url, data=data)
     
     if response.status_code == 200:
         result = response.json()
@@ -381,5 +437,177 @@ async def post_video(page_id: str, access_token: str, message: str, video_data):
         }
 
 
+async def _post_video_resumable(
+    page_id: str,
+    access_token: str,
+    message: str,
+    video_data,
+    upload_state: dict = None,
+    on_progress=None
+):
+    """
+    Resumable upload video: start -> transfer (từng chunk) -> finish
+    
+    - Đọc từng chunk từ disk (Path) nên RAM không phụ thuộc kích thước video
+    - Mỗi chunk retry riêng khi lỗi mạng / lỗi tạm thời
+    - Có upload_state thì transfer tiếp từ start_offset đã lưu (session còn hạn)
+    """
+    url = f"https://graph-video.facebook.com/v21.0/{page_id}/videos"
+    is_file = isinstance(video_data, Path)
+    file_size = video_data.stat().st_size if is_file else len(video_data)
+    
+    state = None
+    resumed = False
+    if upload_state and upload_state.get("upload_session_id") and upload_state.get("file_size") == file_size:
+        state = dict(upload_state)
+        resumed = True
+        print(f"⏯️ Resuming Facebook upload session {state['upload_session_id']} at offset {state['start_offset']}")
+    
+    if state is None:
+        response = await http_client.post(url, data={
+            "upload_phase": "start",
+            "file_size": str(file_size),
+            "access_token": access_token
+        })
+        if response.status_code != 200:
+            return {
+                "success": False,
+                "error": response.json(),
+                "status_code": response.status_code,
+                "message": "Khởi tạo upload video thất bại"
+            }
+        result = response.json()
+        state = {
+            "upload_session_id": result["upload_session_id"],
+            "video_id": result.get("video_id"),
+            "start_offset": int(result["start_offset"]),
+            "end_offset": int(result["end_offset"]),
+            "file_size": file_size
+        }
+        if on_progress:
+            await on_progress(dict(state))
+    
+    # Facebook quyết định chunk tiếp theo qua start_offset/end_offset trong mỗi response
+    while state["start_offset"] < state["end_offset"]:
+        start_offset, end_offset = state["start_offset"], state["end_offset"]
+        if is_file:
+            chunk = await asyncio.to_thread(_read_file_range, video_data, start_offset, end_offset - start_offset)
+        else:
+            chunk = video_data[start_offset:end_offset]
+        
+        result = await _transfer_video_chunk(url, access_token, state["upload_session_id"], start_offset, chunk)
+        if not result.get("success"):
+            if resumed:
+                # Session đã lưu không còn dùng được -> upload lại với session mới
+                print("⚠️ Saved Facebook upload session is no longer valid, starting a new session")
+                return await _post_video_resumable(page_id, access_token, message, video_data, None, on_progress)
+            return result
+        resumed = False
+        
+        state["start_offset"] = int(result["start_offset"])
+        state["end_offset"] = int(result["end_offset"])
+        print(f"   📤 Facebook video upload: {state['start_offset']}/{file_size} bytes")
+        if on_progress:
+            await on_progress(dict(state))
+    
+    response = await http_client.post(url, data={
+        "upload_phase": "finish",
+        "upload_session_id": state["upload_session_id"],
+        "description": message,
+        "published": "true",
+        "access_token": access_token
+    })
+    if response.status_code != 200 or not response.json().get("success"):
+        return {
+            "success": False,
+            "error": response.json(),
+            "status_code": response.status_code,
+            "message": "Hoàn tất upload video thất bại"
+        }
+    
+    return {
+        "success": True,
+        "video_id": state["video_id"],
+        "message": "Đăng video thành công"
+    }
+
+
+async def _transfer_video_chunk(url: str, access_token: str, upload_session_id: str, start_offset: int, chunk: bytes):
+    """
+    Gửi một chunk (upload_phase=transfer), retry khi lỗi mạng / 429 / 5xx / lỗi tạm thời
+    
+    Nếu Facebook báo sai offset (VD: chunk trước đã nhận nhưng response bị mất),
+    trả về offset server mong muốn trong error_data để upload tiếp đúng vị trí
+    """
+    last_error = None
+    for attempt in range(settings.FACEBOOK_CHUNK_MAX_RETRIES + 1):
+        if attempt > 0:
+            await asyncio.sleep(2 ** attempt)
+            print(f"   🔁 Retry chunk at offset {start_offset} (attempt {attempt + 1})")
+        try:
+            response = await http_client.post(
+                url,
+                data={
+                    "upload_phase": "transfer",
+                    "upload_session_id": upload_session_id,
+                    "start_offset": str(start_offset),
+                    "access_token": access_token
+                },
+                files={"video_file_chunk": ("chunk", chunk, "application/octet-stream")},
+                timeout=settings.HTTP_UPLOAD_TIMEOUT_SECONDS
+            )
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            last_error = e
+            continue
+        
+        try:
+            body = response.json()
+        except json.JSONDecodeError:
+            body = {"error": {"message": response.text[:500]}}
+        
+        if response.status_code == 200:
+            return {
+                "success": True,
+                "start_offset": body["start_offset"],
+                "end_offset": body["end_offset"]
+            }
+        
+        error = body.get("error", {}) if isinstance(body, dict) else {}
+        error_data = error.get("error_data")
+        if isinstance(error_data, str):
+            try:
+                error_data = json.loads(error_data)
+            except json.JSONDecodeError:
+                error_data = None
+        if isinstance(error_data, dict) and "start_offset" in error_data:
+            return {
+                "success": True,
+                "start_offset": error_data["start_offset"],
+                "end_offset": error_data["end_offset"]
+            }
+        
+        if response.status_code == 429 or response.status_code >= 500 or error.get("is_transient"):
+            last_error = body
+            continue
+        
+        return {
+            "success": False,
+            "error": body,
+            "status_code": response.status_code,
+            "message": f"Upload video chunk thất bại tại offset {start_offset}"
+        }
+    
+    if isinstance(last_error, Exception):
+        raise last_error
+    return {
+        "success": False,
+        "error": last_error,
+        "status_code": 503,
+        "message": f"Upload video chunk thất bại tại offset {start_offset} sau {settings.FACEBOOK_CHUNK_MAX_RETRIES + 1} lần thử"
+    }
 
 
+def _read_file_range(path: Path, offset: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
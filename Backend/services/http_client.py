@@ -0,0 +1,109 @@
+"""
+HTTP Client - httpx.AsyncClient dùng chung cho các platform service
+
+- Một connection pool duy nhất (keep-alive), không mở TLS mới cho mỗi request
+- HTTP/2 nếu có package h2 (httpx[http2])
+- Giới hạn số request đồng thời cho mỗi host (semaphore)
+- Timeout mặc định, request upload lớn truyền timeout riêng
+- Giãn nhịp request theo rate_limiter (token bucket theo app / page)
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+from urllib.parse import urlsplit
+import logging
+
+import httpx
+
+from core.config import settings
+from services.rate_limiter import rate_limiter
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """Wrapper quanh httpx.AsyncClient, khởi tạo lazy trong event loop đang chạy"""
+
+    def __init__(self):
+        self._client: httpx.AsyncClient = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS
+                ),
+                timeout=httpx.Timeout(
+                    settings.HTTP_TIMEOUT_SECONDS,
+                    connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS
+                ),
+                follow_redirects=True
+            )
+            logger.info(f"🌐 HTTP client initialized (http2={HTTP2_AVAILABLE})")
+        return self._client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(str(url)).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        # Chờ token của app/page trước khi gửi, cập nhật bucket từ header usage của response
+        await rate_limiter.acquire(url)
+        async with self._host_semaphore(url):
+            response = await self.client.request(method, url, **kwargs)
+        rate_limiter.observe(url, response)
+        return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Stream response body (download file lớn không cần giữ hết trong RAM)"""
+        await rate_limiter.acquire(url)
+        async with self._host_semaphore(url):
+            async with self.client.stream(method, url, **kwargs) as response:
+                rate_limiter.observe(url, response, inspect_body=False)
+                yield response
+
+    async def download(self, url: str, timeout: float = 60) -> bytes:
+        """Download toàn bộ nội dung URL, raise httpx.HTTPStatusError nếu lỗi"""
+        response = await self.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("🌐 HTTP client closed")
+        self._client = None
+        self._host_semaphores.clear()
+
+
+# Global instance
+http_client = HttpClient()
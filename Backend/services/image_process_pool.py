@@ -0,0 +1,116 @@
+"""
+Image Process Pool - Process pool riêng cho xử lý ảnh template (frame/watermark) bằng Pillow
+
+- Xử lý ảnh tốn CPU và giữ GIL: chạy trong process con để event loop không bị chặn
+- Số process cố định (IMAGE_PROCESSING_WORKERS, mặc định = số core), tạo lazy ở lần dùng đầu
+- Ảnh của một post được gửi song song, kết quả giữ đúng thứ tự
+- Process con dùng context 'spawn' (không fork process đang chạy event loop / thread pool)
+- Mỗi process con có template_asset_cache riêng: asset được load một lần mỗi process rồi dùng lại
+- Process con chết (OOM, segfault) -> pool bị hỏng, tạo pool mới cho lần xử lý sau
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, List, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ImageProcessPool:
+    """ProcessPoolExecutor dùng chung cho xử lý ảnh"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._restarts = 0
+        self._total_seconds = 0.0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"🧮 Image process pool started ({self.max_workers} workers)")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Chạy fn(*args, **kwargs) trong process con
+        fn, tham số và kết quả phải pickle được (hàm/staticmethod cấp module, bytes, str...)
+        """
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        self._running += 1
+        started_at = time.monotonic()
+        try:
+            result = await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+            self._completed += 1
+            return result
+        except BrokenProcessPool:
+            self._failed += 1
+            self._reset(executor)
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._running -= 1
+            self._total_seconds += time.monotonic() - started_at
+
+    async def map(self, fn: Callable[..., Any], items: List[Any], **kwargs) -> List[Any]:
+        """
+        Chạy fn(item, **kwargs) song song cho mọi item, kết quả theo thứ tự items
+        Item lỗi -> phần tử tương ứng là exception (không làm hỏng các item khác)
+        """
+        return await asyncio.gather(
+            *[self.run(fn, item, **kwargs) for item in items],
+            return_exceptions=True
+        )
+
+    def _reset(self, executor: ProcessPoolExecutor):
+        """Bỏ pool bị hỏng (process con chết); lần run sau tạo pool mới"""
+        if self._executor is executor:
+            logger.warning("⚠️ Image process pool broken, restarting on next use")
+            self._executor = None
+            self._restarts += 1
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "started": self._executor is not None,
+            "running": self._running,
+            "completed": self._completed,
+            "failed": self._failed,
+            "restarts": self._restarts,
+            "avg_seconds": round(self._total_seconds / (self._completed + self._failed), 2)
+            if (self._completed + self._failed) else 0
+        }
+
+    def shutdown(self):
+        """Dừng pool, bỏ các job chưa chạy"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global instance
+image_process_pool = ImageProcessPool(
+    max_workers=settings.IMAGE_PROCESSING_WORKERS or os.cpu_count() or 1
+)
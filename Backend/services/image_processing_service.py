@@ -1,12 +1,9 @@
 from PIL import Image, ImageDraw
 import io
-import requests
-from typing import Optional, Tuple
-import tempfile
-import os
-import subprocess
+from pathlib import Path
+from typing import Optional, Tuple, Union
 import re
-from services.image_utils import get_absolute_path_from_url, is_localhost_url, normalize_url
+from services.template_asset_cache import template_asset_cache
 
 
 class ImageProcessingService:
@@ -14,32 +11,13 @@ class ImageProcessingService:
     
     @staticmethod
     def download_image_from_url(url: str) -> Image.Image:
-        """Download image from URL and return PIL Image"""
+        """
+        Download image from URL and return PIL Image
+        Ảnh đã decode được cache theo URL (template_asset_cache), trả về bản copy có thể sửa
+        """
         try:
-            print(f"📥 Downloading image from: {url}")
-            
-            # Normalize URL (fix common issues like wrong port)
-            url = normalize_url(url)
-            print(f"  → Normalized URL: {url}")
-            
-            # Xử lý localhost URLs - đọc trực tiếp từ disk
-            if is_localhost_url(url):
-                absolute_path = get_absolute_path_from_url(url)
-                if absolute_path and os.path.exists(absolute_path):
-                    print(f"  ✅ Reading from disk: {absolute_path}")
-                    return Image.open(absolute_path).convert('RGBA')
-                else:
-                    print(f"  ⚠️ File not found at: {absolute_path}")
-                    print(f"  → Current working directory: {os.getcwd()}")
-                    print(f"  → Trying HTTP download...")
-            
-            # Download qua HTTP với timeout dài hơn
-            print(f"  → Downloading via HTTP...")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            print(f"  ✅ Downloaded successfully ({len(response.content)} bytes)")
-            return Image.open(io.BytesIO(response.content)).convert('RGBA')
-            
+            print(f"📥 Loading image from: {url}")
+            return template_asset_cache.get(url).copy()
         except Exception as e:
             print(f"  ❌ Failed: {str(e)}")
             raise Exception(f"Failed to download image from {url}: {str(e)}")
@@ -85,9 +63,13 @@ class ImageProcessingService:
     def apply_frame_to_image(
         content_image: Image.Image,
         frame_image: Image.Image,
-        aspect_ratio: Optional[str] = None
+        aspect_ratio: Optional[str] = None,
+        frame_url: Optional[str] = None
     ) -> Image.Image:
-        """Apply frame to content image"""
+        """
+        Apply frame to content image
+        frame_url: frame đã resize theo kích thước ảnh được cache lại (dùng cho ảnh cùng kích thước tiếp theo)
+        """
         try:
             # Resize content to match aspect ratio if specified
             if aspect_ratio:
@@ -97,10 +79,18 @@ class ImageProcessingService:
             
             # Ensure both images are RGBA
             content_image = content_image.convert('RGBA')
-            frame_image = frame_image.convert('RGBA')
+            if frame_image.mode != 'RGBA':
+                frame_image = frame_image.convert('RGBA')
             
             # Resize frame to match content size
-            frame_resized = frame_image.resize(content_image.size, Image.Resampling.LANCZOS)
+            size = content_image.size
+            if frame_url:
+                frame_resized = template_asset_cache.variant(
+                    frame_url, ("frame", size),
+                    lambda image: image.resize(size, Image.Resampling.LANCZOS)
+                )
+            else:
+                frame_resized = frame_image.resize(size, Image.Resampling.LANCZOS)
             
             # Create composite: content as base, frame on top
             result = Image.alpha_composite(content_image, frame_resized)
@@ -115,27 +105,34 @@ class ImageProcessingService:
         watermark_image: Image.Image,
         position: str = 'bottom-right',
         opacity: float = 0.8,
-        margin: int = 20
+        margin: int = 20,
+        watermark_url: Optional[str] = None
     ) -> Image.Image:
-        """Apply watermark to content image"""
+        """
+        Apply watermark to content image
+        watermark_url: watermark đã resize + áp opacity được cache lại theo kích thước
+        """
         try:
             # Ensure both images are RGBA
             content_image = content_image.convert('RGBA')
-            watermark_image = watermark_image.convert('RGBA')
+            if watermark_image.mode != 'RGBA':
+                watermark_image = watermark_image.convert('RGBA')
             
             # Calculate watermark size (max 20% of content width)
             max_wm_width = int(content_image.size[0] * 0.2)
             wm_ratio = watermark_image.size[1] / watermark_image.size[0]
             wm_width = min(watermark_image.size[0], max_wm_width)
             wm_height = int(wm_width * wm_ratio)
-            watermark_resized = watermark_image.resize((wm_width, wm_height), Image.Resampling.LANCZOS)
             
-            # Apply opacity
-            watermark_with_opacity = Image.new('RGBA', watermark_resized.size)
-            for x in range(watermark_resized.size[0]):
-                for y in range(watermark_resized.size[1]):
-                    r, g, b, a = watermark_resized.getpixel((x, y))
-                    watermark_with_opacity.putpixel((x, y), (r, g, b, int(a * opacity)))
+            if watermark_url:
+                watermark_with_opacity = template_asset_cache.variant(
+                    watermark_url, ("watermark", (wm_width, wm_height), opacity),
+                    lambda image: ImageProcessingService._prepare_watermark(image, (wm_width, wm_height), opacity)
+                )
+            else:
+                watermark_with_opacity = ImageProcessingService._prepare_watermark(
+                    watermark_image, (wm_width, wm_height), opacity
+                )
             
             # Calculate position
             content_width, content_height = content_image.size
@@ -151,17 +148,26 @@ class ImageProcessingService:
             
             x, y = position_map.get(position, position_map['bottom-right'])
             
-            # Paste watermark onto content
-            result = content_image.copy()
+            # Paste watermark onto content (convert('RGBA') ở trên đã trả về ảnh mới, không cần copy thêm)
+            result = content_image
             result.paste(watermark_with_opacity, (x, y), watermark_with_opacity)
             
             return result
         except Exception as e:
             raise Exception(f"Failed to apply watermark: {str(e)}")
     
+    @staticmethod
+    def _prepare_watermark(watermark_image: Image.Image, size: Tuple[int, int], opacity: float) -> Image.Image:
+        """Resize watermark và áp opacity (ảnh mới, không sửa watermark_image)"""
+        watermark_resized = watermark_image.resize(size, Image.Resampling.LANCZOS)
+        # Apply opacity: scale alpha band qua lookup table (một lần cho cả ảnh, không lặp từng pixel)
+        alpha_lut = [min(255, max(0, int(a * opacity))) for a in range(256)]
+        watermark_resized.putalpha(watermark_resized.getchannel('A').point(alpha_lut))
+        return watermark_resized
+    
     @staticmethod
     def process_image_with_template(
-        content_image_data: bytes,
+        content_image_data: Union[bytes, Path],
         frame_url: Optional[str] = None,
         watermark_url: Optional[str] = None,
         watermark_position: str = 'bottom-right',
@@ -170,26 +176,28 @@ class ImageProcessingService:
     ) -> bytes:
         """
         Process image with frame and/or watermark
+        content_image_data: image bytes hoặc Path tới file ảnh (đọc trực tiếp từ disk)
         Returns processed image as bytes
         """
         try:
+            is_file = isinstance(content_image_data, Path)
             print(f"\n🔧 === IMAGE PROCESSING DEBUG ===")
-            print(f"  📁 Input image size: {len(content_image_data)} bytes")
+            print(f"  📁 Input image size: {content_image_data.stat().st_size if is_file else len(content_image_data)} bytes")
             print(f"  🖼️ Frame URL: {frame_url}")
             print(f"  💧 Watermark URL: {watermark_url}")
             print(f"  📐 Aspect ratio: {aspect_ratio}")
             
             # Load content image
-            content_image = Image.open(io.BytesIO(content_image_data)).convert('RGBA')
+            content_image = Image.open(content_image_data if is_file else io.BytesIO(content_image_data)).convert('RGBA')
             print(f"  ✅ Loaded content image: {content_image.size}")
             
             # Apply frame if provided
             if frame_url:
                 print(f"  🎨 Applying frame from: {frame_url}")
-                frame_image = ImageProcessingService.download_image_from_url(frame_url)
+                frame_image = template_asset_cache.get(frame_url)
                 print(f"  ✅ Frame loaded: {frame_image.size}")
                 content_image = ImageProcessingService.apply_frame_to_image(
-                    content_image, frame_image, aspect_ratio
+                    content_image, frame_image, aspect_ratio, frame_url=frame_url
                 )
                 print(f"  ✅ Frame applied successfully!")
             else:
@@ -198,10 +206,11 @@ class ImageProcessingService:
             # Apply watermark if provided (and no frame)
             if watermark_url:
                 print(f"  💧 Applying watermark from: {watermark_url}")
-                watermark_image = ImageProcessingService.download_image_from_url(watermark_url)
+                watermark_image = template_asset_cache.get(watermark_url)
                 print(f"  ✅ Watermark loaded: {watermark_image.size}")
                 content_image = ImageProcessingService.apply_watermark_to_image(
-                    content_image, watermark_image, watermark_position, watermark_opacity
+                    content_image, watermark_image, watermark_position, watermark_opacity,
+                    watermark_url=watermark_url
                 )
                 print(f"  ✅ Watermark applied successfully!")
             else:
@@ -224,70 +233,3 @@ class ImageProcessingService:
             import traceback
             traceback.print_exc()
             raise Exception(f"Failed to process image: {str(e)}")
-    
-    @staticmethod
-    def apply_frame_to_video(
-        video_path: str,
-        frame_url: str,
-        aspect_ratio: Optional[str] = None,
-        output_path: Optional[str] = None
-    ) -> str:
-        """
-        Apply frame overlay to video using ffmpeg
-        Returns path to processed video
-        """
-        try:
-            if output_path is None:
-                output_dir = tempfile.gettempdir()
-                output_filename = f"framed_video_{os.path.basename(video_path)}"
-                output_path = os.path.join(output_dir, output_filename)
-            
-            # Download frame image
-            frame_image = ImageProcessingService.download_image_from_url(frame_url)
-            
-            # Save frame to temp file
-            frame_temp_path = os.path.join(tempfile.gettempdir(), "frame_overlay.png")
-            frame_image.save(frame_temp_path, format='PNG')
-            
-            # Use ffmpeg to overlay frame on video
-            # Get video dimensions first
-            probe_cmd = [
-                'ffprobe', '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height',
-                '-of', 'csv=p=0',
-                video_path
-            ]
-            
-            try:
-                result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
-                video_width, video_height = map(int, result.stdout.strip().split(','))
-            except:
-                # Default dimensions if probe fails
-                video_width, video_height = 1080, 1920
-            
-            # Resize frame to match video dimensions
-            frame_resized = frame_image.resize((video_width, video_height), Image.Resampling.LANCZOS)
-            frame_resized.save(frame_temp_path, format='PNG')
-            
-            # Apply overlay using ffmpeg
-            ffmpeg_cmd = [
-                'ffmpeg', '-i', video_path,
-                '-i', frame_temp_path,
-                '-filter_complex', '[0:v][1:v]overlay=0:0',
-                '-c:a', 'copy',
-                '-y',  # Overwrite output
-                output_path
-            ]
-            
-            subprocess.run(ffmpeg_cmd, check=True, capture_output=True)
-            
-            # Clean up temp frame
-            if os.path.exists(frame_temp_path):
-                os.remove(frame_temp_path)
-            
-            return output_path
-        except subprocess.CalledProcessError as e:
-            raise Exception(f"FFmpeg error: {e.stderr.decode()}")
-        except Exception as e:
-            raise Exception(f"Failed to apply frame to video: {str(e)}")
@@ -11,7 +11,10 @@ Documentation:
 - https://developers.facebook.com/docs/instagram-api/reference/ig-user/media
 """
 
-import requests
+import asyncio
+
+from services.http_client import http_client
+from core.config import settings
 from typing import List, Dict, Optional
 
 
@@ -116,7 +119,7 @@ async def post_single_image_to_instagram(
     }
     
     print(f"🔄 [Instagram B1] Creating media container...")
-    create_response = requests.post(create_url, json=create_data)
+    create_response = await http_client.post(create_url, json=create_data)
     
     if create_response.status_code != 200:
         error_data = create_response.json()
@@ -139,33 +142,17 @@ async def post_single_image_to_instagram(
     }
     
     print(f"🔄 [Instagram B2] Publishing container {container_id}...")
-    publish_response = requests.post(publish_url, json=publish_data)
+    publish_response = await http_client.post(publish_url, json=publish_data)
     
     if publish_response.status_code == 200:
         result = publish_response.json()
         media_id = result.get("id")
         print(f"✅ [Instagram B2] Published successfully: {media_id}")
         
-        # Step 3: Lấy permalink từ media ID
-        permalink = None
-        try:
-            media_info_url = f"https://graph.facebook.com/v21.0/{media_id}"
-            media_info_params = {
-                "fields": "permalink",
-                "access_token": access_token
-            }
-            media_info_response = requests.get(media_info_url, params=media_info_params)
-            if media_info_response.status_code == 200:
-                permalink = media_info_response.json().get("permalink")
-                print(f"🔗 [Instagram] Permalink: {permalink}")
-        except Exception as e:
-            print(f"⚠️ [Instagram] Could not fetch permalink: {e}")
-        
         return {
             "success": True,
             "post_id": media_id,
             "container_id": container_id,
-            "permalink": permalink,
             "message": "Posted to Instagram successfully"
         }
     else:
@@ -205,44 +192,88 @@ async def post_video_to_instagram(
         "access_token": access_token
     }
     
-    create_response = requests.post(create_url, params=create_params)
+    create_response = await http_client.post(create_url, params=create_params)
     
     if create_response.status_code != 200:
         return {
             "success": False,
             "error": create_response.json(),
-            "message": "Failed to create Instagram video container"
+            "message": "Failed to create Instagram video container",
+            "step": "create_container"
         }
     
     container_id = create_response.json().get("id")
     
-    # Step 2: Check status (video processing takes time)
-    # TODO: Implement polling to check status
-    # GET https://graph.facebook.com/v21.0/{ig-container-id}?fields=status_code
+    # Step 2 + 3: Video cần thời gian xử lý -> container_poller poll status_code
+    # và publish khi FINISHED (xem get_container_status / publish_container)
+    return {
+        "success": True,
+        "pending": True,
+        "container_id": container_id,
+        "message": "Instagram video container created, waiting for processing"
+    }
+
+
+async def get_container_status(container_id: str, access_token: str) -> Dict:
+    """
+    Lấy trạng thái media container
+    
+    GET https://graph.facebook.com/v21.0/{ig-container-id}?fields=status_code,status
+    status_code: IN_PROGRESS | FINISHED | ERROR | EXPIRED | PUBLISHED
+    """
+    response = await http_client.get(
+        f"https://graph.facebook.com/v21.0/{container_id}",
+        params={
+            "fields": "status_code,status",
+            "access_token": access_token
+        }
+    )
+    
+    if response.status_code != 200:
+        return {
+            "success": False,
+            "error": response.json()
+        }
+    
+    data = response.json()
+    return {
+        "success": True,
+        "status_code": data.get("status_code"),
+        "status": data.get("status")
+    }
+
+
+async def publish_container(instagram_business_account_id: str, access_token: str, container_id: str) -> Dict:
+    """
+    Publish media container đã FINISHED (permalink lấy sau qua permalink_resolver)
     
-    # Step 3: Publish when ready (status_code = FINISHED)
+    POST https://graph.facebook.com/v21.0/{ig-user-id}/media_publish
+    """
     publish_url = f"https://graph.facebook.com/v21.0/{instagram_business_account_id}/media_publish"
     publish_params = {
         "creation_id": container_id,
         "access_token": access_token
     }
     
-    publish_response = requests.post(publish_url, params=publish_params)
+    publish_response = await http_client.post(publish_url, params=publish_params)
     
-    if publish_response.status_code == 200:
-        result = publish_response.json()
-        return {
-            "success": True,
-            "post_id": result.get("id"),
-            "container_id": container_id,
-            "message": "Posted video to Instagram successfully"
-        }
-    else:
+    if publish_response.status_code != 200:
         return {
             "success": False,
             "error": publish_response.json(),
-            "message": "Failed to publish Instagram video"
+            "container_id": container_id,
+            "message": "Failed to publish Instagram container",
+            "step": "publish_container"
         }
+    
+    media_id = publish_response.json().get("id")
+    
+    return {
+        "success": True,
+        "post_id": media_id,
+        "container_id": container_id,
+        "message": "Published Instagram container successfully"
+    }
 
 
 async def get_instagram_business_account(page_id: str, access_token: str) -> Optional[str]:
@@ -262,7 +293,7 @@ async def get_instagram_business_account(page_id: str, access_token: str) -> Opt
         "access_token": access_token
     }
     
-    response = requests.get(url, params=params)
+    response = await http_client.get(url, params=params)
     
     if response.status_code == 200:
         data = response.json()
@@ -272,6 +303,16 @@ async def get_instagram_business_account(page_id: str, access_token: str) -> Opt
         return None
 
 
+def is_invalid_account_error(result: Dict) -> bool:
+    """Tạo container lỗi do ID tài khoản không đúng (Graph API code 100: object không tồn tại / không hỗ trợ)"""
+    if result.get("step") not in ("create_container", "create_item_container"):
+        return False
+    error = result.get("error") or {}
+    if isinstance(error, dict) and isinstance(error.get("error"), dict):
+        error = error["error"]
+    return isinstance(error, dict) and error.get("code") == 100
+
+
 async def post_carousel_to_instagram(
     instagram_business_account_id: str,
     access_token: str,
@@ -284,7 +325,7 @@ async def post_carousel_to_instagram(
     Instagram Carousel có thể chứa 2-10 items (ảnh hoặc video)
     
     Flow:
-    1. Tạo container cho từng item (không có caption)
+    1. Tạo container cho tất cả item song song (không có caption), chờ tất cả FINISHED
     2. Tạo carousel container với list item containers và caption
     3. Publish carousel container
     
@@ -320,47 +361,38 @@ async def post_carousel_to_instagram(
         }
     
     try:
-        # Step 1: Create container cho từng item
-        item_container_ids = []
+        # Step 1: Create container cho tất cả item song song
+        print(f"🔄 [Instagram Carousel] Creating {len(media_urls)} item containers concurrently")
+        semaphore = asyncio.Semaphore(settings.CAROUSEL_ITEM_CONCURRENCY)
+        item_results = await asyncio.gather(*[
+            _create_carousel_item_container(instagram_business_account_id, access_token, idx, media_url, semaphore)
+            for idx, media_url in enumerate(media_urls)
+        ])
         
-        for idx, media_url in enumerate(media_urls):
-            print(f"🔄 [Instagram Carousel] Creating item container {idx + 1}/{len(media_urls)}")
-            
-            # Detect media type từ URL (image or video)
-            is_video = media_url.lower().endswith(('.mp4', '.mov', '.avi'))
-            
-            create_url = f"https://graph.facebook.com/v21.0/{instagram_business_account_id}/media"
-            
-            if is_video:
-                create_data = {
-                    "media_type": "VIDEO",
-                    "video_url": media_url,
-                    "is_carousel_item": True,
-                    "access_token": access_token
-                }
-            else:
-                create_data = {
-                    "image_url": media_url,
-                    "is_carousel_item": True,
-                    "access_token": access_token
-                }
-            
-            create_response = requests.post(create_url, json=create_data)
-            
-            if create_response.status_code != 200:
-                error_data = create_response.json()
-                print(f"❌ [Instagram Carousel] Failed to create item {idx + 1}: {error_data}")
+        for idx, item_result in enumerate(item_results):
+            if not item_result.get("success"):
+                print(f"❌ [Instagram Carousel] Failed to create item {idx + 1}: {item_result.get('error')}")
                 return {
                     "success": False,
-                    "error": error_data,
+                    "error": item_result.get("error"),
                     "message": f"Failed to create carousel item {idx + 1}",
                     "step": "create_item_container",
                     "item_index": idx
                 }
-            
-            container_id = create_response.json().get("id")
-            item_container_ids.append(container_id)
-            print(f"✅ [Instagram Carousel] Item container {idx + 1} created: {container_id}")
+        
+        item_container_ids = [item_result["container_id"] for item_result in item_results]
+        
+        # Chỉ tạo carousel khi mọi item container đã FINISHED
+        ready = await _wait_for_item_containers(item_container_ids, access_token)
+        if not ready.get("success"):
+            print(f"❌ [Instagram Carousel] Item containers not ready: {ready.get('error')}")
+            return {
+                "success": False,
+                "error": ready.get("error"),
+                "message": "Carousel item containers not ready",
+                "step": "wait_item_containers",
+                "item_containers": item_container_ids
+            }
         
         # Step 2: Create carousel container
         print(f"🔄 [Instagram Carousel] Creating carousel container with {len(item_container_ids)} items")
@@ -373,7 +405,7 @@ async def post_carousel_to_instagram(
             "access_token": access_token
         }
         
-        carousel_response = requests.post(carousel_url, json=carousel_data)
+        carousel_response = await http_client.post(carousel_url, json=carousel_data)
         
         if carousel_response.status_code != 200:
             error_data = carousel_response.json()
@@ -398,35 +430,19 @@ async def post_carousel_to_instagram(
             "access_token": access_token
         }
         
-        publish_response = requests.post(publish_url, json=publish_data)
+        publish_response = await http_client.post(publish_url, json=publish_data)
         
         if publish_response.status_code == 200:
             result = publish_response.json()
             media_id = result.get("id")
             print(f"✅ [Instagram Carousel] Published successfully: {media_id}")
             
-            # Get permalink
-            permalink = None
-            try:
-                media_info_url = f"https://graph.facebook.com/v21.0/{media_id}"
-                media_info_params = {
-                    "fields": "permalink",
-                    "access_token": access_token
-                }
-                media_info_response = requests.get(media_info_url, params=media_info_params)
-                if media_info_response.status_code == 200:
-                    permalink = media_info_response.json().get("permalink")
-                    print(f"🔗 [Instagram Carousel] Permalink: {permalink}")
-            except Exception as e:
-                print(f"⚠️ [Instagram Carousel] Could not fetch permalink: {e}")
-            
             return {
                 "success": True,
                 "post_id": media_id,
                 "container_id": carousel_container_id,
                 "item_containers": item_container_ids,
                 "item_count": len(item_container_ids),
-                "permalink": permalink,
                 "message": f"Posted carousel with {len(item_container_ids)} items to Instagram successfully"
             }
         else:
@@ -451,3 +467,107 @@ async def post_carousel_to_instagram(
             "step": "exception"
         }
 
+
+async def _create_carousel_item_container(
+    instagram_business_account_id: str,
+    access_token: str,
+    idx: int,
+    media_url: str,
+    semaphore: asyncio.Semaphore
+) -> Dict:
+    """Tạo container cho 1 item của carousel (is_carousel_item=True)"""
+    # Detect media type từ URL (image or video)
+    is_video = media_url.lower().endswith(('.mp4', '.mov', '.avi'))
+    
+    create_url = f"https://graph.facebook.com/v21.0/{instagram_business_account_id}/media"
+    
+    if is_video:
+        create_data = {
+            "media_type": "VIDEO",
+            "video_url": media_url,
+            "is_carousel_item": True,
+            "access_token": access_token
+        }
+    else:
+        create_data = {
+            "image_url": media_url,
+            "is_carousel_item": True,
+            "access_token": access_token
+        }
+    
+    async with semaphore:
+        create_response = await http_client.post(create_url, json=create_data)
+    
+    if create_response.status_code != 200:
+        return {
+            "success": False,
+            "error": create_response.json()
+        }
+    
+    container_id = create_response.json().get("id")
+    print(f"✅ [Instagram Carousel] Item container {idx + 1} created: {container_id}")
+    return {
+        "success": True,
+        "container_id": container_id
+    }
+
+
+async def _wait_for_item_containers(container_ids: List[str], access_token: str) -> Dict:
+    """
+    Poll trạng thái của nhiều container cùng lúc cho tới khi tất cả FINISHED
+    
+    Dùng multi-id lookup của Graph API: GET /?ids=id1,id2,...&fields=status_code
+    status_code: IN_PROGRESS | FINISHED | ERROR | EXPIRED | PUBLISHED
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.CONTAINER_POLL_TIMEOUT_SECONDS
+    interval = settings.CONTAINER_POLL_INTERVAL_SECONDS
+    pending = list(container_ids)
+    
+    while True:
+        response = await http_client.get(
+            "https://graph.facebook.com/v21.0/",
+            params={
+                "ids": ",".join(pending),
+                "fields": "status_code,status",
+                "access_token": access_token
+            }
+        )
+        if response.status_code != 200:
+            return {
+                "success": False,
+                "error": response.json()
+            }
+        
+        statuses = response.json()
+        still_pending = []
+        for container_id in pending:
+            info = statuses.get(container_id, {})
+            status_code = info.get("status_code")
+            if status_code in ("FINISHED", "PUBLISHED"):
+                continue
+            if status_code in ("ERROR", "EXPIRED"):
+                return {
+                    "success": False,
+                    "error": {
+                        "message": f"Carousel item container {container_id} {status_code}: {info.get('status', '')}"
+                    }
+                }
+            still_pending.append(container_id)
+        
+        if not still_pending:
+            return {"success": True}
+        
+        if loop.time() >= deadline:
+            return {
+                "success": False,
+                "error": {
+                    "message": f"Timed out waiting for carousel item containers: {', '.join(still_pending)}",
+                    "is_transient": True
+                }
+            }
+        
+        print(f"⏳ [Instagram Carousel] {len(still_pending)}/{len(container_ids)} item containers in progress")
+        pending = still_pending
+        await asyncio.sleep(interval)
+        interval = min(interval * 1.5, settings.CONTAINER_POLL_MAX_INTERVAL_SECONDS)
@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, inspect, func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
 import sys
 sys.path.append('..')
@@ -137,6 +138,62 @@ class PageService:
             data["token_expires_at"] = expires_at
         return await self.update(page_id, data)
     
+    async def bulk_upsert(
+        self,
+        rows: List[dict],
+        update_fields: List[str],
+        keep_existing: tuple = ("refresh_token",)
+    ) -> List[Page]:
+        """
+        Insert/update nhiều page trong một câu lệnh và một transaction
+        INSERT ... ON CONFLICT (platform_id, page_id) DO UPDATE (unique uq_platform_page)
+        
+        Args:
+            rows: Dữ liệu page (mỗi row phải có platform_id và page_id)
+            update_fields: Cột được cập nhật khi page đã tồn tại
+            keep_existing: Cột giữ giá trị cũ nếu giá trị mới là NULL
+                (VD: Google chỉ trả refresh_token ở lần consent đầu)
+        
+        Returns:
+            List[Page]: Các page sau khi upsert
+        """
+        if not rows:
+            return []
+        
+        # Một page xuất hiện 2 lần trong cùng câu lệnh -> ON CONFLICT lỗi, giữ bản cuối
+        unique_rows = {}
+        for row in rows:
+            row = dict(row)
+            if isinstance(row.get('token_expires_at'), str):
+                from dateutil import parser
+                try:
+                    row['token_expires_at'] = parser.parse(row['token_expires_at'])
+                except (ValueError, OverflowError):
+                    row['token_expires_at'] = None
+            unique_rows[(row['platform_id'], row['page_id'])] = row
+        
+        stmt = insert(Page).values(list(unique_rows.values()))
+        set_ = {}
+        for field in update_fields:
+            if field in keep_existing:
+                set_[field] = func.coalesce(getattr(stmt.excluded, field), getattr(Page, field))
+            else:
+                set_[field] = getattr(stmt.excluded, field)
+        set_["updated_at"] = datetime.utcnow()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Page.platform_id, Page.page_id],
+            set_=set_
+        ).returning(Page)
+        
+        try:
+            result = await self.db.execute(stmt, execution_options={"populate_existing": True})
+            pages = list(result.scalars().all())
+            await self.db.commit()
+            return pages
+        except Exception:
+            await self.db.rollback()
+            raise
+    
     async def sync_follower_count(self, page_id: int, follower_count: int) -> Optional[Dict]:
         """Sync follower count and update last sync time"""
         data = {
@@ -157,9 +214,9 @@ class PageService:
         if not page:
             return None
         
-        # Get platform data if relationship is loaded
+        # Get platform data if relationship is loaded (không lazy load: session async)
         platform_data = None
-        if hasattr(page, 'platform') and page.platform:
+        if 'platform' not in inspect(page).unloaded and page.platform:
             platform_data = {
                 "id": page.platform.id,
                 "name": page.platform.name,
@@ -178,6 +235,7 @@ class PageService:
             "access_token": page.access_token,
             "refresh_token": getattr(page, 'refresh_token', None),  # Thêm refresh_token
             "token_expires_at": page.token_expires_at.isoformat() if page.token_expires_at else None,
+            "instagram_account_id": page.instagram_account_id,
             "status": page.status.value if hasattr(page.status, 'value') else page.status,
             "follower_count": page.follower_count,
             "created_by": page.created_by,
@@ -0,0 +1,243 @@
+"""
+Permalink Service - Lấy permalink sau khi publish, ngoài luồng đăng bài
+
+Publisher chỉ trả media id; post được đánh dấu published ngay với URL mặc định,
+sau đó permalink_resolver:
+- Gom các media id đang chờ trong PERMALINK_BATCH_INTERVAL_SECONDS
+- Instagram: gửi chung trong Graph API batch request (tối đa 50 request / batch, nhóm theo access token)
+- Threads: graph.threads.net không hỗ trợ batch -> GET song song có giới hạn
+- Cập nhật Post.platform_post_url khi có permalink
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import update
+
+from config.database import async_session_maker
+from core.config import settings
+from models.model import Post
+from services.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+
+GRAPH_BATCH_URL = "https://graph.facebook.com/v21.0/"
+GRAPH_BATCH_MAX_SIZE = 50
+THREADS_MEDIA_URL = "https://graph.threads.net/v1.0/{media_id}"
+
+
+@dataclass
+class PermalinkRequest:
+    """Một media đang chờ lấy permalink"""
+    post_id: int
+    platform: str
+    media_id: str
+    access_token: str
+    attempts: int = 0
+
+
+class PermalinkResolver:
+    """Hàng đợi lấy permalink chạy nền, gửi theo batch"""
+
+    def __init__(self):
+        self._queue: List[PermalinkRequest] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._resolved = 0
+        self._failed = 0
+        self._batches = 0
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("🔗 Permalink resolver started")
+
+    async def shutdown(self):
+        """Dừng loop, gửi nốt các request còn trong hàng đợi"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._queue:
+            try:
+                await asyncio.wait_for(self._flush(), timeout=10)
+            except Exception as e:
+                logger.warning(f"⚠️ Dropped {len(self._queue)} pending permalink lookups: {str(e)}")
+        self._queue.clear()
+
+    def enqueue(self, post_id: int, platform: str, media_id: str, access_token: str):
+        """Thêm media vào hàng đợi; platform_post_url được cập nhật ở lần flush tiếp theo"""
+        if not media_id:
+            return
+        self._queue.append(PermalinkRequest(
+            post_id=post_id,
+            platform=platform,
+            media_id=str(media_id),
+            access_token=access_token
+        ))
+        if len(self._queue) >= GRAPH_BATCH_MAX_SIZE:
+            self._wakeup.set()
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": len(self._queue),
+            "resolved": self._resolved,
+            "failed": self._failed,
+            "batches": self._batches
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.PERMALINK_BATCH_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if self._queue:
+                    await self._flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Permalink resolver error: {str(e)}")
+
+    async def _flush(self):
+        requests, self._queue = self._queue, []
+
+        by_platform: Dict[str, List[PermalinkRequest]] = defaultdict(list)
+        for request in requests:
+            by_platform[request.platform].append(request)
+
+        permalinks: Dict[int, str] = {}
+        retry: List[PermalinkRequest] = []
+
+        if by_platform.get("instagram"):
+            found, missing = await self._resolve_graph_batch(by_platform["instagram"])
+            permalinks.update(found)
+            retry.extend(missing)
+        if by_platform.get("threads"):
+            found, missing = await self._resolve_threads(by_platform["threads"])
+            permalinks.update(found)
+            retry.extend(missing)
+
+        if permalinks:
+            await self._save_permalinks(requests, permalinks)
+
+        for request in retry:
+            request.attempts += 1
+            if request.attempts < settings.PERMALINK_MAX_ATTEMPTS:
+                self._queue.append(request)
+            else:
+                self._failed += 1
+                logger.warning(f"⚠️ Could not fetch permalink for post {request.post_id} ({request.platform} media {request.media_id})")
+
+    async def _resolve_graph_batch(self, requests: List[PermalinkRequest]):
+        """Instagram: một Graph API batch request cho tối đa 50 media cùng access token"""
+        found: Dict[int, str] = {}
+        missing: List[PermalinkRequest] = []
+
+        by_token: Dict[str, List[PermalinkRequest]] = defaultdict(list)
+        for request in requests:
+            by_token[request.access_token].append(request)
+
+        batches = []
+        for access_token, token_requests in by_token.items():
+            for i in range(0, len(token_requests), GRAPH_BATCH_MAX_SIZE):
+                batches.append((access_token, token_requests[i:i + GRAPH_BATCH_MAX_SIZE]))
+
+        async def send(access_token: str, batch: List[PermalinkRequest]):
+            payload = [
+                {"method": "GET", "relative_url": f"{request.media_id}?fields=permalink"}
+                for request in batch
+            ]
+            try:
+                response = await http_client.post(GRAPH_BATCH_URL, data={
+                    "batch": json.dumps(payload),
+                    "include_headers": "false",
+                    "access_token": access_token
+                })
+                self._batches += 1
+                if response.status_code != 200:
+                    logger.warning(f"⚠️ Graph batch request failed (HTTP {response.status_code}): {response.text[:200]}")
+                    missing.extend(batch)
+                    return
+                results = response.json()
+            except Exception as e:
+                logger.warning(f"⚠️ Graph batch request error: {str(e)}")
+                missing.extend(batch)
+                return
+
+            for request, item in zip(batch, results):
+                # Item null: request trong batch bị timeout phía Graph API
+                permalink = None
+                if item and item.get("code") == 200:
+                    try:
+                        permalink = json.loads(item.get("body") or "{}").get("permalink")
+                    except json.JSONDecodeError:
+                        permalink = None
+                if permalink:
+                    found[request.post_id] = permalink
+                else:
+                    missing.append(request)
+
+        await asyncio.gather(*[send(access_token, batch) for access_token, batch in batches])
+        return found, missing
+
+    async def _resolve_threads(self, requests: List[PermalinkRequest]):
+        """Threads API không có batch endpoint -> GET từng media, chạy song song có giới hạn"""
+        found: Dict[int, str] = {}
+        missing: List[PermalinkRequest] = []
+        semaphore = asyncio.Semaphore(settings.PERMALINK_THREADS_CONCURRENCY)
+
+        async def fetch(request: PermalinkRequest):
+            async with semaphore:
+                try:
+                    response = await http_client.get(
+                        THREADS_MEDIA_URL.format(media_id=request.media_id),
+                        params={"fields": "permalink", "access_token": request.access_token}
+                    )
+                    permalink = response.json().get("permalink") if response.status_code == 200 else None
+                except Exception as e:
+                    logger.warning(f"⚠️ Threads permalink error for media {request.media_id}: {str(e)}")
+                    permalink = None
+            if permalink:
+                found[request.post_id] = permalink
+            else:
+                missing.append(request)
+
+        await asyncio.gather(*[fetch(request) for request in requests])
+        return found, missing
+
+    async def _save_permalinks(self, requests: List[PermalinkRequest], permalinks: Dict[int, str]):
+        media_ids = {request.post_id: request.media_id for request in requests}
+        try:
+            async with async_session_maker() as session:
+                for post_id, permalink in permalinks.items():
+                    # Chỉ cập nhật khi post vẫn trỏ tới media này (post có thể đã bị đăng lại)
+                    await session.execute(
+                        update(Post)
+                        .where(Post.id == post_id)
+                        .where(Post.platform_post_id == media_ids[post_id])
+                        .values(platform_post_url=permalink)
+                    )
+                await session.commit()
+            self._resolved += len(permalinks)
+            logger.info(f"🔗 Updated permalink for {len(permalinks)} post(s)")
+        except Exception as e:
+            logger.error(f"❌ Could not save permalinks: {str(e)}")
+
+
+# Global instance
+permalink_resolver = PermalinkResolver()
@@ -1,20 +1,39 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, text
 from sqlalchemy.orm import selectinload
 import sys
 import os
+import asyncio
+import random
 sys.path.append('..')
 from models.model import Post, PostAnalytics, Page, User, Template, Platform
-from typing import List, Optional, Dict
-from datetime import datetime
+from typing import List, Optional, Dict, Union
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from services.facebook_page_service import post_to_facebook_page
-from services.instagram_service import post_to_instagram
+from services.instagram_service import (
+    post_to_instagram,
+    get_instagram_business_account,
+    is_invalid_account_error
+)
 from services.tiktok_service import post_to_tiktok
 from services.threads_service import post_to_threads
 from services.youtube_service import YouTubeService
+from services.youtube_token_manager import youtube_token_manager
+from services.token_sweeper import token_sweeper
 from services.image_processing_service import ImageProcessingService
+from services.image_process_pool import image_process_pool
+from services.video_processing_service import video_processing_service
+from services.image_utils import get_absolute_path_from_url, is_localhost_url
 from services.storage_service import storage_service
-from utils.timezone_utils import format_datetime_gmt7, datetime_to_iso_gmt7
+from services.page_service import PageService
+from services.http_client import http_client
+from services.permalink_service import permalink_resolver
+from services import retry_service
+from services.circuit_breaker import circuit_breakers
+from utils.timezone_utils import format_datetime_gmt7, datetime_to_iso_gmt7, now_utc
+from core.config import settings
+from config.database import async_session_maker
 
 
 class PostService:
@@ -153,13 +172,15 @@ class PostService:
                 - page_id: int
                 - user_id: int
                 - status: str ('draft', 'published', 'scheduled')
-                - media_files: List[bytes] (optional) - File data để upload lên FB, TikTok, YouTube
+                - media_files: List[bytes | Path] (optional) - File để upload lên FB, TikTok, YouTube
+                  (file upload từ router là Path tới file trên disk, không đọc vào RAM)
                 - media_urls: List[str] (optional) - URLs công khai cho Instagram
                 - media_type: str (optional, 'image' or 'video')
                 - scheduled_at: datetime (optional)
                 - image_frame_template_id: int (optional) - ID của frame cho ảnh
                 - video_frame_template_id: int (optional) - ID của frame cho video
                 - watermark_template_id: int (optional) - ID của watermark
+                - video_preset: str (optional) - Encoder preset khi ghép frame video (fast / balanced / quality)
         """
         # Extract media info và template IDs trước khi tạo post
         media_files = data.pop('media_files', [])
@@ -168,78 +189,92 @@ class PostService:
         image_frame_template_id = data.pop('image_frame_template_id', None)
         video_frame_template_id = data.pop('video_frame_template_id', None)
         watermark_template_id = data.pop('watermark_template_id', None)
+        video_preset = data.pop('video_preset', None)
         
         # Xử lý ghép frame/watermark vào media nếu có
+        # Video đã ghép frame là file tạm: xóa sau khi đã lưu storage / đăng xong
+        temp_media: List[Path] = []
         if media_files and (image_frame_template_id or video_frame_template_id or watermark_template_id):
             media_files = await self._apply_templates_to_media(
                 media_files,
                 media_type,
                 image_frame_template_id,
                 video_frame_template_id,
-                watermark_template_id
+                watermark_template_id,
+                video_preset=video_preset,
+                temp_media=temp_media
             )
         
-        # Tạo post trong database trước (để có post_id)
-        post = Post(**data)
-        self.db.add(post)
-        await self.db.commit()
-        await self.db.refresh(post)
+        try:
+            # Tạo post trong database trước (để có post_id)
+            post = Post(**data)
+            self.db.add(post)
+            await self.db.commit()
+            await self.db.refresh(post)
         
-        # Lưu media files vào storage cho scheduled posts
-        if post.status.value == 'scheduled' or post.status == 'scheduled':
-            if 'post_metadata' not in data:
-                post.post_metadata = {}
-            else:
-                post.post_metadata = data.get('post_metadata', {})
+            # Lưu media files vào storage cho scheduled posts
+            if post.status.value == 'scheduled' or post.status == 'scheduled':
+                if 'post_metadata' not in data:
+                    post.post_metadata = {}
+                else:
+                    post.post_metadata = data.get('post_metadata', {})
             
-            # Lưu media URLs (cho Instagram/Threads)
-            if media_urls:
-                post.post_metadata['media_urls'] = media_urls
+                # Lưu media URLs (cho Instagram/Threads)
+                if media_urls:
+                    post.post_metadata['media_urls'] = media_urls
             
-            # Lưu media files vào storage (cho Facebook/TikTok/YouTube)
-            if media_files:
-                try:
-                    saved_paths = await storage_service.save_media_for_post(
-                        post_id=post.id,
-                        media_files=media_files,
-                        media_type=media_type
-                    )
-                    post.post_metadata['media_paths'] = saved_paths
-                    post.post_metadata['media_type'] = media_type
-                    print(f"✅ Saved {len(saved_paths)} media file(s) for scheduled post {post.id}")
-                except Exception as e:
-                    print(f"⚠️ Warning: Could not save media files for scheduled post: {str(e)}")
+                # Lưu media files vào storage (cho Facebook/TikTok/YouTube)
+                if media_files:
+                    try:
+                        saved_paths = await storage_service.save_media_for_post(
+                            post_id=post.id,
+                            media_files=media_files,
+                            media_type=media_type
+                        )
+                        post.post_metadata['media_paths'] = saved_paths
+                        post.post_metadata['media_type'] = media_type
+                        print(f"✅ Saved {len(saved_paths)} media file(s) for scheduled post {post.id}")
+                    except Exception as e:
+                        print(f"⚠️ Warning: Could not save media files for scheduled post: {str(e)}")
             
-            # Update post metadata
-            await self.db.commit()
-            await self.db.refresh(post)
+                # Update post metadata (NOTIFY sau khi media đã lưu để scheduler không đăng thiếu media)
+                await self._notify_schedule_change(post)
+                await self.db.commit()
+                await self.db.refresh(post)
         
-        # Nếu status = 'published', đăng lên platform ngay
-        if post.status.value == 'published' or post.status == 'published':
-            await self._publish_to_platform(post, media_files, media_type, media_urls)
+            # Nếu status = 'published', đăng lên platform ngay
+            if post.status.value == 'published' or post.status == 'published':
+                await self._publish_to_platform(post, media_files, media_type, media_urls)
         
-        return self._to_dict(post)
+            return self._to_dict(post)
+        finally:
+            for path in temp_media:
+                path.unlink(missing_ok=True)
     
     async def _apply_templates_to_media(
         self,
-        media_files: List[bytes],
+        media_files: List,
         media_type: str,
         image_frame_template_id: Optional[int],
         video_frame_template_id: Optional[int],
-        watermark_template_id: Optional[int]
-    ) -> List[bytes]:
+        watermark_template_id: Optional[int],
+        video_preset: Optional[str] = None,
+        temp_media: Optional[List[Path]] = None
+    ) -> List:
         """
         Áp dụng frame hoặc watermark vào media files
         
         Args:
-            media_files: Danh sách file data (bytes)
+            media_files: Danh sách file data (bytes) hoặc Path tới file trên disk; video có thể là URL thư viện (localhost)
             media_type: 'image' hoặc 'video'
             image_frame_template_id: ID của frame template cho ảnh
             video_frame_template_id: ID của frame template cho video
             watermark_template_id: ID của watermark template
+            video_preset: Encoder preset cho video (mặc định VIDEO_ENCODER_PRESET)
+            temp_media: Nhận các file tạm được tạo ra (video đã ghép frame), caller xóa khi dùng xong
             
         Returns:
-            Danh sách media files đã được xử lý
+            Danh sách media files đã được xử lý (video đã ghép frame trả về dạng Path)
         """
         try:
             processed_files = []
@@ -259,58 +294,69 @@ class PostService:
             
             print(f"🎨 Applying template '{template_to_use.get('name')}' to {len(media_files)} media file(s)")
             
+            if media_type == 'image':
+                # Xử lý ảnh tốn CPU: chạy song song trong process pool, không chặn event loop
+                results = await image_process_pool.map(
+                    ImageProcessingService.process_image_with_template,
+                    media_files,
+                    frame_url=template_to_use.get('frame_image_url') if image_frame_template_id else None,
+                    watermark_url=template_to_use.get('watermark_image_url') if watermark_template_id else None,
+                    watermark_position=template_to_use.get('watermark_position', 'bottom-right'),
+                    watermark_opacity=template_to_use.get('watermark_opacity', 0.8),
+                    aspect_ratio=template_to_use.get('aspect_ratio')
+                )
+                for idx, (file_data, result) in enumerate(zip(media_files, results)):
+                    if isinstance(result, BaseException):
+                        print(f"  ⚠️ Error processing media {idx + 1}: {str(result)}")
+                        # Nếu lỗi, giữ file gốc
+                        processed_files.append(file_data)
+                    else:
+                        processed_files.append(result)
+                        print(f"  ✅ Processed image {idx + 1}/{len(media_files)}")
+                return processed_files
+            
             # Xử lý từng file
             for idx, file_data in enumerate(media_files):
                 try:
-                    if media_type == 'image':
-                        # Xử lý ảnh
-                        frame_url = template_to_use.get('frame_image_url') if image_frame_template_id else None
-                        watermark_url = template_to_use.get('watermark_image_url') if watermark_template_id else None
-                        
-                        processed_data = ImageProcessingService.process_image_with_template(
-                            content_image_data=file_data,
-                            frame_url=frame_url,
-                            watermark_url=watermark_url,
-                            watermark_position=template_to_use.get('watermark_position', 'bottom-right'),
-                            watermark_opacity=template_to_use.get('watermark_opacity', 0.8),
-                            aspect_ratio=template_to_use.get('aspect_ratio')
-                        )
-                        processed_files.append(processed_data)
-                        print(f"  ✅ Processed image {idx + 1}/{len(media_files)}")
-                    
-                    elif media_type == 'video':
-                        # Xử lý video (cần lưu tạm file)
-                        import tempfile
-                        import os
+                    if media_type == 'video':
+                        frame_url = template_to_use.get('frame_image_url')
+                        if not frame_url:
+                            processed_files.append(file_data)
+                            continue
                         
-                        # Lưu video gốc vào file tạm
-                        temp_input = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-                        temp_input.write(file_data)
-                        temp_input.close()
+                        # ffmpeg đọc thẳng file trên disk; chỉ video upload dạng bytes mới cần ghi ra file tạm
+                        input_path = None
+                        if isinstance(file_data, Path):
+                            video_path = file_data
+                        elif isinstance(file_data, str):
+                            local_path = get_absolute_path_from_url(file_data) if is_localhost_url(file_data) else None
+                            if not local_path or not os.path.exists(local_path):
+                                print(f"  ⚠️ Video {idx + 1} is not a local file, skipping frame")
+                                processed_files.append(file_data)
+                                continue
+                            video_path = Path(local_path)
+                        else:
+                            import tempfile
+                            fd, temp_name = tempfile.mkstemp(suffix='.mp4', prefix='video_input_')
+                            os.close(fd)
+                            input_path = video_path = Path(temp_name)
+                            await asyncio.to_thread(video_path.write_bytes, file_data)
                         
-                        # Áp dụng frame
-                        frame_url = template_to_use.get('frame_image_url')
-                        if frame_url:
-                            output_path = ImageProcessingService.apply_frame_to_video(
-                                video_path=temp_input.name,
-                                frame_url=frame_url,
-                                aspect_ratio=template_to_use.get('aspect_ratio')
+                        try:
+                            output_path = await video_processing_service.apply_frame(
+                                video_path,
+                                frame_url,
+                                preset=video_preset,
+                                label=f"template '{template_to_use.get('name')}' video {idx + 1}"
                             )
-                            
-                            # Đọc video đã xử lý
-                            with open(output_path, 'rb') as f:
-                                processed_data = f.read()
-                            
-                            processed_files.append(processed_data)
-                            
-                            # Xóa file tạm
-                            os.unlink(output_path)
-                            print(f"  ✅ Processed video {idx + 1}/{len(media_files)}")
-                        else:
-                            processed_files.append(file_data)
+                        finally:
+                            if input_path is not None:
+                                input_path.unlink(missing_ok=True)
                         
-                        # Xóa file input tạm
-                        os.unlink(temp_input.name)
+                        if temp_media is not None:
+                            temp_media.append(output_path)
+                        processed_files.append(output_path)
+                        print(f"  ✅ Processed video {idx + 1}/{len(media_files)}")
                     
                     else:
                         # Không xử lý, giữ nguyên
@@ -352,17 +398,23 @@ class PostService:
             print(f"Error getting template {template_id}: {str(e)}")
             return None
     
-    async def _publish_to_platform(self, post: Post, media_files: List[bytes], media_type: str, media_urls: List[str] = []):
+    async def _publish_to_platform(self, post: Post, media_files: List[Union[bytes, Path]], media_type: str, media_urls: List[str] = []):
         """
         Đăng bài lên platform (Facebook, Instagram, TikTok, etc.)
         Upload file trực tiếp lên platform (không lưu server)
         
         Args:
             post: Post object
-            media_files: Danh sách file data (bytes) để upload (cho FB, TikTok, YouTube)
+            media_files: Danh sách file data (bytes) hoặc Path tới file trên disk để upload (cho FB, TikTok, YouTube)
             media_type: Loại media ('image' or 'video')
             media_urls: Danh sách URLs công khai (cho Instagram)
+        
+        Các hàm _publish_to_* trả về kết quả phân loại của _mark_failed
+        (True = lỗi tạm thời, False = lỗi vĩnh viễn, None = không lỗi), dùng cho circuit breaker
         """
+        platform_name = "Unknown"
+        breaker = None
+        failure = None
         try:
             # Lấy thông tin page và platform
             query = (
@@ -382,21 +434,37 @@ class PostService:
             # Xác định platform và gọi service tương ứng
             platform_name = page.platform.name if page.platform else "Unknown"
             
+            # Token hết hạn mà không refresh được -> fail ngay, không tốn một lượt gọi API
+            token_ok, token_error = await token_sweeper.ensure_publishable(page)
+            if not token_ok:
+                print(f"❌ Post {post.id}: {token_error}")
+                await self._mark_failed(post, platform_name, token_error)
+                return
+            
+            # Platform/endpoint đang gặp sự cố (circuit open) -> hoãn post, không gọi API
+            endpoint = media_type if (media_files or media_urls) else "text"
+            breaker = circuit_breakers.get(platform_name, endpoint)
+            allowed, retry_after = breaker.allow()
+            if not allowed:
+                breaker = None
+                await self._defer_post(post, platform_name, retry_after, media_files, media_type, media_urls)
+                return
+            
             # Routing đến service phù hợp với từng platform
             if platform_name.lower() == "facebook":
-                await self._publish_to_facebook(post, page, media_files, media_type)
+                failure = await self._publish_to_facebook(post, page, media_files, media_type)
             
             elif platform_name.lower() == "instagram":
-                await self._publish_to_instagram(post, page, media_urls, media_type)
+                failure = await self._publish_to_instagram(post, page, media_urls, media_type)
             
             elif platform_name.lower() == "threads":
-                await self._publish_to_threads(post, page, media_urls, media_type)
+                failure = await self._publish_to_threads(post, page, media_urls, media_type)
             
             elif platform_name.lower() == "tiktok":
-                await self._publish_to_tiktok(post, page, media_files, media_type)
+                failure = await self._publish_to_tiktok(post, page, media_files, media_type)
             
             elif platform_name.lower() == "youtube":
-                await self._publish_to_youtube(post, page, media_files, media_type)
+                failure = await self._publish_to_youtube(post, page, media_files, media_type)
             
             else:
                 raise Exception(f"Unsupported platform: {platform_name}")
@@ -406,68 +474,122 @@ class PostService:
             error_msg = str(e)
             print(f"❌ Error publishing post {post.id} to {platform_name}: {error_msg}")
             
-            await self.update(post.id, {
-                "status": "failed",
-                "error_message": error_msg,
-                "retry_count": post.retry_count + 1
-            })
+            failure = await self._mark_failed(
+                post, platform_name, error_msg, error=e,
+                media_files=media_files, media_type=media_type, media_urls=media_urls
+            )
             
             # Không raise exception để không block việc tạo post
             # Client vẫn nhận được post đã tạo, nhưng status = 'failed'
+        
+        if breaker is not None:
+            # Chỉ lỗi tạm thời mới tính là platform gặp sự cố
+            if failure:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+    
+    async def _defer_post(
+        self,
+        post: Post,
+        platform: str,
+        retry_after: float,
+        media_files: Optional[List],
+        media_type: str,
+        media_urls: Optional[List[str]]
+    ):
+        """
+        Hoãn post về 'scheduled' khi circuit của platform đang open
+        Không tính vào số lần retry; jitter để các post hoãn không dồn vào cùng một lúc
+        """
+        delay = retry_after + random.uniform(0, min(30, retry_after * 0.2))
+        deferred_to = now_utc() + timedelta(seconds=delay)
+        metadata = await self._persist_media_for_retry(post, media_files, media_type, media_urls)
+        await self.update(post.id, {
+            "status": "scheduled",
+            "scheduled_at": deferred_to,
+            "error_message": f"{platform} đang gián đoạn (circuit open), hoãn đăng bài",
+            "post_metadata": metadata
+        })
+        print(f"⏸️ Post {post.id}: {platform} circuit open, hoãn đến {format_datetime_gmt7(deferred_to)}")
     
-    async def _publish_to_facebook(self, post: Post, page: Page, media_files: List[bytes], media_type: str):
+    async def _publish_to_facebook(self, post: Post, page: Page, media_files: List[Union[bytes, Path]], media_type: str) -> Optional[bool]:
         """
         Đăng bài lên Facebook Page
         
         Args:
             post: Post object
             page: Page object với thông tin Facebook page
-            media_files: Danh sách file data (bytes)
+            media_files: Danh sách file data (bytes) hoặc Path tới file trên disk
             media_type: Loại media ('image' or 'video')
         """
+        failure = None
+        # Video trên disk: lưu resumable upload session để upload tiếp khi retry / restart
+        upload_state = None
+        on_progress = None
+        if media_type == "video" and media_files and isinstance(media_files[0], Path):
+            video_file = str(media_files[0])
+            saved_state = (post.post_metadata or {}).get('facebook_upload')
+            if saved_state and saved_state.get('file') == video_file:
+                upload_state = saved_state
+            on_progress = self._facebook_progress_saver(post.id, video_file)
+        
         try:
             result = await post_to_facebook_page(
                 page_id=page.page_id,  # FB page ID
                 access_token=page.access_token,
                 message=post.content,
                 media_files=media_files,
-                media_type=media_type
+                media_type=media_type,
+                upload_state=upload_state,
+                on_progress=on_progress
             )
             
+            # Session upload được lưu từ session DB khác -> nạp lại metadata trước khi ghi
+            if on_progress:
+                await self.db.refresh(post)
+            
             if result.get("success"):
                 # Update post với thông tin từ Facebook
                 fb_post_id = result.get("post_id") or result.get("video_id")
                 fb_post_url = f"https://www.facebook.com/{fb_post_id}"
                 
-                await self.update(post.id, {
+                values = {
                     "status": "published",
                     "published_at": datetime.utcnow(),
                     "platform_post_id": fb_post_id,
                     "platform_post_url": fb_post_url,
                     "error_message": None
-                })
+                }
+                if post.post_metadata and 'facebook_upload' in post.post_metadata:
+                    metadata = dict(post.post_metadata)
+                    metadata.pop('facebook_upload')
+                    values["post_metadata"] = metadata
+                await self.update(post.id, values)
                 
                 print(f"✅ Post {post.id} đã đăng thành công lên Facebook Page '{page.page_name}': {fb_post_url}")
             else:
                 # Đăng thất bại
                 error_msg = result.get("error", {}).get("message", "Unknown error")
-                await self.update(post.id, {
-                    "status": "failed",
-                    "error_message": f"Facebook error: {error_msg}",
-                    "retry_count": post.retry_count + 1
-                })
+                failure = await self._mark_failed(
+                    post, "facebook", f"Facebook error: {error_msg}", result=result,
+                    media_files=media_files, media_type=media_type
+                )
                 print(f"❌ Post {post.id} đăng lên Facebook Page '{page.page_name}' thất bại: {error_msg}")
         
         except Exception as e:
             error_msg = str(e)
-            await self.update(post.id, {
-                "status": "failed",
-                "error_message": f"Facebook exception: {error_msg}",
-                "retry_count": post.retry_count + 1
-            })
+            if on_progress:
+                await self.db.refresh(post)
+            failure = await self._mark_failed(
+                post, "facebook", f"Facebook exception: {error_msg}", error=e,
+                media_files=media_files, media_type=media_type
+            )
             print(f"❌ Exception khi đăng post {post.id} lên Facebook: {error_msg}")
+        
+        return failure
     
-    async def _publish_to_instagram(self, post: Post, page: Page, media_urls: List[str], media_type: str):
+    async def _publish_to_instagram(self, post: Post, page: Page, media_urls: List[str], media_type: str) -> Optional[bool]:
         """
         Đăng bài lên Instagram
         
@@ -484,38 +606,41 @@ class PostService:
             - Single image/video: 1 URL
             - Carousel: 2-10 URLs
         """
+        failure = None
         try:
             # Check media URLs
             if not media_urls or len(media_urls) == 0:
                 print(f"⚠️ Instagram posting cho post {post.id} cần media URL công khai")
-                await self.update(post.id, {
-                    "status": "failed",
-                    "error_message": "Instagram requires public media URL (HTTPS). Please provide valid URLs.",
-                    "retry_count": post.retry_count + 1
-                })
-                return
-            
-            # Determine post type: single or carousel
-            if len(media_urls) == 1:
-                # Single image/video
-                media_url = media_urls[0]
-                print(f"📤 [Instagram] Posting single media: {media_url}")
-                
-                # Đăng lên Instagram qua 2 bước (B1 + B2)
-                result = await post_to_instagram(
-                    instagram_business_account_id=page.page_id,
-                    access_token=page.access_token,
-                    caption=post.content,
-                    media_files=[],  # Không dùng files
-                    media_type=media_type,
-                    media_url=media_url
+                failure = await self._mark_failed(
+                    post, "instagram", "Instagram requires public media URL (HTTPS). Please provide valid URLs."
                 )
-            else:
+                return failure
+            
+            # Facebook Page: IG Business Account ID đã lưu trên page lúc connect (không gọi Graph API mỗi lần đăng)
+            # Page Instagram: page_id chính là IG Business Account ID
+            ig_account_id = page.instagram_account_id or page.page_id
+            
+            async def publish(account_id: str):
+                # Determine post type: single or carousel
+                if len(media_urls) == 1:
+                    # Single image/video
+                    media_url = media_urls[0]
+                    print(f"📤 [Instagram] Posting single media: {media_url}")
+                    
+                    # Đăng lên Instagram qua 2 bước (B1 + B2)
+                    return await post_to_instagram(
+                        instagram_business_account_id=account_id,
+                        access_token=page.access_token,
+                        caption=post.content,
+                        media_files=[],  # Không dùng files
+                        media_type=media_type,
+                        media_url=media_url
+                    )
                 # Carousel (2-10 items)
                 print(f"📤 [Instagram] Posting carousel with {len(media_urls)} items")
                 
-                result = await post_to_instagram(
-                    instagram_business_account_id=page.page_id,
+                return await post_to_instagram(
+                    instagram_business_account_id=account_id,
                     access_token=page.access_token,
                     caption=post.content,
                     media_files=[],
@@ -523,7 +648,27 @@ class PostService:
                     media_url=media_urls  # Pass list of URLs for carousel
                 )
             
-            if result.get("success"):
+            result = await publish(ig_account_id)
+            
+            if not result.get("success") and page.instagram_account_id and is_invalid_account_error(result):
+                # IG account liên kết với Facebook Page có thể đã đổi -> resolve lại, lưu lên page và thử lại một lần
+                fresh_account_id = await get_instagram_business_account(page.page_id, page.access_token)
+                if fresh_account_id and fresh_account_id != ig_account_id:
+                    print(f"🔄 [Instagram] Account ID changed {ig_account_id} -> {fresh_account_id}, retrying")
+                    async with async_session_maker() as session:
+                        await PageService(session).update(page.id, {"instagram_account_id": fresh_account_id})
+                    page.instagram_account_id = fresh_account_id
+                    ig_account_id = fresh_account_id
+                    result = await publish(ig_account_id)
+            
+            if result.get("success") and result.get("pending"):
+                # Video container đang xử lý -> container_poller publish khi FINISHED
+                await self._track_container(
+                    post, page, "instagram", result.get("container_id"), media_urls, account_id=ig_account_id
+                )
+                print(f"🔄 Post {post.id} đang chờ Instagram xử lý video (container: {result.get('container_id')})")
+            
+            elif result.get("success"):
                 # Update post với thông tin từ Instagram
                 ig_post_id = result.get("post_id")
                 container_id = result.get("container_id")
@@ -537,6 +682,8 @@ class PostService:
                     "platform_post_url": ig_post_url,
                     "error_message": None
                 })
+                # Permalink lấy sau qua Graph API batch, cập nhật platform_post_url khi có
+                permalink_resolver.enqueue(post.id, "instagram", ig_post_id, page.access_token)
                 
                 if len(media_urls) == 1:
                     print(f"✅ Post {post.id} đã đăng thành công lên Instagram '{page.page_name}': {ig_post_url}")
@@ -553,11 +700,10 @@ class PostService:
                 error_msg = result.get("error", {}).get("message", "Unknown error")
                 step_failed = result.get("step", "unknown")
                 
-                await self.update(post.id, {
-                    "status": "failed",
-                    "error_message": f"Instagram error at {step_failed}: {error_msg}",
-                    "retry_count": post.retry_count + 1
-                })
+                failure = await self._mark_failed(
+                    post, "instagram", f"Instagram error at {step_failed}: {error_msg}", result=result,
+                    media_type=media_type, media_urls=media_urls
+                )
                 
                 if len(media_urls) == 1:
                     print(f"❌ Post {post.id} đăng lên Instagram '{page.page_name}' thất bại tại {step_failed}: {error_msg}")
@@ -569,14 +715,15 @@ class PostService:
             
         except Exception as e:
             error_msg = str(e)
-            await self.update(post.id, {
-                "status": "failed",
-                "error_message": f"Instagram exception: {error_msg}",
-                "retry_count": post.retry_count + 1
-            })
+            failure = await self._mark_failed(
+                post, "instagram", f"Instagram exception: {error_msg}", error=e,
+                media_type=media_type, media_urls=media_urls
+            )
             print(f"❌ Exception khi đăng post {post.id} lên Instagram: {error_msg}")
+        
+        return failure
     
-    async def _publish_to_threads(self, post: Post, page: Page, media_urls: List[str], media_type: str):
+    async def _publish_to_threads(self, post: Post, page: Page, media_urls: List[str], media_type: str) -> Optional[bool]:
         """
         Đăng bài lên Threads
         
@@ -590,6 +737,7 @@ class PostService:
             Threads API yêu cầu media URL công khai (HTTPS)
             Flow: B1 (Create Container) → B2 (Publish Container)
         """
+        failure = None
         try:
             # Threads có thể đăng text-only, single image, hoặc carousel
             if media_urls and len(media_urls) > 0:
@@ -612,7 +760,12 @@ class PostService:
                 media_urls=media_urls  # Truyền toàn bộ danh sách URLs
             )
             
-            if result.get("success"):
+            if result.get("success") and result.get("pending"):
+                # Video container đang xử lý -> container_poller publish khi FINISHED
+                await self._track_container(post, page, "threads", result.get("container_id"), media_urls)
+                print(f"🔄 Post {post.id} đang chờ Threads xử lý video (container: {result.get('container_id')})")
+            
+            elif result.get("success"):
                 # Update post với thông tin từ Threads
                 threads_post_id = result.get("post_id")
                 container_id = result.get("container_id")
@@ -625,6 +778,8 @@ class PostService:
                     "platform_post_url": threads_post_url,
                     "error_message": None
                 })
+                # Permalink lấy sau (ngoài luồng đăng bài), cập nhật platform_post_url khi có
+                permalink_resolver.enqueue(post.id, "threads", threads_post_id, page.access_token)
                 
                 print(f"✅ Post {post.id} đã đăng thành công lên Threads '{page.page_name}': {threads_post_url}")
                 print(f"   📦 Container ID: {container_id}")
@@ -640,11 +795,10 @@ class PostService:
                 error_msg = result.get("error", {}).get("message", "Unknown error")
                 step_failed = result.get("step", "unknown")
                 
-                await self.update(post.id, {
-                    "status": "failed",
-                    "error_message": f"Threads error at {step_failed}: {error_msg}",
-                    "retry_count": post.retry_count + 1
-                })
+                failure = await self._mark_failed(
+                    post, "threads", f"Threads error at {step_failed}: {error_msg}", result=result,
+                    media_type=media_type, media_urls=media_urls
+                )
                 print(f"❌ Post {post.id} đăng lên Threads '{page.page_name}' thất bại tại {step_failed}: {error_msg}")
                 print(f"   📦 Container ID: {result.get('container_id')}")
                 if media_urls:
@@ -652,32 +806,30 @@ class PostService:
             
         except Exception as e:
             error_msg = str(e)
-            await self.update(post.id, {
-                "status": "failed",
-                "error_message": f"Threads exception: {error_msg}",
-                "retry_count": post.retry_count + 1
-            })
+            failure = await self._mark_failed(
+                post, "threads", f"Threads exception: {error_msg}", error=e,
+                media_type=media_type, media_urls=media_urls
+            )
             print(f"❌ Exception khi đăng post {post.id} lên Threads: {error_msg}")
+        
+        return failure
     
-    async def _publish_to_tiktok(self, post: Post, page: Page, media_files: List[bytes], media_type: str):
+    async def _publish_to_tiktok(self, post: Post, page: Page, media_files: List[Union[bytes, Path]], media_type: str) -> Optional[bool]:
         """
         Đăng video lên TikTok
         
         Args:
             post: Post object
             page: Page object với thông tin TikTok account
-            media_files: Danh sách file data (bytes) hoặc URL
+            media_files: Danh sách file data (bytes), Path tới file trên disk hoặc URL
             media_type: Loại media (TikTok chỉ hỗ trợ 'video')
         """
+        failure = None
         try:
             # TikTok chỉ hỗ trợ video
             if media_type != "video" or not media_files or len(media_files) == 0:
-                await self.update(post.id, {
-                    "status": "failed",
-                    "error_message": "TikTok only supports video posts",
-                    "retry_count": post.retry_count + 1
-                })
-                return
+                failure = await self._mark_failed(post, "tiktok", "TikTok only supports video posts")
+                return failure
             
             # Get video data (bytes hoặc download từ URL)
             video_data = media_files[0]
@@ -686,7 +838,6 @@ class PostService:
             if isinstance(video_data, str):
                 print(f"📥 Downloading video from URL for TikTok: {video_data}")
                 try:
-                    import requests
                     # Check if localhost URL
                     if 'localhost' in video_data or '127.0.0.1' in video_data:
                         # Read from disk
@@ -694,25 +845,22 @@ class PostService:
                         video_data = normalize_url(video_data)
                         file_path = get_absolute_path_from_url(video_data)
                         if file_path and os.path.exists(file_path):
-                            print(f"   ✅ Reading from disk: {file_path}")
-                            with open(file_path, 'rb') as f:
-                                video_data = f.read()
+                            # Truyền Path để TikTok service stream từng chunk từ disk
+                            print(f"   ✅ Streaming from disk: {file_path}")
+                            video_data = Path(file_path)
                         else:
                             raise Exception(f"Video file not found at: {file_path}")
                     else:
                         # Download from external URL
-                        response = requests.get(video_data, timeout=60)
-                        response.raise_for_status()
-                        video_data = response.content
+                        video_data = await http_client.download(video_data, timeout=60)
                         print(f"   ✅ Downloaded video: {len(video_data)} bytes")
                 except Exception as e:
-                    await self.update(post.id, {
-                        "status": "failed",
-                        "error_message": f"Failed to download video: {str(e)}",
-                        "retry_count": post.retry_count + 1
-                    })
+                    failure = await self._mark_failed(
+                        post, "tiktok", f"Failed to download video: {str(e)}", error=e,
+                        media_files=media_files, media_type=media_type
+                    )
                     print(f"❌ Failed to download video from URL: {str(e)}")
-                    return
+                    return failure
             
             # Đăng video lên TikTok
             result = await post_to_tiktok(
@@ -728,24 +876,12 @@ class PostService:
                 publish_id = result.get("publish_id")
                 
                 try:
-                    await self.update(post.id, {
-                        "status": "publishing",  # ✅ Video đang được xử lý (enum: publishing, not processing)
-                        "platform_post_id": publish_id,
-                        "error_message": None,
-                        "post_metadata": {  # ✅ Changed from "metadata" to "post_metadata"
-                            "tiktok_publish_id": publish_id,
-                            "status": "PROCESSING"  # TikTok API status (different from PostStatus enum)
-                        }
-                    })
-                    
-                    print(f"🔄 Post {post.id} đang được upload lên TikTok '{page.page_name}' (publish_id: {publish_id})")
+                    await self._track_tiktok_publish(post, page, publish_id, media_files, media_type)
+                    print(f"🔄 Post {post.id} đang được TikTok xử lý '{page.page_name}' (publish_id: {publish_id})")
                 except Exception as update_error:
                     print(f"⚠️ Warning: Failed to update post status after successful upload: {str(update_error)[:200]}")
                     print(f"   Video uploaded successfully with publish_id: {publish_id}")
                 
-                # TODO: Implement background job để check status và update khi video đã PUBLISHED
-                # Có thể dùng Celery hoặc APScheduler để poll status
-                
             else:
                 # Upload thất bại
                 error_data = result.get("error", "Unknown error")
@@ -759,46 +895,44 @@ class PostService:
                 if status_code:
                     error_msg = f"[{status_code}] {error_msg}"
                 
-                await self.update(post.id, {
-                    "status": "failed",
-                    "error_message": f"TikTok error: {error_msg}",
-                    "retry_count": post.retry_count + 1
-                })
+                failure = await self._mark_failed(
+                    post, "tiktok", f"TikTok error: {error_msg}", result=result,
+                    media_files=media_files, media_type=media_type
+                )
                 print(f"❌ Post {post.id} upload lên TikTok '{page.page_name}' thất bại: {error_msg}")
             
         except Exception as e:
             error_msg = str(e)[:500]  # ✅ Truncate để tránh quá dài
-            await self.update(post.id, {
-                "status": "failed",
-                "error_message": f"TikTok exception: {error_msg}",
-                "retry_count": post.retry_count + 1
-            })
+            failure = await self._mark_failed(
+                post, "tiktok", f"TikTok exception: {error_msg}", error=e,
+                media_files=media_files, media_type=media_type
+            )
             print(f"❌ Exception khi đăng post {post.id} lên TikTok: {error_msg}")
+        
+        return failure
     
-    async def _publish_to_youtube(self, post: Post, page: Page, media_files: List[bytes], media_type: str):
+    async def _publish_to_youtube(self, post: Post, page: Page, media_files: List[Union[bytes, Path]], media_type: str) -> Optional[bool]:
         """
         Đăng video lên YouTube
         
         Args:
             post: Post object
             page: Page object với thông tin YouTube channel
-            media_files: Danh sách file data (bytes) - video được upload từ máy
+            media_files: Danh sách file data (bytes) hoặc Path tới file trên disk - video được upload từ máy
             media_type: Loại media ('video')
         """
+        failure = None
         try:
             import os
             import tempfile
-            from services.youtube_service import YouTubeService
             
             # YouTube chỉ hỗ trợ video
             if media_type != "video" or not media_files or len(media_files) == 0:
                 print(f"⚠️ YouTube posting cho post {post.id} yêu cầu video file")
-                await self.update(post.id, {
-                    "status": "failed",
-                    "error_message": "YouTube only supports video posts. Please upload a video file.",
-                    "retry_count": post.retry_count + 1
-                })
-                return
+                failure = await self._mark_failed(
+                    post, "youtube", "YouTube only supports video posts. Please upload a video file."
+                )
+                return failure
             
             # YouTube API cần file path, không nhận bytes trực tiếp
             # Lưu video vào temp file
@@ -811,7 +945,6 @@ class PostService:
                 if isinstance(video_data, str):
                     print(f"📥 Downloading video from URL for YouTube: {video_data}")
                     try:
-                        import requests
                         # Check if localhost URL
                         if 'localhost' in video_data or '127.0.0.1' in video_data:
                             # Read from disk
@@ -819,35 +952,36 @@ class PostService:
                             video_data = normalize_url(video_data)
                             file_path = get_absolute_path_from_url(video_data)
                             if file_path and os.path.exists(file_path):
-                                print(f"   ✅ Reading from disk: {file_path}")
-                                with open(file_path, 'rb') as f:
-                                    video_data = f.read()
+                                print(f"   ✅ Using file on disk: {file_path}")
+                                video_data = Path(file_path)
                             else:
                                 raise Exception(f"Video file not found at: {file_path}")
                         else:
                             # Download from external URL
-                            response = requests.get(video_data, timeout=60)
-                            response.raise_for_status()
-                            video_data = response.content
+                            video_data = await http_client.download(video_data, timeout=60)
                             print(f"   ✅ Downloaded video: {len(video_data)} bytes")
                     except Exception as e:
-                        await self.update(post.id, {
-                            "status": "failed",
-                            "error_message": f"Failed to download video: {str(e)}",
-                            "retry_count": post.retry_count + 1
-                        })
+                        failure = await self._mark_failed(
+                            post, "youtube", f"Failed to download video: {str(e)}", error=e,
+                            media_files=media_files, media_type=media_type
+                        )
                         print(f"❌ Failed to download video from URL: {str(e)}")
-                        return
+                        return failure
                 
-                # Tạo temp file với extension .mp4
-                temp_fd, temp_path = tempfile.mkstemp(suffix=".mp4", prefix="youtube_upload_")
-                os.write(temp_fd, video_data)
-                os.close(temp_fd)
-                temp_file = temp_path
+                if isinstance(video_data, Path):
+                    # Video đã nằm trên disk (storage / thư viện) -> upload trực tiếp
+                    upload_path = str(video_data)
+                else:
+                    # Tạo temp file với extension .mp4
+                    temp_fd, temp_path = tempfile.mkstemp(suffix=".mp4", prefix="youtube_upload_")
+                    os.write(temp_fd, video_data)
+                    os.close(temp_fd)
+                    temp_file = temp_path
+                    upload_path = temp_file
                 
                 print(f"📹 Đang upload video lên YouTube cho post {post.id}...")
-                print(f"   Video size: {len(video_data)} bytes")
-                print(f"   Temp file: {temp_file}")
+                print(f"   Video size: {os.path.getsize(upload_path)} bytes")
+                print(f"   File: {upload_path}")
                 
                 # Extract hashtags từ content nếu có
                 tags = []
@@ -856,31 +990,65 @@ class PostService:
                     hashtags = re.findall(r'#(\w+)', post.content)
                     tags = hashtags[:10] if hashtags else []  # YouTube limit 10 tags
                 
+                # Video nằm trên disk lâu dài -> lưu resumable session để upload tiếp sau khi restart
+                resume_state = None
+                on_progress = None
+                if isinstance(video_data, Path):
+                    saved_state = (post.post_metadata or {}).get('youtube_upload')
+                    if (saved_state and saved_state.get('file') == upload_path
+                            and saved_state.get('size') == os.path.getsize(upload_path)):
+                        resume_state = saved_state
+                    on_progress = self._youtube_progress_saver(post.id, upload_path)
+                
+                # Access token lấy từ cache theo page (refresh nền trước khi hết hạn), không validate qua tokeninfo
+                try:
+                    access_token = await youtube_token_manager.get_access_token(page)
+                except Exception as e:
+                    failure = await self._mark_failed(
+                        post, "youtube", f"YouTube credentials error: {str(e)}", error=e,
+                        media_files=media_files, media_type=media_type
+                    )
+                    print(f"❌ Post {post.id} không lấy được token YouTube '{page.page_name}': {str(e)}")
+                    return failure
+                
                 # Upload lên YouTube với refresh_token
                 youtube_service = YouTubeService()
-                result = youtube_service.upload_video(
-                    access_token=page.access_token,
+                result = await youtube_service.upload_video_async(
+                    access_token=access_token,
                     refresh_token=page.refresh_token,  # Thêm refresh_token
-                    file_path=temp_file,
+                    file_path=upload_path,
                     title=post.title or f"Video - {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}",
                     description=post.content or "",
                     tags=tags if tags else None,
                     category_id=22,  # 22 = People & Blogs (có thể customize)
-                    privacy_status="public"  # public/unlisted/private (có thể customize)
+                    privacy_status="public",  # public/unlisted/private (có thể customize)
+                    resume_state=resume_state,
+                    on_progress=on_progress,
+                    job_id=f"post-{post.id}",
+                    validate_credentials=False
                 )
                 
+                # Session upload được lưu từ session DB khác -> nạp lại metadata trước khi ghi
+                if on_progress:
+                    await self.db.refresh(post)
+                
                 if result.get("success"):
                     # Update post với thông tin từ YouTube
                     video_id = result.get("video_id")
                     youtube_url = f"https://www.youtube.com/watch?v={video_id}"
                     
-                    await self.update(post.id, {
+                    values = {
                         "status": "published",
                         "published_at": datetime.utcnow(),
                         "platform_post_id": video_id,
                         "platform_post_url": youtube_url,
                         "error_message": None
-                    })
+                    }
+                    if post.post_metadata and 'youtube_upload' in post.post_metadata:
+                        metadata = dict(post.post_metadata)
+                        metadata.pop('youtube_upload')
+                        values["post_metadata"] = metadata
+                    await self.update(post.id, values)
                     
                     print(f"✅ Post {post.id} đã đăng thành công lên YouTube '{page.page_name}'")
                     print(f"   Video ID: {video_id}")
@@ -890,11 +1058,12 @@ class PostService:
                 else:
                     # Upload thất bại
                     error_msg = result.get("message", "Unknown error")
-                    await self.update(post.id, {
-                        "status": "failed",
-                        "error_message": f"YouTube upload error: {error_msg}",
-                        "retry_count": post.retry_count + 1
-                    })
+                    if "401" in error_msg or "invalid_grant" in error_msg or "credentials" in error_msg.lower():
+                        youtube_token_manager.invalidate(page.id)
+                    failure = await self._mark_failed(
+                        post, "youtube", f"YouTube upload error: {error_msg}", result=result,
+                        media_files=media_files, media_type=media_type
+                    )
                     print(f"❌ Post {post.id} upload lên YouTube '{page.page_name}' thất bại: {error_msg}")
                 
             finally:
@@ -908,20 +1077,240 @@ class PostService:
             
         except Exception as e:
             error_msg = str(e)
-            await self.update(post.id, {
-                "status": "failed",
-                "error_message": f"YouTube exception: {error_msg}",
-                "retry_count": post.retry_count + 1
-            })
+            failure = await self._mark_failed(
+                post, "youtube", f"YouTube exception: {error_msg}", error=e,
+                media_files=media_files, media_type=media_type
+            )
             print(f"❌ Exception khi đăng post {post.id} lên YouTube: {error_msg}")
+        
+        return failure
+    
+    def _facebook_progress_saver(self, post_id: int, file_path: str):
+        """
+        Callback cho post_to_facebook_page (chạy trong event loop):
+        lưu upload session + offset đã xác nhận vào post_metadata['facebook_upload']
+        """
+        async def on_progress(state: dict):
+            await self._save_upload_state(post_id, 'facebook_upload', {**state, "file": file_path})
+        
+        return on_progress
+    
+    def _youtube_progress_saver(self, post_id: int, file_path: str):
+        """
+        Callback cho YouTubeService.upload_video (chạy trong thread upload):
+        lưu resumable URI + offset đã xác nhận vào post_metadata['youtube_upload']
+        """
+        loop = asyncio.get_running_loop()
+        
+        def on_progress(state: dict):
+            future = asyncio.run_coroutine_threadsafe(
+                self._save_upload_state(post_id, 'youtube_upload', {**state, "file": file_path}),
+                loop
+            )
+            try:
+                # Chờ ghi xong để offset lưu trong DB luôn theo đúng thứ tự chunk
+                future.result(timeout=30)
+            except Exception as e:
+                print(f"⚠️ Could not save YouTube upload state for post {post_id}: {str(e)}")
+        
+        return on_progress
+    
+    @staticmethod
+    async def _save_upload_state(post_id: int, key: str, state: dict):
+        """Lưu resumable upload session vào post_metadata[key] (youtube_upload / facebook_upload)"""
+        # Session riêng: session của worker đang chờ upload xong
+        async with async_session_maker() as session:
+            post = await session.get(Post, post_id)
+            if not post:
+                return
+            metadata = dict(post.post_metadata or {})
+            metadata[key] = state
+            await session.execute(
+                update(Post).where(Post.id == post_id).values(post_metadata=metadata)
+            )
+            await session.commit()
+    
+    async def _track_container(
+        self, post: Post, page: Page, platform: str, container_id: str, media_urls: List[str],
+        account_id: Optional[str] = None
+    ):
+        """
+        Giữ post ở 'publishing' và giao media container cho container_poller
+        Lease chuyển sang poller (worker scheduler trả slot ngay, không chờ video xử lý)
+        account_id: ID tài khoản đã tạo container (mặc định page.page_id)
+        """
+        from services.container_poller import container_poller
+        
+        account_id = account_id or page.page_id
+        metadata = dict(post.post_metadata or {})
+        created_at = datetime.utcnow()
+        metadata['container'] = {
+            "platform": platform,
+            "id": container_id,
+            "account_id": account_id,
+            "created_at": created_at.isoformat()
+        }
+        if media_urls:
+            metadata['media_urls'] = media_urls
+            metadata['media_type'] = 'video'
+        
+        await self.update(post.id, {
+            "status": "publishing",
+            "error_message": None,
+            "post_metadata": metadata,
+            "lease_owner": container_poller.instance_id,
+            "lease_expires_at": container_poller.lease_expiry()
+        })
+        container_poller.register(
+            post_id=post.id,
+            platform=platform,
+            account_id=account_id,
+            access_token=page.access_token,
+            container_id=container_id,
+            media_urls=media_urls,
+            created_at=created_at
+        )
+    
+    async def _track_tiktok_publish(self, post: Post, page: Page, publish_id: str, media_files: List, media_type: str):
+        """
+        Giữ post ở 'publishing' trong khi TikTok xử lý video, giao publish_id cho tiktok_status_tracker
+        Tracker cập nhật platform_post_id / platform_post_url khi video PUBLISH_COMPLETE
+        """
+        from services.tiktok_status_tracker import tiktok_status_tracker
+        
+        # Giữ media để còn retry được nếu TikTok xử lý thất bại (FAILED)
+        metadata = await self._persist_media_for_retry(post, media_files, media_type, None)
+        metadata['tiktok_publish_id'] = publish_id
+        metadata['status'] = "PROCESSING"  # TikTok API status (different from PostStatus enum)
+        # Thời điểm upload xong: instance tiếp quản tính timeout từ đây (updated_at đổi theo mỗi lần gia hạn lease)
+        uploaded_at = datetime.utcnow()
+        metadata['tiktok_uploaded_at'] = uploaded_at.isoformat()
+        
+        await self.update(post.id, {
+            "status": "publishing",
+            "platform_post_id": publish_id,
+            "error_message": None,
+            "post_metadata": metadata,
+            "lease_owner": tiktok_status_tracker.instance_id,
+            "lease_expires_at": tiktok_status_tracker.lease_expiry()
+        })
+        tiktok_status_tracker.register(
+            post_id=post.id,
+            publish_id=publish_id,
+            access_token=page.access_token,
+            created_at=uploaded_at
+        )
+    
+    async def _mark_failed(
+        self,
+        post: Post,
+        platform: str,
+        error_message: str,
+        result: Optional[dict] = None,
+        error: Optional[Exception] = None,
+        media_files: Optional[List] = None,
+        media_type: str = 'image',
+        media_urls: Optional[List[str]] = None
+    ) -> bool:
+        """
+        Xử lý post đăng thất bại
+        - Lỗi tạm thời (retry_service phân loại) và chưa quá số lần retry:
+          lưu media vào storage rồi đưa post về 'scheduled' với scheduled_at = now + backoff
+        - Lỗi vĩnh viễn hoặc đã hết lượt retry: status = 'failed'
+        
+        Returns:
+            True nếu lỗi tạm thời (retryable), dù post đã hết lượt retry
+        """
+        attempt = (post.retry_count or 0) + 1
+        max_attempts = settings.PUBLISH_RETRY_MAX_ATTEMPTS
+        retryable = retry_service.is_retryable(platform, result=result, error=error)
+        
+        if attempt <= max_attempts and retryable:
+            try:
+                metadata = await self._persist_media_for_retry(post, media_files, media_type, media_urls)
+                retry_at = retry_service.next_retry_at(attempt)
+                await self.update(post.id, {
+                    "status": "scheduled",
+                    "scheduled_at": retry_at,
+                    "error_message": f"{error_message} (retry {attempt}/{max_attempts})",
+                    "retry_count": attempt,
+                    "post_metadata": metadata
+                })
+                print(f"🔁 Post {post.id} sẽ retry lần {attempt}/{max_attempts} lúc {format_datetime_gmt7(retry_at)}")
+                return retryable
+            except Exception as e:
+                print(f"⚠️ Không thể lên lịch retry cho post {post.id}: {str(e)}")
+        
+        await self.update(post.id, {
+            "status": "failed",
+            "error_message": error_message,
+            "retry_count": attempt
+        })
+        return retryable
+    
+    async def _persist_media_for_retry(
+        self,
+        post: Post,
+        media_files: Optional[List],
+        media_type: str,
+        media_urls: Optional[List[str]]
+    ) -> dict:
+        """
+        Đảm bảo media của post còn dùng được khi scheduler retry
+        (post đăng ngay không lưu media vào storage như scheduled post)
+        """
+        metadata = dict(post.post_metadata or {})
+        
+        if media_urls and not metadata.get('media_urls'):
+            metadata['media_urls'] = media_urls
+        
+        if media_files and not metadata.get('media_paths') and not metadata.get('media_file_urls'):
+            if all(isinstance(f, str) for f in media_files):
+                # Video chọn từ thư viện: chỉ cần lưu URL, tải lại khi retry
+                metadata['media_file_urls'] = list(media_files)
+            else:
+                metadata['media_paths'] = await storage_service.save_media_for_post(
+                    post_id=post.id,
+                    media_files=media_files,
+                    media_type=media_type
+                )
+        
+        if media_files or media_urls:
+            metadata['media_type'] = media_type
+        
+        return metadata
     
     async def update(self, post_id: int, data: dict) -> Optional[Dict]:
         query = update(Post).where(Post.id == post_id).values(**data).returning(Post)
         result = await self.db.execute(query)
-        await self.db.commit()
         post = result.scalar_one_or_none()
+        if post and ('status' in data or 'scheduled_at' in data):
+            await self._notify_schedule_change(post)
+        await self.db.commit()
         return self._to_dict(post) if post else None
     
+    async def _notify_schedule_change(self, post: Post):
+        """
+        Gửi Postgres NOTIFY khi lịch đăng của post thay đổi
+        Scheduler (event mode) ở mọi instance LISTEN channel này để cập nhật heap.
+        NOTIFY chỉ được gửi khi transaction hiện tại commit.
+        """
+        status = post.status.value if hasattr(post.status, 'value') else post.status
+        scheduled_at = ""
+        if post.scheduled_at:
+            # DB lưu naive UTC -> gửi kèm offset (+00:00) để bên nhận không phải đoán timezone
+            scheduled_at = post.scheduled_at
+            if scheduled_at.tzinfo is None:
+                scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+            scheduled_at = scheduled_at.astimezone(timezone.utc).isoformat()
+        await self.db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {
+                "channel": settings.SCHEDULER_NOTIFY_CHANNEL,
+                "payload": f"{post.id}|{status}|{scheduled_at}"
+            }
+        )
+    
     async def update_status(self, post_id: int, status: str) -> Optional[Dict]:
         return await self.update(post_id, {"status": status})
     
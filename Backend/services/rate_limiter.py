@@ -0,0 +1,301 @@
+"""
+Rate Limiter - Token bucket phía client cho các platform API
+
+- Mỗi app (meta, threads, tiktok, youtube) và mỗi page/account có một bucket riêng
+- http_client lấy token trước mỗi request nên các worker tự giãn nhịp gọi API
+- Tốc độ bucket giảm dần theo usage Meta trả về trong header
+  (X-App-Usage, X-Page-Usage, X-Business-Use-Case-Usage) trước khi bị throttle
+- Lỗi throttle (Meta code 4/17/32/613, TikTok 429, YouTube quota) chặn bucket một thời gian;
+  request phải chờ quá RATE_LIMIT_MAX_WAIT_SECONDS thì raise RateLimitedError (lỗi retryable)
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Host -> app bucket
+APP_HOSTS = {
+    "graph.facebook.com": "meta",
+    "graph-video.facebook.com": "meta",
+    "graph.instagram.com": "meta",
+    "graph.threads.net": "threads",
+    "open.tiktokapis.com": "tiktok",
+}
+
+# Platform (tên trong bảng platforms) -> app bucket
+PLATFORM_APPS = {
+    "facebook": "meta",
+    "instagram": "meta",
+    "threads": "threads",
+    "tiktok": "tiktok",
+    "youtube": "youtube",
+}
+
+# Meta error codes throttle: app-level và page/account-level
+META_APP_THROTTLE_CODES = {4, 17}
+META_PAGE_THROTTLE_CODES = {32, 613, 80001, 80002}
+
+YOUTUBE_QUOTA_REASONS = ("quotaexceeded", "ratelimitexceeded", "userratelimitexceeded", "dailylimitexceeded")
+
+
+class RateLimitedError(Exception):
+    """Bucket đang bị chặn lâu hơn thời gian chờ cho phép"""
+
+    def __init__(self, key: str, retry_after: float):
+        self.key = key
+        self.retry_after = retry_after
+        super().__init__(f"Rate limited on {key}, retry after {retry_after:.0f}s")
+
+
+class TokenBucket:
+    """Token bucket có thể đổi tốc độ và bị chặn tạm thời"""
+
+    def __init__(self, key: str, rate: float):
+        self.key = key
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = max(1.0, rate * settings.RATE_LIMIT_BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.usage = 0.0
+        self.strikes = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """Lấy 1 token; trả về số giây cần chờ nếu chưa có token (0 = được gửi ngay)"""
+        now = time.monotonic()
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def blocked_for(self) -> float:
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def apply_usage(self, usage: float):
+        """
+        Giảm tốc độ theo % usage platform báo về
+        < RATE_LIMIT_USAGE_SOFT: tốc độ gốc; từ soft đến 100%: giảm tuyến tính; >= 100%: chặn
+        """
+        self._refill(time.monotonic())
+        self.usage = usage
+        soft = settings.RATE_LIMIT_USAGE_SOFT
+        if usage >= 100:
+            self.block(settings.RATE_LIMIT_BLOCK_SECONDS)
+            return
+        if usage <= soft:
+            factor = 1.0
+        else:
+            factor = max(0.05, (100 - usage) / (100 - soft))
+        self.rate = self.base_rate * factor
+        # Burst cũng thu nhỏ theo tốc độ mới
+        self.capacity = max(1.0, self.rate * settings.RATE_LIMIT_BURST_SECONDS)
+        self.tokens = min(self.tokens, self.capacity)
+        if usage <= soft:
+            self.strikes = 0
+
+    def block(self, seconds: Optional[float] = None):
+        """Chặn bucket; không truyền seconds thì backoff tăng dần theo số lần bị throttle liên tiếp"""
+        if seconds is None:
+            seconds = min(settings.RATE_LIMIT_BLOCK_SECONDS * (2 ** self.strikes), settings.RATE_LIMIT_MAX_BLOCK_SECONDS)
+            self.strikes += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+        logger.warning(f"🐢 Rate limit: {self.key} blocked for {seconds:.0f}s")
+
+    def get_stats(self) -> dict:
+        return {
+            "rate": round(self.rate, 2),
+            "base_rate": self.base_rate,
+            "tokens": round(self.tokens, 2),
+            "usage": self.usage,
+            "blocked_for": round(self.blocked_for(), 1)
+        }
+
+
+class RateLimiter:
+    """Quản lý bucket theo app và theo page/account"""
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _app_rate(self, app: str) -> float:
+        return {
+            "meta": settings.RATE_LIMIT_META_APP_PER_SECOND,
+            "threads": settings.RATE_LIMIT_THREADS_APP_PER_SECOND,
+            "tiktok": settings.RATE_LIMIT_TIKTOK_PER_SECOND,
+            "youtube": settings.RATE_LIMIT_YOUTUBE_PER_SECOND,
+        }[app]
+
+    def bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            app = key.split(":", 1)[0]
+            rate = self._app_rate(app) if ":" not in key else settings.RATE_LIMIT_PAGE_PER_SECOND
+            bucket = TokenBucket(key, rate)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _keys_for(self, url: str) -> List[str]:
+        """Bucket áp dụng cho URL: app bucket + page bucket nếu gọi edge của một page/account"""
+        parts = urlsplit(str(url))
+        host = parts.netloc.lower()
+        if host == "www.googleapis.com" and parts.path.startswith(("/youtube", "/upload/youtube")):
+            return ["youtube"]
+        app = APP_HOSTS.get(host)
+        if app is None:
+            return []
+        keys = [app]
+        if app in ("meta", "threads"):
+            # /v21.0/{id}/{edge}: chỉ tạo bucket cho id đang đăng bài (feed, photos, media, threads...)
+            segments = [s for s in parts.path.split("/") if s]
+            if segments and segments[0].startswith("v") and "." in segments[0]:
+                segments = segments[1:]
+            if len(segments) >= 2:
+                keys.append(f"{app}:{segments[0]}")
+        return keys
+
+    async def acquire(self, url: str):
+        """Chờ đến khi mọi bucket của URL cho phép gửi request"""
+        for key in self._keys_for(url):
+            await self.acquire_key(key)
+
+    async def acquire_key(self, key: str):
+        bucket = self.bucket(key)
+        while True:
+            wait = bucket.reserve()
+            if wait <= 0:
+                return
+            if wait > settings.RATE_LIMIT_MAX_WAIT_SECONDS:
+                raise RateLimitedError(key, wait)
+            await asyncio.sleep(wait)
+
+    def blocked_for(self, platform: str) -> float:
+        """Số giây app bucket của platform còn bị chặn (scheduler dùng để tạm dừng claim)"""
+        app = PLATFORM_APPS.get((platform or "").lower())
+        if app is None or app not in self._buckets:
+            return 0.0
+        return self._buckets[app].blocked_for()
+
+    def penalize(self, key: str, seconds: Optional[float] = None):
+        """Chặn bucket sau lỗi throttle/quota phát hiện ngoài http_client (VD: google-api-client)"""
+        self.bucket(key).block(seconds)
+
+    def observe(self, url: str, response, inspect_body: bool = True):
+        """
+        Cập nhật bucket từ header usage và lỗi throttle của response
+        inspect_body=False với response stream (body chưa được đọc)
+        """
+        keys = self._keys_for(url)
+        if not keys:
+            return
+        app = keys[0]
+        try:
+            if app in ("meta", "threads"):
+                self._observe_meta(keys, response, inspect_body)
+            elif app == "tiktok":
+                self._observe_tiktok(response, inspect_body)
+            elif app == "youtube":
+                self._observe_youtube(response, inspect_body)
+        except Exception as e:
+            logger.debug(f"Could not parse rate limit info from {url}: {str(e)}")
+
+    def _observe_meta(self, keys: List[str], response, inspect_body: bool):
+        app = keys[0]
+        headers = response.headers
+
+        app_usage = _parse_usage(headers.get("x-app-usage"))
+        if app_usage is not None:
+            self.bucket(app).apply_usage(app_usage)
+
+        page_usage = _parse_usage(headers.get("x-page-usage"))
+        if page_usage is not None and len(keys) > 1:
+            self.bucket(keys[1]).apply_usage(page_usage)
+
+        # {"<business-object-id>": [{"type", "call_count", "total_cputime", "total_time", "estimated_time_to_regain_access"}]}
+        buc_header = headers.get("x-business-use-case-usage")
+        if buc_header:
+            for object_id, entries in json.loads(buc_header).items():
+                bucket = self.bucket(f"{app}:{object_id}")
+                usage = max(_usage_percent(entry) for entry in entries) if entries else 0
+                regain_minutes = max((entry.get("estimated_time_to_regain_access") or 0) for entry in entries) if entries else 0
+                if regain_minutes:
+                    bucket.block(regain_minutes * 60)
+                else:
+                    bucket.apply_usage(usage)
+
+        if response.status_code < 400 or not inspect_body:
+            return
+        error = (response.json() or {}).get("error") or {}
+        code = error.get("code")
+        if code in META_APP_THROTTLE_CODES:
+            self.bucket(app).block()
+        elif code in META_PAGE_THROTTLE_CODES:
+            self.bucket(keys[1] if len(keys) > 1 else app).block()
+
+    def _observe_tiktok(self, response, inspect_body: bool):
+        if response.status_code < 400:
+            return
+        error_code = None
+        if inspect_body:
+            try:
+                error_code = ((response.json() or {}).get("error") or {}).get("code")
+            except ValueError:
+                pass
+        if response.status_code == 429 or error_code == "rate_limit_exceeded":
+            self.bucket("tiktok").block(_retry_after(response))
+
+    def _observe_youtube(self, response, inspect_body: bool):
+        if response.status_code not in (403, 429):
+            return
+        if response.status_code == 429 or (
+            inspect_body and any(reason in response.text.lower() for reason in YOUTUBE_QUOTA_REASONS)
+        ):
+            self.bucket("youtube").block(_retry_after(response) or settings.RATE_LIMIT_YOUTUBE_QUOTA_BLOCK_SECONDS)
+
+    def get_stats(self) -> dict:
+        return {key: bucket.get_stats() for key, bucket in sorted(self._buckets.items())}
+
+
+def _usage_percent(usage: dict) -> float:
+    return max(
+        float(usage.get("call_count") or 0),
+        float(usage.get("total_time") or 0),
+        float(usage.get("total_cputime") or 0)
+    )
+
+
+def _parse_usage(header: Optional[str]) -> Optional[float]:
+    if not header:
+        return None
+    return _usage_percent(json.loads(header))
+
+
+def _retry_after(response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+# Global instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,185 @@
+"""
+Retry Service - Phân loại lỗi đăng bài và tính lịch retry
+
+- Lỗi tạm thời (rate limit, 5xx, timeout...) -> retryable: post được đưa lại về 'scheduled'
+- Lỗi vĩnh viễn (token sai, thiếu quyền, dữ liệu không hợp lệ...) -> fatal: post 'failed'
+
+Lịch retry dùng exponential backoff có jitter và giới hạn trên, để khi platform
+gặp sự cố ngắn các post không cùng retry một lúc (thundering herd).
+"""
+
+import sys
+sys.path.append('..')
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as SQLAlchemyTimeoutError
+
+from core.config import settings
+from services.rate_limiter import RateLimitedError
+from utils.timezone_utils import now_utc
+
+
+# Meta Graph API (Facebook / Instagram / Threads) - error codes tạm thời
+# https://developers.facebook.com/docs/graph-api/guides/error-handling
+META_RETRYABLE_CODES = {
+    1,      # Unknown error / API temporarily unavailable
+    2,      # Service temporarily unavailable
+    4,      # Application request limit reached
+    17,     # User request limit reached
+    32,     # Page request limit reached
+    341,    # Application limit reached
+    613,    # Calls to this API have exceeded the rate limit
+    9007,   # Instagram: media container chưa sẵn sàng
+    80001,  # Page business use case rate limit
+    80002,  # Instagram business use case rate limit
+}
+
+# TikTok Content Posting API - error codes tạm thời
+TIKTOK_RETRYABLE_CODES = {
+    "rate_limit_exceeded",
+    "internal_error",
+    "spam_risk_too_many_posts",
+}
+
+# YouTube Data API - reason (error.errors[].reason) tạm thời
+YOUTUBE_RETRYABLE_REASONS = {
+    "quotaExceeded",
+    "rateLimitExceeded",
+    "userRateLimitExceeded",
+    "backendError",
+    "internalError",
+}
+
+# YouTube upload không có HTTP status (lỗi mạng, hàng đợi upload) - message chứa các từ khóa này là lỗi tạm thời
+YOUTUBE_RETRYABLE_KEYWORDS = (
+    "quota",
+    "timed out",
+    "timeout",
+    "connection",
+    "queue is full",
+)
+
+
+def _is_transient_exception(error: Optional[Exception]) -> bool:
+    """Lỗi mạng / timeout / response không phải JSON (thường là trang lỗi 5xx) / mất kết nối DB"""
+    if error is None:
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code == 429 or status_code >= 500
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (
+        RateLimitedError,
+        httpx.TransportError,
+        json.JSONDecodeError,
+        TimeoutError,
+        ConnectionError,
+        OperationalError,
+        SQLAlchemyTimeoutError,
+    ))
+
+
+def _is_retryable_meta(result: dict) -> bool:
+    # result["error"] là body lỗi của Graph API: {"error": {"code": ..., "is_transient": ...}}
+    error = result.get("error") or {}
+    if isinstance(error, dict) and isinstance(error.get("error"), dict):
+        error = error["error"]
+    if not isinstance(error, dict):
+        return False
+
+    if error.get("is_transient"):
+        return True
+
+    status_code = result.get("status_code")
+    if status_code and (status_code == 429 or status_code >= 500):
+        return True
+
+    return error.get("code") in META_RETRYABLE_CODES
+
+
+def _is_retryable_tiktok(result: dict) -> bool:
+    status_code = result.get("status_code")
+    if status_code and (status_code == 429 or status_code >= 500):
+        return True
+
+    if result.get("error_code") in TIKTOK_RETRYABLE_CODES:
+        return True
+
+    error = result.get("error")
+    if isinstance(error, dict):
+        error = error.get("error", error)
+        if isinstance(error, dict) and error.get("code") in TIKTOK_RETRYABLE_CODES:
+            return True
+
+    message = f"{error} {result.get('message', '')}".lower()
+    return "timeout" in message or "timed out" in message
+
+
+def _is_retryable_youtube(result: dict) -> bool:
+    # Lỗi HTTP từ Google: phân loại theo status và reason
+    status_code = result.get("status_code")
+    if status_code:
+        return status_code == 429 or status_code >= 500 or result.get("reason") in YOUTUBE_RETRYABLE_REASONS
+
+    message = f"{result.get('error', '')} {result.get('message', '')}".lower()
+    return any(keyword in message for keyword in YOUTUBE_RETRYABLE_KEYWORDS)
+
+
+RETRY_CLASSIFIERS = {
+    "facebook": _is_retryable_meta,
+    "instagram": _is_retryable_meta,
+    "threads": _is_retryable_meta,
+    "tiktok": _is_retryable_tiktok,
+    "youtube": _is_retryable_youtube,
+}
+
+
+def is_retryable(platform: str, result: Optional[dict] = None, error: Optional[Exception] = None) -> bool:
+    """
+    Phân loại lỗi đăng bài
+
+    Args:
+        platform: Tên platform (facebook, instagram, threads, tiktok, youtube)
+        result: Dict kết quả lỗi do platform service trả về (nếu có)
+        error: Exception đã xảy ra (nếu có)
+
+    Returns:
+        True nếu lỗi tạm thời, nên retry
+    """
+    if _is_transient_exception(error):
+        return True
+
+    classifier = RETRY_CLASSIFIERS.get((platform or "").lower())
+    if classifier is None or not result:
+        return False
+    
+    # RateLimitedError bị service bắt lại và trả về dạng message
+    if "rate limited on" in f"{result.get('error', '')} {result.get('message', '')}".lower():
+        return True
+
+    return classifier(result)
+
+
+def compute_backoff(attempt: int) -> timedelta:
+    """
+    Thời gian chờ trước lần retry thứ `attempt` (bắt đầu từ 1)
+
+    Exponential backoff có giới hạn + equal jitter:
+    delay = exp/2 + random(0, exp/2), với exp = min(max, base * 2^(attempt-1))
+    """
+    base = settings.PUBLISH_RETRY_BASE_SECONDS
+    cap = settings.PUBLISH_RETRY_MAX_SECONDS
+    exp = min(cap, base * (2 ** max(attempt - 1, 0)))
+    delay = exp / 2 + random.uniform(0, exp / 2)
+    return timedelta(seconds=delay)
+
+
+def next_retry_at(attempt: int) -> datetime:
+    """Thời điểm retry (naive UTC, để lưu DB)"""
+    return now_utc() + compute_backoff(attempt)
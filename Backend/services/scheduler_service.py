@@ -8,17 +8,22 @@ sys.path.append('..')
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
+from sqlalchemy import select, update, func, or_, and_
 from typing import List
 import asyncio
+import heapq
 import logging
+import os
+import socket
+import uuid
 
-from models.model import Post
+from models.model import Post, Page, Platform, PostStatus
 from services.post_service import PostService
 from services.storage_service import storage_service
+from services.rate_limiter import rate_limiter
 from core.config import settings
 from utils.timezone_utils import now_utc, format_datetime_gmt7, utc_to_gmt7
 
@@ -35,13 +40,41 @@ class SchedulerService:
         self.engine = None
         self.async_session = None
         
+        # Worker pool: mỗi platform có giới hạn số post đăng đồng thời riêng,
+        # để một platform chậm (VD: YouTube upload) không chặn các platform khác
+        self.platform_limits = dict(settings.PUBLISH_CONCURRENCY)
+        self._in_flight = {platform: set() for platform in self.platform_limits}  # post_id đang đăng
+        self._workers = set()  # asyncio.Task của các worker đang chạy
+        
+        # Lease: định danh instance này khi claim post (nhiều process/host dùng chung DB)
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_duration = timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        
+        # Event mode: min-heap (scheduled_at, post_id) của các post sắp đến hạn
+        self.mode = settings.SCHEDULER_MODE
+        self._due_heap = []
+        self._due_index = {}  # post_id -> scheduled_at hiện hành (entry khác trong heap là stale)
+        self._wakeup = asyncio.Event()
+        self._backlog = False  # còn post đến hạn chưa claim được (hết slot worker)
+        self._throttled_for = None  # số giây platform bị throttle ngắn nhất ở lần claim gần nhất
+        self._event_loop_task = None
+        self._listener_conn = None
+        self._listener_driver = None  # asyncpg connection đang LISTEN
+        self._listener_task = None
+        self._listener_lost = asyncio.Event()
+        self._listener_reconnects = 0
+        
     async def init_db(self):
         """Khởi tạo database connection cho scheduler"""
         try:
+            # Mỗi worker dùng session riêng -> pool phải đủ cho tất cả worker
+            total_workers = sum(self.platform_limits.values())
             self.engine = create_async_engine(
                 settings.DATABASE_URL,
                 echo=False,
-                pool_pre_ping=True
+                pool_pre_ping=True,
+                pool_size=total_workers + 2,
+                max_overflow=5
             )
             self.async_session = sessionmaker(
                 self.engine,
@@ -59,6 +92,25 @@ class SchedulerService:
             # Init database connection
             await self.init_db()
             
+            if self.mode == "event":
+                # Event mode: nạp lịch vào heap, LISTEN thay đổi và ngủ đến post gần nhất
+                await self._load_upcoming_schedule()
+                await self._start_listener()
+                self._listener_task = asyncio.create_task(self._watch_listener())
+                self._event_loop_task = asyncio.create_task(self._run_event_loop())
+                
+                # Đồng bộ lại định kỳ (phòng mất NOTIFY, thu hồi lease hết hạn)
+                self.scheduler.add_job(
+                    self._resync_schedule,
+                    trigger=IntervalTrigger(minutes=settings.SCHEDULER_RESYNC_MINUTES),
+                    id='resync_scheduled_posts',
+                    name='Resync scheduled posts heap',
+                    replace_existing=True
+                )
+                self.scheduler.start()
+                logger.info(f"🚀 Scheduler started successfully - event mode ({len(self._due_index)} upcoming post(s))")
+                return
+            
             # Add job: kiểm tra scheduled posts mỗi 1 phút
             self.scheduler.add_job(
                 self.check_and_publish_scheduled_posts,
@@ -82,6 +134,21 @@ class SchedulerService:
             if self.scheduler.running:
                 self.scheduler.shutdown(wait=True)
                 logger.info("🛑 Scheduler stopped")
+            
+            if self._event_loop_task:
+                self._event_loop_task.cancel()
+                await asyncio.gather(self._event_loop_task, return_exceptions=True)
+            
+            if self._listener_task:
+                self._listener_task.cancel()
+                await asyncio.gather(self._listener_task, return_exceptions=True)
+            
+            await self._close_listener()
+            
+            # Chờ các worker đang đăng bài hoàn tất trước khi đóng DB
+            if self._workers:
+                logger.info(f"⏳ Waiting for {len(self._workers)} publish worker(s) to finish")
+                await asyncio.gather(*self._workers, return_exceptions=True)
                 
             if self.engine:
                 await self.engine.dispose()
@@ -92,45 +159,422 @@ class SchedulerService:
     
     async def check_and_publish_scheduled_posts(self):
         """
-        Kiểm tra và đăng các posts có:
-        - status = 'scheduled'
-        - scheduled_at <= now (UTC)
+        Claim các posts đến hạn và giao cho worker pool đăng song song.
+        
+        Post được claim khi:
+        - status = 'scheduled' và scheduled_at <= now (UTC), hoặc
+        - status = 'publishing' nhưng lease đã hết hạn (instance cũ bị crash)
+        
+        Mỗi platform chỉ claim tối đa số slot worker còn trống, phần còn lại
+        để cho các instance khác. Job này không chờ worker chạy xong.
         """
         try:
+            claimed = []
+            self._throttled_for = None
             async with self.async_session() as session:
-                # Query các scheduled posts đã đến thời gian đăng (UTC)
-                now = now_utc()
-                query = (
-                    select(Post)
-                    .where(Post.status == 'scheduled')
-                    .where(Post.scheduled_at != None)
-                    .where(Post.scheduled_at <= now)
-                )
+                for platform, limit in self.platform_limits.items():
+                    free_slots = limit - len(self._in_flight[platform])
+                    if free_slots <= 0:
+                        continue
+                    
+                    # Platform đang bị throttle -> tạm dừng claim, post chờ đến khi hết chặn
+                    blocked_for = rate_limiter.blocked_for(platform)
+                    if blocked_for > 0:
+                        logger.info(f"🐢 {platform} is rate limited, pausing claims for {blocked_for:.0f}s")
+                        self._throttled_for = min(self._throttled_for or blocked_for, blocked_for)
+                        continue
+                    
+                    post_ids = await self._claim_due_posts(session, platform, free_slots)
+                    claimed.extend((post_id, platform) for post_id in post_ids)
+            
+            if not claimed:
+                # Format thời gian theo GMT+7 để dễ đọc
+                logger.debug(f"⏰ [{format_datetime_gmt7(now_utc())}] No scheduled posts to publish")
+                return 0
+            
+            logger.info(f"📤 Claimed {len(claimed)} scheduled post(s) ready to publish")
+            
+            for post_id, platform in claimed:
+                self._dispatch(post_id, platform)
+            
+            return len(claimed)
+                        
+        except Exception as e:
+            logger.error(f"❌ Error in check_and_publish_scheduled_posts: {str(e)}")
+            return 0
+    
+    # ==================== EVENT MODE ====================
+    
+    async def _run_event_loop(self):
+        """
+        Vòng lặp event mode: ngủ đến scheduled_at gần nhất trong heap
+        hoặc đến khi có NOTIFY / worker rảnh, rồi claim các post đến hạn
+        """
+        while True:
+            try:
+                self._wakeup.clear()
+                has_due = self._pop_due(now_utc())
                 
-                result = await session.execute(query)
-                scheduled_posts = result.scalars().all()
+                if has_due or self._backlog:
+                    claimed = await self.check_and_publish_scheduled_posts()
+                    # Đã claim được hoặc còn platform hết slot -> kiểm tra lại khi worker rảnh
+                    self._backlog = claimed > 0 or (has_due and not self._all_slots_free())
                 
-                if not scheduled_posts:
-                    # Format thời gian theo GMT+7 để dễ đọc
-                    logger.debug(f"⏰ [{format_datetime_gmt7(now)}] No scheduled posts to publish")
-                    return
+                next_due = self._peek_next_due()
+                timeout = None
+                if next_due is not None:
+                    timeout = max((next_due - now_utc()).total_seconds(), 0)
+                if self._throttled_for:
+                    # Có platform bị throttle: kiểm tra lại khi hết chặn
+                    self._backlog = True
+                    timeout = min(timeout, self._throttled_for) if timeout is not None else self._throttled_for
+                
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Error in scheduler event loop: {str(e)}")
+                await asyncio.sleep(1)
+    
+    def _all_slots_free(self) -> bool:
+        return all(len(ids) == 0 for ids in self._in_flight.values())
+    
+    def _schedule_in_heap(self, post_id: int, scheduled_at: datetime):
+        """Thêm/cập nhật lịch của post trong heap, đánh thức loop nếu sớm hơn lịch hiện tại"""
+        next_due = self._peek_next_due()
+        self._due_index[post_id] = scheduled_at
+        heapq.heappush(self._due_heap, (scheduled_at, post_id))
+        if next_due is None or scheduled_at < next_due:
+            self._wakeup.set()
+    
+    def _peek_next_due(self):
+        """scheduled_at sớm nhất còn hiệu lực (bỏ các entry stale ở đỉnh heap)"""
+        while self._due_heap:
+            scheduled_at, post_id = self._due_heap[0]
+            if self._due_index.get(post_id) == scheduled_at:
+                return scheduled_at
+            heapq.heappop(self._due_heap)
+        return None
+    
+    def _pop_due(self, now: datetime) -> bool:
+        """Lấy các entry đã đến hạn ra khỏi heap, trả về True nếu có"""
+        has_due = False
+        while self._due_heap and self._due_heap[0][0] <= now:
+            scheduled_at, post_id = heapq.heappop(self._due_heap)
+            if self._due_index.get(post_id) == scheduled_at:
+                del self._due_index[post_id]
+                has_due = True
+        return has_due
+    
+    async def _load_upcoming_schedule(self):
+        """Nạp toàn bộ lịch của các post 'scheduled' vào heap"""
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(Post.id, Post.scheduled_at)
+                .where(Post.status == PostStatus.scheduled)
+                .where(Post.scheduled_at != None)
+            )
+            rows = result.all()
+        
+        self._due_index = {post_id: scheduled_at for post_id, scheduled_at in rows}
+        self._due_heap = [(scheduled_at, post_id) for post_id, scheduled_at in rows]
+        heapq.heapify(self._due_heap)
+    
+    async def _resync_schedule(self):
+        """Đồng bộ lại heap từ DB và kiểm tra lease hết hạn"""
+        try:
+            await self._load_upcoming_schedule()
+            self._backlog = True
+            self._wakeup.set()
+        except Exception as e:
+            logger.error(f"❌ Error resyncing scheduled posts: {str(e)}")
+    
+    async def _start_listener(self):
+        """Giữ một connection riêng để LISTEN thay đổi lịch đăng (PostService gửi NOTIFY)"""
+        self._listener_lost.clear()
+        self._listener_conn = await self.engine.connect()
+        raw_conn = await self._listener_conn.get_raw_connection()
+        self._listener_driver = raw_conn.driver_connection
+        await self._listener_driver.add_listener(
+            settings.SCHEDULER_NOTIFY_CHANNEL,
+            self._on_schedule_notify
+        )
+        # Connection bị đóng (Postgres restart, failover...) -> watchdog kết nối lại ngay
+        self._listener_driver.add_termination_listener(self._on_listener_terminated)
+    
+    def _on_listener_terminated(self, connection):
+        # Bỏ qua connection cũ đã bị đóng chủ động khi kết nối lại / shutdown
+        if connection is self._listener_driver:
+            logger.warning("⚠️ Scheduler LISTEN connection closed")
+            self._listener_lost.set()
+    
+    async def _watch_listener(self):
+        """
+        Watchdog của connection LISTEN: phát hiện mất kết nối qua termination listener
+        hoặc SELECT 1 mỗi SCHEDULER_LISTENER_CHECK_SECONDS (mạng rớt mà không đóng socket),
+        rồi kết nối lại, LISTEN lại và resync heap ngay (NOTIFY trong lúc mất kết nối không được gửi lại)
+        """
+        check_seconds = settings.SCHEDULER_LISTENER_CHECK_SECONDS
+        while True:
+            try:
+                await asyncio.wait_for(self._listener_lost.wait(), check_seconds)
+            except asyncio.TimeoutError:
+                try:
+                    # Chạy thẳng trên asyncpg (autocommit): connection đang trong transaction thì không nhận NOTIFY
+                    await asyncio.wait_for(self._listener_driver.fetchval("SELECT 1"), check_seconds)
+                    continue
+                except Exception as e:
+                    logger.warning(f"⚠️ Scheduler LISTEN connection health check failed: {str(e)}")
+            await self._reconnect_listener()
+    
+    async def _reconnect_listener(self):
+        """Bỏ connection LISTEN cũ, kết nối lại (backoff tối đa 60s) rồi resync heap"""
+        delay = 1
+        while True:
+            await self._close_listener(invalidate=True)
+            try:
+                await self._start_listener()
+                break
+            except Exception as e:
+                logger.error(f"❌ Could not re-LISTEN for schedule changes: {str(e)} (retry in {delay}s)")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+        self._listener_reconnects += 1
+        logger.info("🔌 Scheduler LISTEN connection restored, resyncing schedule")
+        await self._resync_schedule()
+    
+    async def _close_listener(self, invalidate: bool = False):
+        """Đóng connection LISTEN; invalidate=True để pool không dùng lại connection hỏng"""
+        conn = self._listener_conn
+        self._listener_conn = None
+        self._listener_driver = None
+        if conn is None:
+            return
+        try:
+            if invalidate:
+                await conn.invalidate()
+            await conn.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Error closing scheduler LISTEN connection: {str(e)}")
+    
+    def _on_schedule_notify(self, connection, pid, channel, payload: str):
+        """
+        Xử lý NOTIFY từ PostService
+        
+        Payload: "<post_id>|<status>|<scheduled_at ISO UTC có offset +00:00 hoặc rỗng>"
+        (scheduled_at không có offset từ instance cũ được coi là UTC)
+        """
+        try:
+            post_id, status, scheduled_at = payload.split("|", 2)
+            post_id = int(post_id)
+            
+            if status == "scheduled" and scheduled_at:
+                scheduled_at = datetime.fromisoformat(scheduled_at)
+                if scheduled_at.tzinfo is not None:
+                    # Heap dùng naive UTC giống DB
+                    scheduled_at = scheduled_at.astimezone(timezone.utc).replace(tzinfo=None)
+                self._schedule_in_heap(post_id, scheduled_at)
+            else:
+                # Post không còn chờ đăng -> entry trong heap thành stale
+                self._due_index.pop(post_id, None)
+        except Exception as e:
+            logger.warning(f"⚠️ Invalid schedule notification '{payload}': {str(e)}")
+    
+    async def _claim_due_posts(self, session: AsyncSession, platform: str, limit: int) -> List[int]:
+        """
+        Claim nguyên tử một batch posts đến hạn của platform
+        
+        SELECT ... FOR UPDATE SKIP LOCKED đảm bảo nhiều instance chạy cùng lúc
+        không bao giờ claim trùng một post.
+        
+        Args:
+            session: Database session
+            platform: Tên platform (lowercase)
+            limit: Số post tối đa được claim
+            
+        Returns:
+            List post_id đã claim (status đã chuyển sang 'publishing')
+        """
+        now = now_utc()
+        claimable = (
+            select(Post.id)
+            .join(Page, Post.page_id == Page.id)
+            .join(Platform, Page.platform_id == Platform.id)
+            .where(func.lower(Platform.name) == platform)
+            .where(or_(
+                and_(
+                    Post.status == PostStatus.scheduled,
+                    Post.scheduled_at != None,
+                    Post.scheduled_at <= now
+                ),
+                and_(
+                    Post.status == PostStatus.publishing,
+                    Post.lease_expires_at != None,
+                    Post.lease_expires_at < now,
+                    # Post chờ container xử lý do container_poller tiếp quản
+                    Post.post_metadata['container'].is_(None),
+                    # Video TikTok đang xử lý do tiktok_status_tracker tiếp quản
+                    Post.post_metadata['tiktok_publish_id'].is_(None)
+                )
+            ))
+            .order_by(Post.scheduled_at.asc())
+            .limit(limit)
+            .with_for_update(of=Post, skip_locked=True)
+        )
+        query = (
+            update(Post)
+            .where(Post.id.in_(claimable))
+            .values(
+                status=PostStatus.publishing,
+                lease_owner=self.instance_id,
+                lease_expires_at=now + self.lease_duration
+            )
+            .returning(Post.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        post_ids = list(result.scalars().all())
+        await session.commit()
+        return post_ids
+    
+    async def _claim_post(self, session: AsyncSession, post_id: int) -> bool:
+        """Claim một post cụ thể (chỉ khi còn ở trạng thái 'scheduled')"""
+        query = (
+            update(Post)
+            .where(Post.id == post_id)
+            .where(Post.status == PostStatus.scheduled)
+            .values(
+                status=PostStatus.publishing,
+                lease_owner=self.instance_id,
+                lease_expires_at=now_utc() + self.lease_duration
+            )
+            .returning(Post.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        claimed = result.scalar_one_or_none() is not None
+        await session.commit()
+        return claimed
+    
+    async def _renew_lease(self, post_id: int):
+        """Gia hạn lease định kỳ trong lúc worker còn đăng bài (VD: upload video lâu)"""
+        interval = max(self.lease_duration.total_seconds() / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self.async_session() as session:
+                    await session.execute(
+                        update(Post)
+                        .where(Post.id == post_id)
+                        .where(Post.lease_owner == self.instance_id)
+                        .values(lease_expires_at=now_utc() + self.lease_duration)
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not renew lease for post {post_id}: {str(e)}")
+    
+    async def _release_lease(self, session: AsyncSession, post_id: int):
+        """Trả lease sau khi worker xong (post đã published/failed/chờ platform xử lý)"""
+        await session.execute(
+            update(Post)
+            .where(Post.id == post_id)
+            .where(Post.lease_owner == self.instance_id)
+            .values(lease_owner=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    
+    def _dispatch(self, post_id: int, platform: str):
+        """Tạo worker task cho một post đã claim"""
+        self._in_flight.setdefault(platform, set()).add(post_id)
+        task = asyncio.create_task(self._publish_worker(post_id, platform))
+        self._workers.add(task)
+        task.add_done_callback(self._workers.discard)
+    
+    async def _publish_worker(self, post_id: int, platform: str):
+        """
+        Worker đăng một post đã claim, dùng session riêng và giữ lease đến khi xong
+        
+        Args:
+            post_id: ID của post cần đăng
+            platform: Tên platform (lowercase)
+        """
+        lease_keeper = asyncio.create_task(self._renew_lease(post_id))
+        try:
+            async with self.async_session() as session:
+                post = await session.get(Post, post_id)
                 
-                logger.info(f"📤 Found {len(scheduled_posts)} scheduled post(s) ready to publish")
+                # Lease có thể đã bị instance khác lấy lại
+                if not post or post.lease_owner != self.instance_id:
+                    return
                 
-                # Đăng từng post
-                for post in scheduled_posts:
-                    try:
-                        await self._publish_scheduled_post(session, post)
-                    except Exception as e:
-                        logger.error(f"❌ Error publishing post {post.id}: {str(e)}")
-                        # Update status to failed
-                        post.status = 'failed'
-                        post.error_message = str(e)
-                        post.retry_count = post.retry_count + 1 if post.retry_count else 1
-                        await session.commit()
-                        
+                retry_count = post.retry_count
+                try:
+                    await self._publish_scheduled_post(session, post)
+                except Exception as e:
+                    logger.error(f"❌ Error publishing post {post.id}: {str(e)}")
+                    await self._fail_scheduled_post(session, post, platform, e, retry_count)
+                finally:
+                    await self._release_lease(session, post_id)
         except Exception as e:
-            logger.error(f"❌ Error in check_and_publish_scheduled_posts: {str(e)}")
+            logger.error(f"❌ Publish worker error for post {post_id}: {str(e)}")
+        finally:
+            lease_keeper.cancel()
+            self._in_flight.get(platform, set()).discard(post_id)
+            # Event mode: có slot trống -> loop kiểm tra backlog
+            self._wakeup.set()
+    
+    async def _fail_scheduled_post(self, session: AsyncSession, post: Post, platform: str, error: Exception, retry_count):
+        """
+        Lỗi ngoài _publish_to_platform (commit 'publishing', refresh, load media, _mark_failed...):
+        đi qua PostService._mark_failed để lỗi DB / mạng được retry với backoff như lỗi platform.
+        Post hết lượt retry -> xóa media đã lưu cho post
+        
+        Args:
+            retry_count: retry_count của post trước lần đăng này (đã đổi -> lỗi đã được xử lý)
+        """
+        try:
+            # Session có thể đang hỏng sau lỗi DB
+            await session.rollback()
+            await session.refresh(post)
+            
+            # Lỗi xảy ra sau khi post đã có kết quả (published / failed / chờ retry / TikTok đang xử lý)
+            status = post.status.value if hasattr(post.status, 'value') else post.status
+            metadata = post.post_metadata or {}
+            if status in ('published', 'failed') or post.retry_count != retry_count:
+                return
+            if status == 'publishing' and metadata.get('tiktok_publish_id'):
+                return
+            
+            await PostService(session)._mark_failed(
+                post, platform, f"Scheduler error: {str(error)}", error=error,
+                media_type=metadata.get('media_type', 'image')
+            )
+            
+            await session.refresh(post)
+            status = post.status.value if hasattr(post.status, 'value') else post.status
+            if status == 'failed' and metadata.get('media_paths'):
+                await storage_service.delete_media_for_post(post.id)
+                logger.info(f"🗑️ Cleaned up media files for post {post.id}")
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"❌ Could not mark post {post.id} as failed: {str(e)}")
+    
+    def get_worker_stats(self) -> dict:
+        """Thống kê worker pool: giới hạn và số post đang đăng theo platform"""
+        return {
+            "instance_id": self.instance_id,
+            "mode": self.mode,
+            "upcoming_in_heap": len(self._due_index),
+            "limits": dict(self.platform_limits),
+            "in_flight": {platform: len(ids) for platform, ids in self._in_flight.items()},
+            "active_workers": len(self._workers),
+            "listener_reconnects": self._listener_reconnects
+        }
     
     async def _publish_scheduled_post(self, session: AsyncSession, post: Post):
         """
@@ -168,16 +612,26 @@ class SchedulerService:
                 media_type = post.post_metadata.get('media_type', 'image')
                 
                 # Load media files từ storage (cho Facebook/TikTok/YouTube)
+                # Video truyền Path để platform service stream từ disk thay vì đọc cả file vào RAM
                 media_paths = post.post_metadata.get('media_paths', [])
                 if media_paths:
                     try:
-                        media_files = await storage_service.load_media_for_post(
-                            post_id=post.id,
-                            media_paths=media_paths
-                        )
+                        if media_type == 'video':
+                            media_files = storage_service.get_media_file_paths(
+                                post_id=post.id,
+                                media_paths=media_paths
+                            )
+                        else:
+                            media_files = await storage_service.load_media_for_post(
+                                post_id=post.id,
+                                media_paths=media_paths
+                            )
                         logger.info(f"📁 Loaded {len(media_files)} media file(s) from storage")
                     except Exception as e:
                         logger.error(f"❌ Error loading media files: {str(e)}")
+                
+                # Video từ thư viện (URL) được giữ lại khi post chờ retry
+                media_files.extend(post.post_metadata.get('media_file_urls', []))
             
             # Đăng lên platform
             await post_service._publish_to_platform(
@@ -187,7 +641,18 @@ class SchedulerService:
                 media_urls=media_urls
             )
             
-            # Cleanup: Xóa media files sau khi đăng thành công
+            # Post bị đưa lại về 'scheduled' (chờ retry) thì giữ media cho lần đăng sau
+            await session.refresh(post)
+            status = post.status.value if hasattr(post.status, 'value') else post.status
+            if status == 'scheduled':
+                logger.info(f"🔁 Post {post.id} chờ retry lúc {format_datetime_gmt7(post.scheduled_at)}")
+                return
+            
+            # Video TikTok đang xử lý: tiktok_status_tracker xóa media khi có kết quả cuối
+            if status == 'publishing' and (post.post_metadata or {}).get('tiktok_publish_id'):
+                return
+            
+            # Cleanup: Xóa media files sau khi đăng xong
             if post.post_metadata and post.post_metadata.get('media_paths'):
                 try:
                     await storage_service.delete_media_for_post(post.id)
@@ -201,6 +666,25 @@ class SchedulerService:
             logger.error(f"❌ Failed to publish scheduled post {post.id}: {str(e)}")
             raise
     
+    async def get_retry_queue_stats(self) -> dict:
+        """Thống kê các post đang chờ retry (scheduled với retry_count > 0)"""
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    select(func.count(Post.id), func.min(Post.scheduled_at))
+                    .where(Post.status == PostStatus.scheduled)
+                    .where(Post.retry_count > 0)
+                )
+                depth, next_retry = result.one()
+                return {
+                    "depth": depth,
+                    "next_retry_at": format_datetime_gmt7(next_retry, "%Y-%m-%d %H:%M:%S") if next_retry else None,
+                    "max_attempts": settings.PUBLISH_RETRY_MAX_ATTEMPTS
+                }
+        except Exception as e:
+            logger.error(f"❌ Error getting retry queue stats: {str(e)}")
+            return {"depth": None, "next_retry_at": None, "max_attempts": settings.PUBLISH_RETRY_MAX_ATTEMPTS}
+    
     async def get_upcoming_scheduled_posts(self, limit: int = 10) -> List[dict]:
         """
         Lấy danh sách các scheduled posts sắp tới
@@ -246,37 +730,58 @@ class SchedulerService:
     async def trigger_scheduled_post_now(self, post_id: int):
         """
         Trigger đăng một scheduled post ngay lập tức (không chờ scheduled_at)
+        Post được giao cho worker pool như post đến hạn (tôn trọng PUBLISH_CONCURRENCY),
+        không chờ đăng xong
         
         Args:
             post_id: ID của post cần đăng
             
         Returns:
-            True nếu thành công, False nếu thất bại
+            True nếu đã giao cho worker, False nếu không tìm thấy / không claim được / hết slot
         """
         try:
             async with self.async_session() as session:
                 # Get post
-                query = select(Post).where(Post.id == post_id)
+                query = (
+                    select(Post.id, Platform.name)
+                    .join(Page, Post.page_id == Page.id)
+                    .join(Platform, Page.platform_id == Platform.id)
+                    .where(Post.id == post_id)
+                )
                 result = await session.execute(query)
-                post = result.scalar_one_or_none()
+                row = result.first()
                 
-                if not post:
+                if not row:
                     logger.error(f"❌ Post {post_id} not found")
                     return False
                 
-                if post.status != 'scheduled':
-                    logger.error(f"❌ Post {post_id} is not in scheduled status (current: {post.status})")
+                platform = (row[1] or "unknown").lower()
+                in_flight = self._in_flight.setdefault(platform, set())
+                if len(in_flight) >= self.platform_limits.get(platform, 0):
+                    logger.warning(f"⚠️ No free {platform} worker slot, post {post_id} not triggered")
                     return False
                 
-                # Publish immediately
-                await self._publish_scheduled_post(session, post)
-                return True
+                # Giữ slot trong lúc claim để các trigger đồng thời không vượt giới hạn
+                in_flight.add(post_id)
+                try:
+                    # Claim để scheduler (ở instance này hoặc instance khác) không đăng trùng
+                    claimed = await self._claim_post(session, post_id)
+                except Exception:
+                    in_flight.discard(post_id)
+                    raise
+                if not claimed:
+                    in_flight.discard(post_id)
+                    logger.error(f"❌ Post {post_id} is not in scheduled status or already claimed")
+                    return False
+            
+            self._dispatch(post_id, platform)
+            logger.info(f"📤 Post {post_id} triggered, dispatched to {platform} worker")
+            return True
                 
         except Exception as e:
             logger.error(f"❌ Error triggering scheduled post {post_id}: {str(e)}")
             return False
 
-
 # Global scheduler instance
 scheduler_service = SchedulerService()
 
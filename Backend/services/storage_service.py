@@ -9,25 +9,40 @@ sys.path.append('..')
 import asyncio
 import base64
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime
 import hashlib
+import shutil
+import tempfile
 import logging
 
+from core.config import settings
+
 logger = logging.getLogger(__name__)
 
 
+class UploadTooLargeError(Exception):
+    """File upload vượt quá giới hạn dung lượng"""
+
+    def __init__(self, filename: str, max_bytes: int):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        super().__init__(f"File {filename} exceeds maximum allowed size of {max_bytes / (1024 * 1024):.0f}MB")
+
+
 class StorageService:
     """Service quản lý lưu trữ media files"""
     
     def __init__(self, base_path: str = "uploads/scheduled"):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
+        # File upload của request đang xử lý (xóa khi request xong)
+        self.incoming_path = self.base_path.parent / "incoming"
         
     async def save_media_for_post(
         self,
         post_id: int,
-        media_files: List[bytes],
+        media_files: List[Union[bytes, Path]],
         media_type: str
     ) -> List[str]:
         """
@@ -35,7 +50,7 @@ class StorageService:
         
         Args:
             post_id: ID của post
-            media_files: List file data (bytes)
+            media_files: List file data (bytes) hoặc Path tới file có sẵn (copy, không đọc vào RAM)
             media_type: 'image' or 'video'
             
         Returns:
@@ -67,6 +82,34 @@ class StorageService:
             logger.error(f"❌ Error saving media files for post {post_id}: {str(e)}")
             raise
     
+    async def save_upload(self, upload, max_bytes: int) -> Path:
+        """
+        Ghi file upload (UploadFile) ra file tạm theo từng chunk, không đọc cả file vào RAM
+        
+        Args:
+            upload: fastapi.UploadFile
+            max_bytes: Dung lượng tối đa, kiểm tra trong lúc ghi
+            
+        Returns:
+            Path tới file tạm (caller xóa khi dùng xong)
+            
+        Raises:
+            UploadTooLargeError: file vượt max_bytes (file tạm đã được xóa)
+        """
+        self.incoming_path.mkdir(parents=True, exist_ok=True)
+        suffix = Path(upload.filename or "").suffix
+        fd, temp_name = tempfile.mkstemp(suffix=suffix, prefix="upload_", dir=self.incoming_path)
+        file_path = Path(temp_name)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                # Copy trong thread pool: một lần chuyển thread cho cả file thay vì mỗi chunk
+                await asyncio.to_thread(self._copy_upload_sync, upload, f, max_bytes)
+        except BaseException:
+            file_path.unlink(missing_ok=True)
+            raise
+        logger.info(f"✅ Received upload {upload.filename} ({file_path.stat().st_size} bytes) -> {file_path}")
+        return file_path
+    
     async def load_media_for_post(
         self,
         post_id: int,
@@ -99,6 +142,31 @@ class StorageService:
             logger.error(f"❌ Error loading media files for post {post_id}: {str(e)}")
             raise
     
+    def get_media_file_paths(
+        self,
+        post_id: int,
+        media_paths: List[str]
+    ) -> List[Path]:
+        """
+        Lấy Path của media files đã lưu (không đọc nội dung)
+        Dùng cho video: platform service stream trực tiếp từ disk
+        
+        Args:
+            post_id: ID của post
+            media_paths: List đường dẫn file
+            
+        Returns:
+            List Path tuyệt đối của các file còn tồn tại
+        """
+        paths = []
+        for path in media_paths:
+            file_path = Path(path).resolve()
+            if file_path.exists():
+                paths.append(file_path)
+            else:
+                logger.warning(f"⚠️ Media file not found for post {post_id}: {path}")
+        return paths
+    
     async def delete_media_for_post(self, post_id: int):
         """
         Xóa media files của một post
@@ -119,11 +187,27 @@ class StorageService:
         except Exception as e:
             logger.error(f"❌ Error deleting media files for post {post_id}: {str(e)}")
     
-    def _save_file_sync(self, file_path: Path, file_data: bytes):
+    def _save_file_sync(self, file_path: Path, file_data: Union[bytes, Path]):
         """Sync helper để lưu file"""
+        if isinstance(file_data, Path):
+            shutil.copyfile(file_data, file_path)
+            return
         with open(file_path, 'wb') as f:
             f.write(file_data)
     
+    def _copy_upload_sync(self, upload, dest, max_bytes: int):
+        """Sync helper copy UploadFile sang dest theo chunk, dừng ngay khi vượt max_bytes"""
+        upload.file.seek(0)
+        written = 0
+        while True:
+            chunk = upload.file.read(settings.POST_UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadTooLargeError(upload.filename, max_bytes)
+            dest.write(chunk)
+    
     def _load_file_sync(self, file_path: str) -> bytes:
         """Sync helper để load file"""
         with open(file_path, 'rb') as f:
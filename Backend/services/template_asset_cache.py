@@ -0,0 +1,185 @@
+"""
+Template Asset Cache - Cache ảnh frame/watermark của template đã decode (RGBA)
+
+- LRU giới hạn theo dung lượng ảnh đã decode (TEMPLATE_ASSET_CACHE_MAX_MB)
+- Key theo URL; cache hợp lệ khi:
+  - File local (localhost URL): mtime + size của file không đổi
+  - HTTP: trong TEMPLATE_ASSET_REVALIDATE_SECONDS từ lần kiểm tra trước,
+    sau đó revalidate bằng If-None-Match / If-Modified-Since (304 -> dùng lại ảnh đã decode)
+- Mỗi asset giữ thêm các biến thể đã resize (VD: frame theo kích thước ảnh, watermark theo kích thước + opacity),
+  tối đa TEMPLATE_ASSET_CACHE_MAX_VARIANTS biến thể / asset
+- Ảnh trả về dùng chung giữa các lần xử lý: chỉ đọc, không sửa trực tiếp (copy() nếu cần sửa)
+"""
+
+import sys
+sys.path.append('..')
+
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import requests
+from PIL import Image
+
+from core.config import settings
+from services.image_utils import get_absolute_path_from_url, is_localhost_url, normalize_url
+
+
+def _image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class TemplateAsset:
+    """Ảnh template đã decode và các biến thể đã resize"""
+
+    def __init__(self, url: str, image: Image.Image, validator: Tuple):
+        self.url = url
+        self.image = image
+        self.validator = validator
+        self.checked_at = time.monotonic()
+        self.variants: "OrderedDict[Hashable, Image.Image]" = OrderedDict()
+
+    @property
+    def nbytes(self) -> int:
+        return _image_bytes(self.image) + sum(_image_bytes(variant) for variant in self.variants.values())
+
+
+class TemplateAssetCache:
+    """LRU cache cho asset template, dùng chung trong process"""
+
+    def __init__(self, max_bytes: int, max_variants: int, revalidate_seconds: float):
+        self.max_bytes = max_bytes
+        self.max_variants = max_variants
+        self.revalidate_seconds = revalidate_seconds
+        self._assets: "OrderedDict[str, TemplateAsset]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Mỗi URL chỉ load một lần dù nhiều ảnh cùng cần asset đó
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self._hits = 0
+        self._misses = 0
+        self._revalidated = 0
+        self._variant_hits = 0
+        self._variant_misses = 0
+
+    def get(self, url: str) -> Image.Image:
+        """Ảnh RGBA đã decode của asset (chỉ đọc)"""
+        return self._get_asset(url).image
+
+    def variant(self, url: str, key: Hashable, build: Callable[[Image.Image], Image.Image]) -> Image.Image:
+        """
+        Biến thể của asset (chỉ đọc), build(image) chỉ chạy khi chưa có trong cache
+
+        Args:
+            url: URL asset
+            key: Key biến thể (VD: ("frame", (1080, 1080)))
+            build: Hàm tạo biến thể từ ảnh gốc
+        """
+        asset = self._get_asset(url)
+        with self._lock:
+            variant = asset.variants.get(key)
+            if variant is not None:
+                asset.variants.move_to_end(key)
+                self._variant_hits += 1
+                return variant
+            self._variant_misses += 1
+
+        variant = build(asset.image)
+        with self._lock:
+            asset.variants[key] = variant
+            while len(asset.variants) > self.max_variants:
+                asset.variants.popitem(last=False)
+            self._evict()
+        return variant
+
+    def clear(self):
+        with self._lock:
+            self._assets.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "assets": len(self._assets),
+                "variants": sum(len(asset.variants) for asset in self._assets.values()),
+                "size_mb": round(sum(asset.nbytes for asset in self._assets.values()) / (1024 * 1024), 1),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+                "hits": self._hits,
+                "misses": self._misses,
+                "revalidated": self._revalidated,
+                "variant_hits": self._variant_hits,
+                "variant_misses": self._variant_misses
+            }
+
+    def _get_asset(self, url: str) -> TemplateAsset:
+        url = normalize_url(url)
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        with url_lock:
+            with self._lock:
+                cached = self._assets.get(url)
+            asset = self._load(url, cached)
+            with self._lock:
+                if asset is cached:
+                    self._hits += 1
+                else:
+                    self._misses += 1
+                self._assets[url] = asset
+                self._assets.move_to_end(url)
+                self._evict()
+            return asset
+
+    def _load(self, url: str, cached: Optional[TemplateAsset]) -> TemplateAsset:
+        """Trả asset trong cache nếu còn hợp lệ, ngược lại đọc file / tải lại"""
+        # Xử lý localhost URLs - đọc trực tiếp từ disk
+        if is_localhost_url(url):
+            absolute_path = get_absolute_path_from_url(url)
+            if absolute_path and os.path.exists(absolute_path):
+                stat = os.stat(absolute_path)
+                validator = ("file", stat.st_mtime_ns, stat.st_size)
+                if cached is not None and cached.validator == validator:
+                    return cached
+                print(f"  ✅ Reading template asset from disk: {absolute_path}")
+                return TemplateAsset(url, Image.open(absolute_path).convert('RGBA'), validator)
+            print(f"  ⚠️ File not found at: {absolute_path}, trying HTTP download...")
+
+        if cached is not None and cached.validator[0] == "http":
+            if time.monotonic() - cached.checked_at < self.revalidate_seconds:
+                return cached
+
+        headers = {}
+        if cached is not None and cached.validator[0] == "http":
+            _, etag, last_modified = cached.validator
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        # Download qua HTTP với timeout dài hơn
+        response = requests.get(url, timeout=30, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            cached.checked_at = time.monotonic()
+            with self._lock:
+                self._revalidated += 1
+            return cached
+        response.raise_for_status()
+        print(f"  ✅ Downloaded template asset {url} ({len(response.content)} bytes)")
+        validator = ("http", response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return TemplateAsset(url, Image.open(io.BytesIO(response.content)).convert('RGBA'), validator)
+
+    def _evict(self):
+        """Bỏ asset ít dùng nhất tới khi tổng dung lượng <= max_bytes (giữ lại asset vừa dùng)"""
+        total = sum(asset.nbytes for asset in self._assets.values())
+        while total > self.max_bytes and len(self._assets) > 1:
+            _, evicted = self._assets.popitem(last=False)
+            total -= evicted.nbytes
+
+
+# Global instance
+template_asset_cache = TemplateAssetCache(
+    max_bytes=settings.TEMPLATE_ASSET_CACHE_MAX_MB * 1024 * 1024,
+    max_variants=settings.TEMPLATE_ASSET_CACHE_MAX_VARIANTS,
+    revalidate_seconds=settings.TEMPLATE_ASSET_REVALIDATE_SECONDS
+)
@@ -11,7 +11,10 @@ Documentation:
 - https://developers.facebook.com/docs/threads/reference/media
 """
 
-import requests
+import asyncio
+
+from services.http_client import http_client
+from core.config import settings
 from typing import List, Dict, Optional
 
 
@@ -121,7 +124,7 @@ async def post_single_image_to_threads(
     
     print(f"🔄 [Threads B1] Creating media container...")
     print(f"   🖼️ Image URL: {image_url}")
-    create_response = requests.post(create_url, json=create_data)
+    create_response = await http_client.post(create_url, json=create_data)
     
     if create_response.status_code != 200:
         error_data = create_response.json()
@@ -144,33 +147,17 @@ async def post_single_image_to_threads(
     }
     
     print(f"🔄 [Threads B2] Publishing container {container_id}...")
-    publish_response = requests.post(publish_url, json=publish_data)
+    publish_response = await http_client.post(publish_url, json=publish_data)
     
     if publish_response.status_code == 200:
         result = publish_response.json()
         media_id = result.get("id")
         print(f"✅ [Threads B2] Published successfully: {media_id}")
         
-        # Step 3: Lấy permalink từ media ID
-        permalink = None
-        try:
-            media_info_url = f"https://graph.threads.net/v1.0/{media_id}"
-            media_info_params = {
-                "fields": "permalink",
-                "access_token": access_token
-            }
-            media_info_response = requests.get(media_info_url, params=media_info_params)
-            if media_info_response.status_code == 200:
-                permalink = media_info_response.json().get("permalink")
-                print(f"🔗 [Threads] Permalink: {permalink}")
-        except Exception as e:
-            print(f"⚠️ [Threads] Could not fetch permalink: {e}")
-        
         return {
             "success": True,
             "post_id": media_id,
             "container_id": container_id,
-            "permalink": permalink,
             "message": "Posted to Threads successfully"
         }
     else:
@@ -197,7 +184,7 @@ async def post_video_to_threads(
     Step 1: Create Video Container
     POST https://graph.threads.net/v1.0/{threads-user-id}/threads
     
-    Step 2: Publish Video Container
+    Step 2: Publish Video Container (container_poller publish khi container FINISHED)
     POST https://graph.threads.net/v1.0/{threads-user-id}/threads_publish
     """
     
@@ -212,7 +199,7 @@ async def post_video_to_threads(
     
     print(f"🔄 [Threads B1] Creating video container...")
     print(f"   🎥 Video URL: {video_url}")
-    create_response = requests.post(create_url, json=create_data)
+    create_response = await http_client.post(create_url, json=create_data)
     
     if create_response.status_code != 200:
         error_data = create_response.json()
@@ -227,36 +214,68 @@ async def post_video_to_threads(
     container_id = create_response.json().get("id")
     print(f"✅ [Threads B1] Video container created: {container_id}")
     
-    # Step 2: Publish container
+    # Step 2: Video cần thời gian xử lý -> container_poller poll status
+    # và publish khi FINISHED (xem get_container_status / publish_container)
+    return {
+        "success": True,
+        "pending": True,
+        "container_id": container_id,
+        "message": "Threads video container created, waiting for processing"
+    }
+
+
+async def get_container_status(container_id: str, access_token: str) -> Dict:
+    """
+    Lấy trạng thái media container
+    
+    GET https://graph.threads.net/v1.0/{container-id}?fields=status,error_message
+    status: IN_PROGRESS | FINISHED | ERROR | EXPIRED | PUBLISHED
+    """
+    info = await _fetch_container_status(container_id, access_token)
+    if not info.get("success"):
+        return info
+    return {
+        "success": True,
+        "status_code": info.get("status"),
+        "status": info.get("error_message")
+    }
+
+
+async def publish_container(threads_user_id: str, access_token: str, container_id: str) -> Dict:
+    """
+    Publish media container đã FINISHED (permalink lấy sau qua permalink_resolver)
+    
+    POST https://graph.threads.net/v1.0/{threads-user-id}/threads_publish
+    """
     publish_url = f"https://graph.threads.net/v1.0/{threads_user_id}/threads_publish"
     publish_data = {
         "creation_id": container_id,
         "access_token": access_token
     }
     
-    print(f"🔄 [Threads B2] Publishing video container {container_id}...")
-    publish_response = requests.post(publish_url, json=publish_data)
+    print(f"🔄 [Threads B2] Publishing container {container_id}...")
+    publish_response = await http_client.post(publish_url, json=publish_data)
     
-    if publish_response.status_code == 200:
-        result = publish_response.json()
-        media_id = result.get("id")
-        print(f"✅ [Threads B2] Video published successfully: {media_id}")
-        return {
-            "success": True,
-            "post_id": media_id,
-            "container_id": container_id,
-            "message": "Posted video to Threads successfully"
-        }
-    else:
+    if publish_response.status_code != 200:
         error_data = publish_response.json()
         print(f"❌ [Threads B2] Failed: {error_data}")
         return {
             "success": False,
             "error": error_data,
             "container_id": container_id,
-            "message": "Failed to publish Threads video container",
+            "message": "Failed to publish Threads container",
             "step": "publish_container"
         }
+    
+    media_id = publish_response.json().get("id")
+    print(f"✅ [Threads B2] Published successfully: {media_id}")
+    
+    return {
+        "success": True,
+        "post_id": media_id,
+        "container_id": container_id,
+        "message": "Published Threads container successfully"
+    }
 
 
 async def post_text_to_threads(
@@ -283,7 +302,7 @@ async def post_text_to_threads(
     }
     
     print(f"🔄 [Threads B1] Creating text post...")
-    create_response = requests.post(create_url, json=create_data)
+    create_response = await http_client.post(create_url, json=create_data)
     
     if create_response.status_code != 200:
         error_data = create_response.json()
@@ -306,7 +325,7 @@ async def post_text_to_threads(
     }
     
     print(f"🔄 [Threads B2] Publishing text container {container_id}...")
-    publish_response = requests.post(publish_url, json=publish_data)
+    publish_response = await http_client.post(publish_url, json=publish_data)
     
     if publish_response.status_code == 200:
         result = publish_response.json()
@@ -340,7 +359,7 @@ async def post_carousel_to_threads(
     Đăng carousel (nhiều ảnh) lên Threads
     
     Flow:
-    1. Tạo item container cho từng ảnh (không cần text)
+    1. Tạo item container cho tất cả ảnh song song (không cần text), chờ tất cả FINISHED
     2. Tạo carousel container chính (có text)
     3. Publish carousel container
     
@@ -353,37 +372,37 @@ async def post_carousel_to_threads(
     
     print(f"🔄 [Threads Carousel] Creating carousel with {len(image_urls)} images...")
     
-    # Step 1: Tạo item container cho từng ảnh
-    item_ids = []
-    for idx, image_url in enumerate(image_urls):
-        print(f"   🖼️ [Item {idx+1}/{len(image_urls)}] Creating container for: {image_url}")
-        
-        item_url = f"https://graph.threads.net/v1.0/{threads_user_id}/threads"
-        item_data = {
-            "media_type": "IMAGE",
-            "image_url": image_url,
-            "is_carousel_item": True,
-            "access_token": access_token
-        }
-        
-        item_response = requests.post(item_url, json=item_data)
-        
-        if item_response.status_code != 200:
-            error_data = item_response.json()
-            print(f"   ❌ [Item {idx+1}] Failed: {error_data}")
+    # Step 1: Tạo item container cho tất cả ảnh song song
+    semaphore = asyncio.Semaphore(settings.CAROUSEL_ITEM_CONCURRENCY)
+    item_results = await asyncio.gather(*[
+        _create_carousel_item_container(threads_user_id, access_token, idx, image_url, semaphore)
+        for idx, image_url in enumerate(image_urls)
+    ])
+    
+    for idx, item_result in enumerate(item_results):
+        if not item_result.get("success"):
+            print(f"   ❌ [Item {idx+1}] Failed: {item_result.get('error')}")
             return {
                 "success": False,
-                "error": error_data,
+                "error": item_result.get("error"),
                 "message": f"Failed to create carousel item {idx+1}",
                 "step": "create_item_container"
             }
-        
-        item_id = item_response.json().get("id")
-        item_ids.append(item_id)
-        print(f"   ✅ [Item {idx+1}] Container created: {item_id}")
     
+    item_ids = [item_result["container_id"] for item_result in item_results]
     print(f"✅ [Threads Carousel] All {len(item_ids)} item containers created")
     
+    # Chỉ tạo carousel khi mọi item container đã FINISHED
+    ready = await _wait_for_item_containers(item_ids, access_token)
+    if not ready.get("success"):
+        print(f"❌ [Threads Carousel] Item containers not ready: {ready.get('error')}")
+        return {
+            "success": False,
+            "error": ready.get("error"),
+            "message": "Carousel item containers not ready",
+            "step": "wait_item_containers"
+        }
+    
     # Step 2: Tạo carousel container chính
     print(f"🔄 [Threads Carousel B1] Creating main carousel container...")
     carousel_url = f"https://graph.threads.net/v1.0/{threads_user_id}/threads"
@@ -394,7 +413,7 @@ async def post_carousel_to_threads(
         "access_token": access_token
     }
     
-    carousel_response = requests.post(carousel_url, json=carousel_data)
+    carousel_response = await http_client.post(carousel_url, json=carousel_data)
     
     if carousel_response.status_code != 200:
         error_data = carousel_response.json()
@@ -417,7 +436,7 @@ async def post_carousel_to_threads(
         "access_token": access_token
     }
     
-    publish_response = requests.post(publish_url, json=publish_data)
+    publish_response = await http_client.post(publish_url, json=publish_data)
     
     if publish_response.status_code == 200:
         result = publish_response.json()
@@ -425,28 +444,12 @@ async def post_carousel_to_threads(
         print(f"✅ [Threads Carousel B2] Published successfully: {media_id}")
         print(f"   📸 Total images: {len(image_urls)}")
         
-        # Lấy permalink từ media ID
-        permalink = None
-        try:
-            media_info_url = f"https://graph.threads.net/v1.0/{media_id}"
-            media_info_params = {
-                "fields": "permalink",
-                "access_token": access_token
-            }
-            media_info_response = requests.get(media_info_url, params=media_info_params)
-            if media_info_response.status_code == 200:
-                permalink = media_info_response.json().get("permalink")
-                print(f"🔗 [Threads Carousel] Permalink: {permalink}")
-        except Exception as e:
-            print(f"⚠️ [Threads Carousel] Could not fetch permalink: {e}")
-        
         return {
             "success": True,
             "post_id": media_id,
             "container_id": carousel_id,
             "item_ids": item_ids,
             "total_images": len(image_urls),
-            "permalink": permalink,
             "message": f"Posted carousel with {len(image_urls)} images to Threads successfully"
         }
     else:
@@ -460,3 +463,133 @@ async def post_carousel_to_threads(
             "message": "Failed to publish Threads carousel",
             "step": "publish_carousel"
         }
+
+
+async def _create_carousel_item_container(
+    threads_user_id: str,
+    access_token: str,
+    idx: int,
+    image_url: str,
+    semaphore: asyncio.Semaphore
+) -> Dict:
+    """Tạo container cho 1 ảnh của carousel (is_carousel_item=True)"""
+    print(f"   🖼️ [Item {idx+1}] Creating container for: {image_url}")
+    
+    item_url = f"https://graph.threads.net/v1.0/{threads_user_id}/threads"
+    item_data = {
+        "media_type": "IMAGE",
+        "image_url": image_url,
+        "is_carousel_item": True,
+        "access_token": access_token
+    }
+    
+    async with semaphore:
+        item_response = await http_client.post(item_url, json=item_data)
+    
+    if item_response.status_code != 200:
+        return {
+            "success": False,
+            "error": item_response.json()
+        }
+    
+    item_id = item_response.json().get("id")
+    print(f"   ✅ [Item {idx+1}] Container created: {item_id}")
+    return {
+        "success": True,
+        "container_id": item_id
+    }
+
+
+async def _fetch_container_status(container_id: str, access_token: str) -> Dict:
+    """GET /{container-id}?fields=status,error_message"""
+    response = await http_client.get(
+        f"https://graph.threads.net/v1.0/{container_id}",
+        params={
+            "fields": "status,error_message",
+            "access_token": access_token
+        }
+    )
+    if response.status_code != 200:
+        return {"success": False, "error": response.json()}
+    return {"success": True, **response.json()}
+
+
+async def _wait_for_item_containers(container_ids: List[str], access_token: str) -> Dict:
+    """
+    Poll trạng thái các container song song cho tới khi tất cả FINISHED
+    status: IN_PROGRESS | FINISHED | ERROR | EXPIRED | PUBLISHED
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.CONTAINER_POLL_TIMEOUT_SECONDS
+    interval = settings.CONTAINER_POLL_INTERVAL_SECONDS
+    pending = list(container_ids)
+    
+    while True:
+        statuses = await asyncio.gather(*[
+            _fetch_container_status(container_id, access_token) for container_id in pending
+        ])
+        
+        still_pending = []
+        for container_id, info in zip(pending, statuses):
+            if not info.get("success"):
+                return {"success": False, "error": info.get("error")}
+            status = info.get("status")
+            if status in ("FINISHED", "PUBLISHED"):
+                continue
+            if status in ("ERROR", "EXPIRED"):
+                return {
+                    "success": False,
+                    "error": {
+                        "message": f"Carousel item container {container_id} {status}: {info.get('error_message', '')}"
+                    }
+                }
+            still_pending.append(container_id)
+        
+        if not still_pending:
+            return {"success": True}
+        
+        if loop.time() >= deadline:
+            return {
+                "success": False,
+                "error": {
+                    "message": f"Timed out waiting for carousel item containers: {', '.join(still_pending)}",
+                    "is_transient": True
+                }
+            }
+        
+        print(f"⏳ [Threads Carousel] {len(still_pending)}/{len(container_ids)} item containers in progress")
+        pending = still_pending
+        await asyncio.sleep(interval)
+        interval = min(interval * 1.5, settings.CONTAINER_POLL_MAX_INTERVAL_SECONDS)
+
+
+async def refresh_access_token(access_token: str) -> Dict:
+    """
+    Gia hạn long-lived token Threads (60 ngày); token phải còn hạn và đã được cấp ít nhất 24h
+    
+    GET https://graph.threads.net/refresh_access_token?grant_type=th_refresh_token
+    
+    Returns:
+        Dict: {"success", "access_token", "expires_in"} hoặc {"success": False, "error", "status_code"}
+    """
+    url = "https://graph.threads.net/refresh_access_token"
+    params = {
+        "grant_type": "th_refresh_token",
+        "access_token": access_token
+    }
+    
+    response = await http_client.get(url, params=params)
+    data = response.json()
+    
+    if response.status_code != 200 or "access_token" not in data:
+        return {
+            "success": False,
+            "error": data.get("error", data),
+            "status_code": response.status_code
+        }
+    
+    return {
+        "success": True,
+        "access_token": data["access_token"],
+        "expires_in": data.get("expires_in")
+    }
@@ -12,14 +12,26 @@ Documentation:
 - https://developers.tiktok.com/doc/content-posting-api-video-post
 """
 
-import requests
-from typing import Dict, Optional
+import asyncio
+import httpx
+from pathlib import Path
+from services.http_client import http_client
+from core.config import settings
+from typing import AsyncIterator, Dict, Optional, Tuple, Union
 import os
 
 
+# FILE_UPLOAD chunk rules: chunk 5MB-64MB (chunk cuối tối đa 128MB, gộp phần dư),
+# video < 5MB phải upload nguyên 1 chunk
+TIKTOK_MIN_CHUNK_SIZE = 5 * 1024 * 1024
+TIKTOK_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# Kích thước block đọc từ file khi stream 1 chunk
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+
 async def post_to_tiktok(
     access_token: str,
-    video_file: bytes,
+    video_file: Union[bytes, Path],
     title: str = "",
     description: str = "",
     privacy_level: str = "SELF_ONLY",  # ✅ Sandbox mode requires SELF_ONLY
@@ -31,13 +43,13 @@ async def post_to_tiktok(
     Đăng video lên TikTok (PRODUCTION API)
     
     Flow:
-    1. POST /v2/post/publish/video/init/ - Initialize với post_info + source_info
-    2. PUT {upload_url} - Upload video binary với Content-Range
+    1. POST /v2/post/publish/video/init/ - Initialize với post_info + source_info (chunk_size, total_chunk_count)
+    2. PUT {upload_url} - Upload từng chunk với Content-Range (stream từ file, retry từng chunk)
     3. POST /v2/post/publish/status/fetch/ - Check status (PROCESSING → PUBLISHED)
     
     Args:
         access_token: TikTok User Access Token (from OAuth)
-        video_file: Video file data (bytes)
+        video_file: Video file data (bytes) hoặc Path tới file video (stream từ disk)
         title: Tiêu đề video (max 150 characters)
         description: Mô tả video / caption (max 2200 characters) - optional
         privacy_level: PUBLIC_TO_EVERYONE | MUTUAL_FOLLOW_FRIENDS | SELF_ONLY
@@ -64,7 +76,10 @@ async def post_to_tiktok(
     print(f"\n{'='*60}")
     print(f"🎬 TIKTOK VIDEO UPLOAD - PRODUCTION API")
     print(f"{'='*60}")
-    print(f"📊 Video size: {len(video_file)} bytes ({len(video_file) / 1024 / 1024:.2f} MB)")
+    video_size = _get_video_size(video_file)
+    chunk_size, total_chunk_count = _plan_chunks(video_size)
+    print(f"📊 Video size: {video_size} bytes ({video_size / 1024 / 1024:.2f} MB)")
+    print(f"🧩 Chunks: {total_chunk_count} x {chunk_size / 1024 / 1024:.2f} MB")
     print(f"📝 Title: {title[:50]}{'...' if len(title) > 50 else ''}")
     print(f"🔒 Privacy: {privacy_level}")
     
@@ -72,7 +87,9 @@ async def post_to_tiktok(
     print(f"\n📍 STEP 1: Initialize Upload (with post_info)")
     init_response = await _initialize_video_upload(
         access_token=access_token,
-        video_size=len(video_file),
+        video_size=video_size,
+        chunk_size=chunk_size,
+        total_chunk_count=total_chunk_count,
         title=title,
         privacy_level=privacy_level,
         disable_comment=disable_comment,
@@ -91,7 +108,7 @@ async def post_to_tiktok(
     
     # Step 2: Upload video (B2)
     print(f"\n📍 STEP 2: Upload Video Binary")
-    upload_response = await _upload_video(upload_url, video_file)
+    upload_response = await _upload_video(upload_url, video_file, video_size, chunk_size, total_chunk_count)
     
     if not upload_response.get("success"):
         print(f"❌ Step 2 Failed: {upload_response.get('message')}")
@@ -117,6 +134,8 @@ async def post_to_tiktok(
 async def _initialize_video_upload(
     access_token: str,
     video_size: int,
+    chunk_size: int,
+    total_chunk_count: int,
     title: str,
     privacy_level: str,
     disable_comment: bool,
@@ -131,6 +150,8 @@ async def _initialize_video_upload(
     Args:
         access_token: TikTok access token
         video_size: Kích thước video (bytes)
+        chunk_size: Kích thước mỗi chunk (bytes)
+        total_chunk_count: Số chunk
         title: Tiêu đề video
         privacy_level: Mức độ riêng tư
         disable_comment: Tắt comment
@@ -165,8 +186,8 @@ async def _initialize_video_upload(
         "source_info": {
             "source": "FILE_UPLOAD",
             "video_size": video_size,
-            "chunk_size": video_size,  # Upload toàn bộ trong 1 chunk
-            "total_chunk_count": 1
+            "chunk_size": chunk_size,
+            "total_chunk_count": total_chunk_count
         }
     }
     
@@ -176,7 +197,7 @@ async def _initialize_video_upload(
     print(f"      source_info: {payload['source_info']}")
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        response = await http_client.post(url, headers=headers, json=payload, timeout=30)
         
         print(f"   📥 Status: {response.status_code}")
         
@@ -227,7 +248,7 @@ async def _initialize_video_upload(
                 "status_code": response.status_code,
                 "message": f"TikTok API returned status {response.status_code}"
             }
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return {
             "success": False,
             "error": "Request timeout",
@@ -242,55 +263,146 @@ async def _initialize_video_upload(
         }
 
 
-async def _upload_video(upload_url: str, video_file: bytes) -> Dict:
+def _get_video_size(video_file: Union[bytes, Path]) -> int:
+    if isinstance(video_file, (str, Path)):
+        return os.path.getsize(video_file)
+    return len(video_file)
+
+
+def _plan_chunks(video_size: int) -> Tuple[int, int]:
     """
-    Upload video file lên TikTok (SANDBOX - B2)
-    
-    PUT {upload_url} với binary video data
+    Tính chunk_size và total_chunk_count theo quy định FILE_UPLOAD của TikTok
+    Chunk cuối gộp phần dư (total = floor(video_size / chunk_size))
+    """
+    if video_size < TIKTOK_MIN_CHUNK_SIZE:
+        return video_size, 1
+    
+    chunk_size = min(max(settings.TIKTOK_UPLOAD_CHUNK_SIZE, TIKTOK_MIN_CHUNK_SIZE), TIKTOK_MAX_CHUNK_SIZE)
+    total_chunk_count = video_size // chunk_size
+    if total_chunk_count <= 1:
+        return video_size, 1
+    return chunk_size, total_chunk_count
+
+
+def _read_file_range(path: Path, offset: int, length: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+async def _iter_chunk(video_file: Union[bytes, Path], start: int, end: int) -> AsyncIterator[bytes]:
+    """Stream byte [start, end] của video theo block nhỏ (không đọc cả chunk vào RAM)"""
+    offset = start
+    while offset <= end:
+        length = min(STREAM_BLOCK_SIZE, end - offset + 1)
+        if isinstance(video_file, (str, Path)):
+            block = await asyncio.to_thread(_read_file_range, Path(video_file), offset, length)
+        else:
+            block = bytes(memoryview(video_file)[offset:offset + length])
+        if not block:
+            break
+        yield block
+        offset += len(block)
+
+
+async def _upload_video(
+    upload_url: str,
+    video_file: Union[bytes, Path],
+    video_size: int,
+    chunk_size: int,
+    total_chunk_count: int
+) -> Dict:
+    """
+    Upload video lên TikTok theo từng chunk (B2)
     
-    Note: TikTok yêu cầu Content-Range header để upload chunk
+    PUT {upload_url} cho mỗi chunk với Content-Range: bytes {start}-{end}/{video_size}
+    Chunk cuối gộp phần dư. Mỗi chunk được retry riêng khi gặp lỗi tạm thời.
     """
+    print(f"🎬 [TikTok B2] Uploading video to: {upload_url}")
+    print(f"   Video size: {video_size} bytes ({video_size / 1024 / 1024:.2f} MB), {total_chunk_count} chunk(s)")
     
-    video_size = len(video_file)
+    for chunk_index in range(total_chunk_count):
+        start = chunk_index * chunk_size
+        end = video_size - 1 if chunk_index == total_chunk_count - 1 else start + chunk_size - 1
+        
+        result = await _upload_chunk(upload_url, video_file, start, end, video_size)
+        if not result.get("success"):
+            result["chunk_index"] = chunk_index
+            return result
+        
+        print(f"   ✅ Chunk {chunk_index + 1}/{total_chunk_count} uploaded ({start}-{end})")
     
+    print(f"   ✅ Video uploaded successfully!")
+    return {
+        "success": True,
+        "message": "Video uploaded successfully"
+    }
+
+
+async def _upload_chunk(
+    upload_url: str,
+    video_file: Union[bytes, Path],
+    start: int,
+    end: int,
+    video_size: int
+) -> Dict:
+    """PUT một chunk, retry với backoff khi timeout / lỗi mạng / 5xx / 429"""
     headers = {
         "Content-Type": "video/mp4",
-        "Content-Length": str(video_size),
-        "Content-Range": f"bytes 0-{video_size-1}/{video_size}"  # Required by TikTok
+        "Content-Length": str(end - start + 1),
+        "Content-Range": f"bytes {start}-{end}/{video_size}"  # Required by TikTok
     }
-    
-    print(f"🎬 [TikTok B2] Uploading video to: {upload_url}")
-    print(f"   Video size: {video_size} bytes ({video_size / 1024 / 1024:.2f} MB)")
-    print(f"   Headers: {headers}")
-    
-    try:
-        # Upload với binary data
-        response = requests.put(upload_url, headers=headers, data=video_file, timeout=300)
-        
-        print(f"   Status: {response.status_code}")
-        print(f"   Response: {response.text[:500] if response.text else 'Empty'}")
-        
-        if response.status_code in [200, 201]:
-            print(f"   ✅ Video uploaded successfully!")
-            return {
-                "success": True,
-                "message": "Video uploaded successfully"
-            }
-        else:
-            print(f"   ❌ Upload failed: {response.text}")
-            return {
+    max_retries = settings.TIKTOK_CHUNK_MAX_RETRIES
+    
+    for attempt in range(max_retries + 1):
+        try:
+            response = await http_client.put(
+                upload_url,
+                headers=headers,
+                content=_iter_chunk(video_file, start, end),
+                timeout=settings.HTTP_UPLOAD_TIMEOUT_SECONDS
+            )
+            
+            # 206: chunk đã nhận, 201: upload hoàn tất
+            if response.status_code in [200, 201, 206]:
+                return {"success": True}
+            
+            retryable = response.status_code == 429 or response.status_code >= 500
+            failure = {
                 "success": False,
                 "error": response.text or f"HTTP {response.status_code}",
                 "status_code": response.status_code,
                 "message": f"Failed to upload video to TikTok (Status: {response.status_code})"
             }
-    except Exception as e:
-        print(f"   ❌ Exception during upload: {str(e)}")
-        return {
-            "success": False,
-            "error": str(e),
-            "message": f"Exception during video upload: {str(e)}"
-        }
+        except httpx.TimeoutException:
+            retryable = True
+            failure = {
+                "success": False,
+                "error": "Request timeout",
+                "message": "TikTok chunk upload timed out"
+            }
+        except httpx.TransportError as e:
+            retryable = True
+            failure = {
+                "success": False,
+                "error": str(e),
+                "message": f"Exception during video upload: {str(e)}"
+            }
+        except Exception as e:
+            print(f"   ❌ Exception during upload: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "message": f"Exception during video upload: {str(e)}"
+            }
+        
+        if not retryable or attempt == max_retries:
+            print(f"   ❌ Upload failed ({start}-{end}): {failure['error']}")
+            return failure
+        
+        delay = 2 ** attempt
+        print(f"   🔁 Chunk {start}-{end} failed ({failure['error']}), retry {attempt + 1}/{max_retries} in {delay}s")
+        await asyncio.sleep(delay)
 
 
 async def check_publish_status(access_token: str, publish_id: str) -> Dict:
@@ -342,7 +454,7 @@ async def check_publish_status(access_token: str, publish_id: str) -> Dict:
     print(f"   Publish ID: {publish_id}")
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        response = await http_client.post(url, headers=headers, json=payload, timeout=30)
         
         if response.status_code == 200:
             response_data = response.json()
@@ -351,6 +463,9 @@ async def check_publish_status(access_token: str, publish_id: str) -> Dict:
             
             status = data.get("status")  # PROCESSING, PUBLISHED, FAILED
             video_id = data.get("video_id")
+            # API v2 trả id video public trong publicaly_available_post_id (list)
+            if not video_id and data.get("publicaly_available_post_id"):
+                video_id = str(data["publicaly_available_post_id"][0])
             cover_url = data.get("cover_url")
             share_url = data.get("share_url")
             
@@ -393,6 +508,7 @@ async def check_publish_status(access_token: str, publish_id: str) -> Dict:
             return {
                 "success": False,
                 "error": error_data,
+                "status_code": response.status_code,
                 "message": f"Failed to check TikTok publish status (HTTP {response.status_code})"
             }
     except Exception as e:
@@ -420,9 +536,60 @@ async def get_user_info(access_token: str) -> Optional[Dict]:
         "fields": "open_id,union_id,avatar_url,display_name,username,follower_count,following_count,likes_count,video_count"
     }
     
-    response = requests.get(url, headers=headers, params=params)
+    response = await http_client.get(url, headers=headers, params=params)
     
     if response.status_code == 200:
         return response.json().get("data", {}).get("user")
     else:
         return None
+
+
+def get_client_credentials() -> Tuple[str, str]:
+    """(client_key, client_secret) của TikTok app; raise nếu chưa cấu hình"""
+    if not settings.TIKTOK_CLIENT_KEY or not settings.TIKTOK_CLIENT_SECRET:
+        raise ValueError("Missing TikTok OAuth credentials. Please set TIKTOK_CLIENT_KEY and TIKTOK_CLIENT_SECRET environment variables")
+    return settings.TIKTOK_CLIENT_KEY, settings.TIKTOK_CLIENT_SECRET
+
+
+async def refresh_access_token(refresh_token: str) -> Dict:
+    """
+    Đổi refresh token lấy access token mới (access token TikTok sống 24h, refresh token 365 ngày)
+    
+    POST https://open.tiktokapis.com/v2/oauth/token/
+    
+    Returns:
+        Dict: {"success", "access_token", "refresh_token", "expires_in"}
+              hoặc {"success": False, "error", "status_code"}
+    """
+    
+    client_key, client_secret = get_client_credentials()
+    url = "https://open.tiktokapis.com/v2/oauth/token/"
+    
+    headers = {
+        "Content-Type": "application/x-www-form-urlencoded"
+    }
+    
+    data = {
+        "client_key": client_key,
+        "client_secret": client_secret,
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token
+    }
+    
+    response = await http_client.post(url, data=data, headers=headers)
+    token_info = response.json()
+    
+    if response.status_code != 200 or "access_token" not in token_info:
+        return {
+            "success": False,
+            "error": token_info.get("error_description") or token_info.get("error", "unknown_error"),
+            "error_code": token_info.get("error"),
+            "status_code": response.status_code
+        }
+    
+    return {
+        "success": True,
+        "access_token": token_info["access_token"],
+        "refresh_token": token_info.get("refresh_token") or refresh_token,
+        "expires_in": token_info.get("expires_in", 86400)
+    }
@@ -0,0 +1,343 @@
+"""
+TikTok Status Tracker - Theo dõi trạng thái xử lý video TikTok sau khi upload
+
+Sau khi post_to_tiktok upload xong, TikTok còn xử lý video (PROCESSING_UPLOAD...).
+Post được giữ ở 'publishing' và tracker:
+- Gom tất cả publish_id tới hạn kiểm tra trong một vòng (check song song có giới hạn)
+- Interval thích ứng: bắt đầu TIKTOK_STATUS_POLL_INITIAL_SECONDS, x1.5 tới TIKTOK_STATUS_POLL_MAX_SECONDS
+- PUBLISH_COMPLETE -> cập nhật status, platform_post_id (video id), platform_post_url (share_url)
+- FAILED -> PostService._mark_failed (retry nếu lỗi tạm thời)
+- Giữ lease trên post; instance khởi động sau tiếp quản publish_id của instance đã chết
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import heapq
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update
+
+from config.database import async_session_maker
+from core.config import settings
+from models.model import Post, Page, PostStatus
+from services.post_service import PostService
+from services.storage_service import storage_service
+from services.tiktok_service import check_publish_status
+from utils.timezone_utils import now_utc
+
+logger = logging.getLogger(__name__)
+
+
+# Trạng thái xử lý xong của TikTok (PUBLISHED giữ cho tương thích response cũ)
+TIKTOK_DONE_STATUSES = {"PUBLISH_COMPLETE", "PUBLISHED", "SEND_TO_USER_INBOX"}
+
+
+@dataclass
+class PendingPublish:
+    """Một video TikTok đang chờ xử lý"""
+    post_id: int
+    publish_id: str
+    access_token: str
+    created_at: datetime
+    interval: float = 0.0
+    due_at: float = 0.0  # loop.time() của lần check kế tiếp; entry khác trong heap là stale
+
+
+class TikTokStatusTracker:
+    """Background tracker cho các publish_id TikTok đang PROCESSING"""
+
+    def __init__(self):
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_duration = timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        self._pending: Dict[int, PendingPublish] = {}
+        # Heap (thời điểm check tiếp theo theo loop.time(), post_id)
+        self._heap: List[tuple] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Tiếp quản publish_id đang chờ và chạy tracking loop"""
+        if self._task and not self._task.done():
+            return
+        await self._adopt_orphans()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🎵 TikTok status tracker started ({len(self._pending)} pending)")
+
+    async def shutdown(self):
+        """Dừng loop và trả lease để instance khác tiếp quản ngay"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._pending:
+            try:
+                async with async_session_maker() as session:
+                    await session.execute(
+                        update(Post)
+                        .where(Post.id.in_(list(self._pending)))
+                        .where(Post.lease_owner == self.instance_id)
+                        .values(lease_owner=None, lease_expires_at=None)
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not release TikTok tracker leases: {str(e)}")
+        self._pending.clear()
+        self._heap.clear()
+
+    def lease_expiry(self) -> datetime:
+        return now_utc() + self.lease_duration
+
+    def register(self, post_id: int, publish_id: str, access_token: str, created_at: Optional[datetime] = None):
+        """
+        Theo dõi publish_id của post (post đã được set 'publishing' + lease của tracker)
+        Post đang được theo dõi thì bỏ qua, tránh 2 entry trong heap cùng check một publish_id
+        """
+        if post_id in self._pending:
+            return
+        entry = PendingPublish(
+            post_id=post_id,
+            publish_id=publish_id,
+            access_token=access_token,
+            created_at=created_at or now_utc(),
+            interval=settings.TIKTOK_STATUS_POLL_INITIAL_SECONDS
+        )
+        self._pending[post_id] = entry
+        self._schedule(entry, entry.interval)
+        logger.info(f"🎵 Tracking TikTok publish_id {publish_id} for post {post_id}")
+
+    def get_stats(self) -> dict:
+        return {
+            "instance_id": self.instance_id,
+            "pending": len(self._pending)
+        }
+
+    def _schedule(self, entry: PendingPublish, delay: float):
+        loop = asyncio.get_running_loop()
+        entry.due_at = loop.time() + delay
+        heapq.heappush(self._heap, (entry.due_at, entry.post_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        heartbeat_every = self.lease_duration.total_seconds() / 3
+        next_heartbeat = loop.time() + heartbeat_every
+        semaphore = asyncio.Semaphore(settings.TIKTOK_STATUS_CHECK_CONCURRENCY)
+
+        async def bounded_check(entry: PendingPublish):
+            async with semaphore:
+                await self._check(entry)
+
+        while True:
+            try:
+                self._wakeup.clear()
+                now = loop.time()
+
+                # Gom mọi publish_id tới hạn vào một vòng kiểm tra
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due_at, post_id = heapq.heappop(self._heap)
+                    entry = self._pending.get(post_id)
+                    if entry and entry.due_at == due_at:
+                        due.append(entry)
+                if due:
+                    await asyncio.gather(*[bounded_check(entry) for entry in due])
+
+                if loop.time() >= next_heartbeat:
+                    await self._renew_leases()
+                    await self._adopt_orphans()
+                    next_heartbeat = loop.time() + heartbeat_every
+
+                timeout = next_heartbeat - loop.time()
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - loop.time())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ TikTok status tracker error: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _check(self, entry: PendingPublish):
+        result = await check_publish_status(entry.access_token, entry.publish_id)
+
+        if result.get("success"):
+            status = result.get("status")
+            if status in TIKTOK_DONE_STATUSES:
+                await self._finish_published(entry, result)
+                return
+            if status == "FAILED":
+                fail_reason = result.get("fail_reason", "Unknown reason")
+                await self._finish_failed(
+                    entry,
+                    f"TikTok processing failed: {fail_reason}",
+                    {"error_code": fail_reason, "error": fail_reason}
+                )
+                return
+        elif result.get("error_code") in ("access_token_invalid", "scope_not_authorized"):
+            await self._finish_failed(entry, f"TikTok status error: {result.get('error')}", result)
+            return
+
+        if now_utc() - entry.created_at > timedelta(seconds=settings.TIKTOK_STATUS_TIMEOUT_SECONDS):
+            await self._finish_failed(
+                entry,
+                f"TikTok publish {entry.publish_id} still processing after timeout",
+                {"error": "Processing timeout"}
+            )
+            return
+
+        # Vẫn PROCESSING_* (hoặc lỗi tạm thời khi check) -> check lại sau, interval tăng dần
+        delay = entry.interval
+        entry.interval = min(entry.interval * 1.5, settings.TIKTOK_STATUS_POLL_MAX_SECONDS)
+        self._schedule(entry, delay)
+
+    async def _finish_published(self, entry: PendingPublish, result: dict):
+        self._pending.pop(entry.post_id, None)
+        try:
+            async with async_session_maker() as session:
+                post = await session.get(Post, entry.post_id)
+                if not post or post.lease_owner != self.instance_id:
+                    logger.warning(f"⚠️ Lost lease on post {entry.post_id}, skip update")
+                    return
+
+                metadata = dict(post.post_metadata or {})
+                metadata["status"] = result.get("status")
+                video_id = result.get("video_id")
+                if video_id:
+                    metadata["tiktok_video_id"] = video_id
+
+                values = {
+                    "status": "published",
+                    "published_at": datetime.utcnow(),
+                    "error_message": None,
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "post_metadata": metadata
+                }
+                if video_id:
+                    values["platform_post_id"] = video_id
+                if result.get("share_url"):
+                    values["platform_post_url"] = result["share_url"]
+
+                await PostService(session).update(entry.post_id, values)
+                logger.info(f"✅ Post {entry.post_id} published to TikTok (video_id: {video_id})")
+
+            await self._cleanup_media(entry.post_id, metadata)
+        except Exception as e:
+            logger.error(f"❌ Could not update published TikTok post {entry.post_id}: {str(e)}")
+
+    async def _finish_failed(self, entry: PendingPublish, error_message: str, result: dict):
+        self._pending.pop(entry.post_id, None)
+        try:
+            async with async_session_maker() as session:
+                post = await session.get(Post, entry.post_id)
+                if not post or post.lease_owner != self.instance_id:
+                    logger.warning(f"⚠️ Lost lease on post {entry.post_id}, skip update")
+                    return
+
+                # Bỏ publish_id cũ + trả lease, sau đó để PostService quyết định retry/failed
+                metadata = dict(post.post_metadata or {})
+                metadata.pop("tiktok_publish_id", None)
+                metadata.pop("tiktok_uploaded_at", None)
+                metadata["status"] = "FAILED"
+                await session.execute(
+                    update(Post)
+                    .where(Post.id == entry.post_id)
+                    .values(post_metadata=metadata, lease_owner=None, lease_expires_at=None)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+                await session.refresh(post)
+
+                await PostService(session)._mark_failed(post, "tiktok", error_message, result=result, media_type="video")
+                await session.refresh(post)
+                logger.error(f"❌ Post {entry.post_id} TikTok processing failed: {error_message}")
+
+                if post.status != PostStatus.scheduled:
+                    await self._cleanup_media(entry.post_id, post.post_metadata)
+        except Exception as e:
+            logger.error(f"❌ Could not update failed TikTok post {entry.post_id}: {str(e)}")
+
+    async def _cleanup_media(self, post_id: int, metadata: Optional[dict]):
+        """Xóa media đã lưu của scheduled post khi TikTok xử lý xong"""
+        if metadata and metadata.get("media_paths"):
+            await storage_service.delete_media_for_post(post_id)
+
+    async def _renew_leases(self):
+        """Gia hạn lease cho các post đang theo dõi; bỏ các post đã mất lease"""
+        if not self._pending:
+            return
+        try:
+            async with async_session_maker() as session:
+                result = await session.execute(
+                    update(Post)
+                    .where(Post.id.in_(list(self._pending)))
+                    .where(Post.lease_owner == self.instance_id)
+                    .values(lease_expires_at=self.lease_expiry())
+                    .returning(Post.id)
+                    .execution_options(synchronize_session=False)
+                )
+                renewed = set(result.scalars().all())
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not renew TikTok tracker leases: {str(e)}")
+            return
+
+        for post_id in list(self._pending):
+            if post_id not in renewed:
+                logger.warning(f"⚠️ Lost lease on post {post_id}, stop tracking TikTok status")
+                self._pending.pop(post_id, None)
+
+    async def _adopt_orphans(self):
+        """Tiếp quản post TikTok 'publishing' có publish_id mà không instance nào giữ lease"""
+        try:
+            async with async_session_maker() as session:
+                now = now_utc()
+                claimed = await session.execute(
+                    update(Post)
+                    .where(Post.status == PostStatus.publishing)
+                    .where(Post.post_metadata['tiktok_publish_id'].isnot(None))
+                    .where((Post.lease_owner.is_(None)) | (Post.lease_expires_at < now))
+                    .values(lease_owner=self.instance_id, lease_expires_at=self.lease_expiry())
+                    .returning(Post.id)
+                    .execution_options(synchronize_session=False)
+                )
+                post_ids = list(claimed.scalars().all())
+                await session.commit()
+                if not post_ids:
+                    return
+
+                rows = await session.execute(
+                    select(Post, Page).join(Page, Post.page_id == Page.id).where(Post.id.in_(post_ids))
+                )
+                for post, page in rows.all():
+                    # Post từ bản cũ chưa lưu tiktok_uploaded_at -> tính timeout từ lúc tiếp quản
+                    uploaded_at = post.post_metadata.get("tiktok_uploaded_at")
+                    self.register(
+                        post_id=post.id,
+                        publish_id=post.post_metadata["tiktok_publish_id"],
+                        access_token=page.access_token,
+                        created_at=datetime.fromisoformat(uploaded_at) if uploaded_at else None
+                    )
+                logger.info(f"🎵 Adopted {len(post_ids)} pending TikTok publish(es)")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not adopt pending TikTok publishes: {str(e)}")
+
+
+# Global instance
+tiktok_status_tracker = TikTokStatusTracker()
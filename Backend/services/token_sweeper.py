@@ -0,0 +1,260 @@
+"""
+Token Sweeper - Refresh token của các page trước khi hết hạn
+
+- Định kỳ (TOKEN_SWEEP_INTERVAL_SECONDS) tìm page 'connected' có token_expires_at
+  trong TOKEN_REFRESH_AHEAD_SECONDS tới (query dùng index ix_pages_token_expires_at)
+- Refresh song song theo platform (mỗi platform tối đa TOKEN_REFRESH_CONCURRENCY):
+  - YouTube: refresh_token OAuth qua youtube_token_manager (cập nhật luôn cache)
+  - TikTok: refresh_token OAuth (access token sống 24h)
+  - Threads: gia hạn long-lived token (th_refresh_token)
+  - Facebook/Instagram: page token không refresh được phía server -> cần reconnect
+- Không refresh được (token bị thu hồi, hết hạn, platform không hỗ trợ) -> page status 'error'
+- ensure_publishable: publish kiểm tra token trước khi gọi API, không tốn một lượt đăng vì token chết
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import select
+
+from config.database import async_session_maker
+from core.config import settings
+from models.model import Page, Platform, PageStatus
+from services.page_service import PageService
+from services import threads_service, tiktok_service
+from services.youtube_token_manager import youtube_token_manager
+from utils.timezone_utils import now_utc
+
+logger = logging.getLogger(__name__)
+
+
+# Platform có thể refresh token phía server
+REFRESHABLE_PLATFORMS = {"youtube", "tiktok", "threads"}
+
+
+class TokenRefreshError(Exception):
+    """Refresh token thất bại; permanent=True khi thử lại cũng không được (cần reconnect)"""
+
+    def __init__(self, message: str, permanent: bool = True):
+        self.permanent = permanent
+        super().__init__(message)
+
+
+class TokenSweeper:
+    """Background sweeper refresh token sắp hết hạn của mọi platform"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._refreshed = 0
+        self._failed = 0
+        self._marked_error = 0
+        # Page Facebook/Instagram đã nhắc reconnect (tránh log lại mỗi vòng quét)
+        self._warned: Dict[int, datetime] = {}
+        self._last_sweep_at: Optional[datetime] = None
+
+    def start(self):
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("🔑 Token sweeper started")
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> dict:
+        return {
+            "refreshed": self._refreshed,
+            "failed": self._failed,
+            "marked_error": self._marked_error,
+            "last_sweep_at": self._last_sweep_at.isoformat() if self._last_sweep_at else None
+        }
+
+    async def ensure_publishable(self, page: Page) -> Tuple[bool, Optional[str]]:
+        """
+        Kiểm tra token của page trước khi đăng (không gọi API nếu token còn hạn)
+
+        Returns:
+            (ok, error_message): ok=False -> không đăng, post fail ngay với error_message
+        """
+        if page.status == PageStatus.error:
+            return False, f"Page {page.page_name} cần kết nối lại (token hết hạn hoặc bị thu hồi)"
+
+        platform = (page.platform.name if page.platform else "").lower()
+        # YouTube: youtube_token_manager tự refresh token hết hạn lúc upload
+        if platform == "youtube" or page.token_expires_at is None or page.token_expires_at > now_utc():
+            return True, None
+
+        try:
+            await self.refresh_page(page, platform)
+            return True, None
+        except TokenRefreshError as e:
+            if not e.permanent:
+                # Lỗi mạng khi refresh -> vẫn thử đăng, retry_service xử lý nếu token thực sự hỏng
+                return True, None
+            return False, f"Access token của page {page.page_name} đã hết hạn: {str(e)}"
+
+    async def refresh_page(self, page: Page, platform: str):
+        """
+        Refresh token của page và ghi lại DB
+        Lỗi vĩnh viễn -> page status 'error'
+
+        Raises:
+            TokenRefreshError
+        """
+        lock = self._locks.setdefault(page.id, asyncio.Lock())
+        async with lock:
+            try:
+                access_token, refresh_token, expires_at = await self._refresh(page, platform)
+            except TokenRefreshError as e:
+                self._failed += 1
+                if e.permanent:
+                    await self._mark_error(page, str(e))
+                raise
+
+            page.access_token = access_token
+            page.refresh_token = refresh_token
+            page.token_expires_at = expires_at
+            self._refreshed += 1
+            if platform != "youtube":
+                # youtube_token_manager đã tự ghi DB
+                try:
+                    async with async_session_maker() as session:
+                        await PageService(session).update_tokens(
+                            page.id,
+                            access_token=access_token,
+                            refresh_token=refresh_token,
+                            expires_at=expires_at
+                        )
+                except Exception as e:
+                    logger.error(f"❌ Could not save refreshed {platform} token for page {page.id}: {str(e)}")
+            logger.info(f"🔑 Refreshed {platform} token for page {page.id} ({page.page_name})")
+
+    async def _refresh(self, page: Page, platform: str) -> Tuple[str, Optional[str], Optional[datetime]]:
+        """Gọi API refresh của platform; trả (access_token, refresh_token, expires_at)"""
+        if platform not in REFRESHABLE_PLATFORMS:
+            raise TokenRefreshError(f"{platform or 'unknown'} token cannot be refreshed, please reconnect the page")
+
+        try:
+            if platform == "youtube":
+                if not page.refresh_token:
+                    raise TokenRefreshError("No refresh token, please reconnect YouTube channel")
+                token = await youtube_token_manager.refresh_page(page)
+                return token.access_token, token.refresh_token, token.expires_at
+
+            if platform == "tiktok":
+                if not page.refresh_token:
+                    raise TokenRefreshError("No refresh token, please reconnect TikTok account")
+                result = await tiktok_service.refresh_access_token(page.refresh_token)
+            else:
+                if page.token_expires_at is not None and page.token_expires_at <= now_utc():
+                    # Threads chỉ gia hạn được token còn hạn
+                    raise TokenRefreshError("Threads token already expired, please reconnect")
+                result = await threads_service.refresh_access_token(page.access_token)
+        except (httpx.TransportError, TimeoutError) as e:
+            raise TokenRefreshError(f"Token refresh request failed: {str(e)}", permanent=False)
+        except TokenRefreshError:
+            raise
+        except Exception as e:
+            # YouTube: Google trả lỗi (invalid_grant, token bị thu hồi) -> "Token refresh failed: ..."
+            raise TokenRefreshError(str(e), permanent="Token refresh failed" in str(e))
+
+        if not result.get("success"):
+            status_code = result.get("status_code") or 0
+            raise TokenRefreshError(
+                f"Token refresh failed: {result.get('error')}",
+                permanent=status_code != 429 and status_code < 500
+            )
+
+        expires_in = result.get("expires_in")
+        expires_at = now_utc() + timedelta(seconds=int(expires_in)) if expires_in else None
+        return result["access_token"], result.get("refresh_token") or page.refresh_token, expires_at
+
+    async def _mark_error(self, page: Page, reason: str):
+        try:
+            async with async_session_maker() as session:
+                await PageService(session).update(page.id, {"status": PageStatus.error})
+            page.status = PageStatus.error
+            self._marked_error += 1
+            logger.warning(f"⚠️ Page {page.id} ({page.page_name}) needs reconnect: {reason}")
+        except Exception as e:
+            logger.error(f"❌ Could not mark page {page.id} as error: {str(e)}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Token sweeper error: {str(e)}")
+            await asyncio.sleep(settings.TOKEN_SWEEP_INTERVAL_SECONDS)
+
+    async def sweep(self):
+        """Refresh mọi token hết hạn trong TOKEN_REFRESH_AHEAD_SECONDS tới, song song theo platform"""
+        self._last_sweep_at = now_utc()
+        deadline = self._last_sweep_at + timedelta(seconds=settings.TOKEN_REFRESH_AHEAD_SECONDS)
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(Page, Platform.name)
+                .join(Platform, Page.platform_id == Platform.id)
+                .where(Page.token_expires_at < deadline)
+                .where(Page.status == PageStatus.connected)
+            )
+            rows = result.all()
+
+        if not rows:
+            return
+
+        by_platform: Dict[str, List[Page]] = defaultdict(list)
+        for page, platform_name in rows:
+            by_platform[(platform_name or "").lower()].append(page)
+
+        logger.info(
+            "🔑 Refreshing expiring tokens: "
+            + ", ".join(f"{platform}={len(pages)}" for platform, pages in by_platform.items())
+        )
+        await asyncio.gather(*[
+            self._refresh_platform(platform, pages) for platform, pages in by_platform.items()
+        ])
+
+    async def _refresh_platform(self, platform: str, pages: List[Page]):
+        semaphore = asyncio.Semaphore(settings.TOKEN_REFRESH_CONCURRENCY)
+
+        async def refresh(page: Page):
+            if platform not in REFRESHABLE_PLATFORMS and page.token_expires_at > now_utc():
+                # Facebook/Instagram: chưa hết hạn thì vẫn đăng được, chỉ nhắc reconnect
+                if self._warned.get(page.id) == page.token_expires_at:
+                    return
+                self._warned[page.id] = page.token_expires_at
+                logger.warning(
+                    f"⚠️ {platform} token of page {page.id} ({page.page_name}) expires at "
+                    f"{page.token_expires_at.isoformat()}, please reconnect"
+                )
+                return
+            async with semaphore:
+                try:
+                    await self.refresh_page(page, platform)
+                except TokenRefreshError as e:
+                    logger.warning(f"⚠️ Could not refresh {platform} token for page {page.id}: {str(e)}")
+                except Exception as e:
+                    logger.error(f"❌ Token refresh error for page {page.id}: {str(e)}")
+
+        await asyncio.gather(*[refresh(page) for page in pages])
+
+
+# Global instance
+token_sweeper = TokenSweeper()
@@ -0,0 +1,236 @@
+"""
+Upload Executor - Thread pool riêng cho upload blocking (google-api-client YouTube)
+
+- Số slot cố định (YOUTUBE_UPLOAD_WORKERS), không dùng chung default thread pool
+  mà Starlette dùng cho sync endpoint
+- Job chờ slot trong hàng đợi asyncio: xem được độ sâu hàng đợi và thời gian chờ
+- Cancel: job đang chờ bị bỏ khỏi hàng đợi; job đang chạy dừng sau chunk hiện tại
+  (hàm upload nhận cancel_event và kiểm tra giữa các chunk)
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UploadCancelledError(Exception):
+    """Upload bị cancel (trong hàng đợi hoặc giữa các chunk)"""
+
+
+class UploadQueueFullError(Exception):
+    """Hàng đợi upload đã đầy"""
+
+
+@dataclass
+class UploadJob:
+    """Một job upload trong executor"""
+    job_id: str
+    label: str
+    enqueued_at: float
+    started_at: Optional[float] = None
+    # cancel_event cho thread upload, cancelled cho job còn chờ slot trong event loop
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    cancelled: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def state(self) -> str:
+        return "running" if self.started_at is not None else "queued"
+
+
+class UploadExecutor:
+    """Executor có giới hạn slot cho các upload blocking"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: int = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._jobs: Dict[str, UploadJob] = {}
+        self._ids = itertools.count(1)
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=f"{self.name}-upload"
+            )
+        return self._executor
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # Tạo lazy trong event loop đang chạy
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    def _queued_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.started_at is None)
+
+    async def run(self, fn: Callable[..., Any], *args, job_id: Optional[str] = None, label: str = "", **kwargs) -> Any:
+        """
+        Chạy fn(*args, cancel_event=..., **kwargs) trong thread pool khi có slot trống
+
+        Raises:
+            UploadQueueFullError: hàng đợi đã đầy
+            UploadCancelledError: job bị cancel trước khi chạy
+        """
+        job_id = str(job_id) if job_id is not None else f"job-{next(self._ids)}"
+        if job_id in self._jobs:
+            raise ValueError(f"Upload job {job_id} is already queued or running")
+        if self.max_queue and self._queued_count() >= self.max_queue:
+            raise UploadQueueFullError(f"{self.name} upload queue is full ({self.max_queue} jobs waiting)")
+
+        job = UploadJob(job_id=job_id, label=label, enqueued_at=time.monotonic())
+        self._jobs[job_id] = job
+        logger.info(f"📥 [{self.name}] Upload {job_id} queued (queue depth: {self._queued_count()})")
+
+        slots = self.slots
+        acquired = False
+        try:
+            acquired = await self._acquire_slot(job, slots)
+        finally:
+            if not acquired:
+                self._cancelled += 1
+                self._jobs.pop(job_id, None)
+        if not acquired:
+            raise UploadCancelledError(f"Upload {job_id} cancelled while queued")
+
+        job.started_at = time.monotonic()
+        wait = job.started_at - job.enqueued_at
+        self._started += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        logger.info(f"▶️ [{self.name}] Upload {job_id} started after waiting {wait:.1f}s")
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(lambda: fn(*args, cancel_event=job.cancel_event, **kwargs))
+        except RuntimeError:
+            # Executor đã shutdown
+            slots.release()
+            self._jobs.pop(job_id, None)
+            raise
+        # Slot và job chỉ được trả khi thread upload thực sự kết thúc:
+        # cancel chỉ dừng thread sau chunk hiện tại, trả slot sớm sẽ chạy quá max_workers upload
+        future.add_done_callback(lambda f: self._call_in_loop(loop, self._finish, job, slots, f))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Job đang chạy: báo thread dừng sau chunk hiện tại
+            job.cancel_event.set()
+            raise
+
+    @staticmethod
+    def _call_in_loop(loop: asyncio.AbstractEventLoop, callback: Callable, *args):
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Event loop đã đóng (shutdown)
+            pass
+
+    def _finish(self, job: UploadJob, slots: asyncio.Semaphore, future: Future):
+        """Thread upload đã kết thúc (xong, lỗi hoặc bị cancel): trả slot và cập nhật thống kê"""
+        slots.release()
+        self._jobs.pop(job.job_id, None)
+        if future.cancelled() or job.cancel_event.is_set():
+            self._cancelled += 1
+        elif future.exception() is not None:
+            self._failed += 1
+        else:
+            self._completed += 1
+
+    async def _acquire_slot(self, job: UploadJob, slots: asyncio.Semaphore) -> bool:
+        """Chờ slot trống; trả False nếu job bị cancel trong lúc chờ"""
+        if job.cancel_event.is_set():
+            return False
+        acquire = asyncio.ensure_future(slots.acquire())
+        cancelled = asyncio.ensure_future(job.cancelled.wait())
+        try:
+            await asyncio.wait({acquire, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+            if not acquire.done():
+                acquire.cancel()
+        if acquire.done() and not acquire.cancelled():
+            if job.cancel_event.is_set():
+                slots.release()
+                return False
+            return True
+        return False
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel job đang chờ hoặc đang chạy; False nếu không tìm thấy"""
+        job = self._jobs.get(str(job_id))
+        if not job:
+            return False
+        job.cancel_event.set()
+        job.cancelled.set()
+        logger.info(f"🛑 [{self.name}] Cancel requested for upload {job_id} ({job.state})")
+        return True
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        jobs = sorted(self._jobs.values(), key=lambda job: job.enqueued_at)
+        queued = [job for job in jobs if job.started_at is None]
+        running = [job for job in jobs if job.started_at is not None]
+        return {
+            "slots": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": len(running),
+            "queue_depth": len(queued),
+            "oldest_wait_seconds": round(now - queued[0].enqueued_at, 1) if queued else 0,
+            "avg_wait_seconds": round(self._total_wait / self._started, 1) if self._started else 0,
+            "max_wait_seconds": round(self._max_wait, 1),
+            "completed": self._completed,
+            "failed": self._failed,
+            "cancelled": self._cancelled,
+            "jobs": [
+                {
+                    "job_id": job.job_id,
+                    "label": job.label,
+                    "state": job.state,
+                    "cancelling": job.cancel_event.is_set(),
+                    "waited_seconds": round((job.started_at or now) - job.enqueued_at, 1),
+                    "running_seconds": round(now - job.started_at, 1) if job.started_at else 0
+                }
+                for job in jobs
+            ]
+        }
+
+    def shutdown(self):
+        """Cancel mọi job, không chờ thread đang upload"""
+        for job in self._jobs.values():
+            job.cancel_event.set()
+            job.cancelled.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._slots = None
+
+
+# Global instance
+youtube_upload_executor = UploadExecutor(
+    name="youtube",
+    max_workers=settings.YOUTUBE_UPLOAD_WORKERS,
+    max_queue=settings.YOUTUBE_UPLOAD_MAX_QUEUE
+)
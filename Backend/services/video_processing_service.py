@@ -0,0 +1,323 @@
+"""
+Video Processing Service - Ghép frame template vào video bằng ffmpeg chạy bất đồng bộ
+
+- ffprobe/ffmpeg chạy bằng asyncio subprocess: không chặn event loop, không giữ thread
+- Làm việc trực tiếp trên file (Path): video không bị đọc vào RAM, output là file tạm
+- Tối đa VIDEO_PROCESSING_CONCURRENCY job ffmpeg chạy cùng lúc, tối đa VIDEO_PROCESSING_MAX_QUEUE job chờ
+- Tiến độ đọc từ `-progress pipe:1` (out_time / duration, speed), xem qua get_stats
+- Encoder preset: fast / balanced / quality (mặc định VIDEO_ENCODER_PRESET)
+- Job quá VIDEO_PROCESSING_TIMEOUT_SECONDS hoặc bị cancel -> kill ffmpeg, xóa output dở
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from core.config import settings
+from services.template_asset_cache import template_asset_cache
+
+logger = logging.getLogger(__name__)
+
+
+# Tham số encoder theo preset (video); audio giữ nguyên (-c:a copy)
+ENCODER_PRESETS: Dict[str, List[str]] = {
+    "fast": ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23"],
+    "balanced": ["-c:v", "libx264", "-preset", "medium", "-crf", "23"],
+    "quality": ["-c:v", "libx264", "-preset", "slow", "-crf", "18"],
+}
+
+# Kích thước mặc định khi ffprobe không đọc được video
+DEFAULT_VIDEO_SIZE = (1080, 1920)
+
+# Số dòng stderr cuối của ffmpeg giữ lại để báo lỗi
+STDERR_TAIL_LINES = 20
+
+
+class VideoQueueFullError(Exception):
+    """Hàng đợi xử lý video đã đầy"""
+
+
+class VideoProcessingError(Exception):
+    """ffmpeg lỗi, timeout hoặc không chạy được"""
+
+
+@dataclass
+class VideoJob:
+    """Một job ffmpeg trong hàng đợi"""
+    job_id: str
+    label: str
+    preset: str
+    enqueued_at: float
+    started_at: Optional[float] = None
+    duration: Optional[float] = None
+    out_time: float = 0.0
+    speed: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        return "running" if self.started_at is not None else "queued"
+
+    @property
+    def progress(self) -> Optional[float]:
+        """Phần trăm đã encode (None nếu không biết thời lượng video)"""
+        if not self.duration:
+            return None
+        return round(min(100.0, self.out_time / self.duration * 100), 1)
+
+
+class VideoProcessingService:
+    """Hàng đợi job ffmpeg có giới hạn số job chạy đồng thời"""
+
+    def __init__(self, max_concurrency: int, max_queue: int = 0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._jobs: Dict[str, VideoJob] = {}
+        self._processes: Dict[str, asyncio.subprocess.Process] = {}
+        self._ids = itertools.count(1)
+        self._completed = 0
+        self._failed = 0
+        self._total_seconds = 0.0
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # Tạo lazy trong event loop đang chạy
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    def _queued_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.started_at is None)
+
+    async def probe(self, video_path: Path) -> Tuple[int, int, Optional[float]]:
+        """
+        Kích thước và thời lượng video bằng ffprobe
+
+        Returns:
+            (width, height, duration): DEFAULT_VIDEO_SIZE / None nếu không đọc được
+        """
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=width,height:format=duration",
+            "-of", "json",
+            str(video_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        try:
+            info = json.loads(stdout or b"{}")
+            stream = (info.get("streams") or [{}])[0]
+            width, height = int(stream["width"]), int(stream["height"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"⚠️ ffprobe could not read {video_path}: {stderr.decode(errors='replace').strip()}")
+            return DEFAULT_VIDEO_SIZE[0], DEFAULT_VIDEO_SIZE[1], None
+        try:
+            duration = float((info.get("format") or {}).get("duration"))
+        except (TypeError, ValueError):
+            duration = None
+        return width, height, duration
+
+    async def apply_frame(
+        self,
+        video_path: Path,
+        frame_url: str,
+        preset: Optional[str] = None,
+        label: str = ""
+    ) -> Path:
+        """
+        Ghép frame (resize theo kích thước video) lên toàn bộ video
+
+        Args:
+            video_path: File video gốc (không bị sửa)
+            frame_url: URL ảnh frame (lấy qua template_asset_cache)
+            preset: Encoder preset (fast / balanced / quality), mặc định VIDEO_ENCODER_PRESET
+            label: Mô tả job hiển thị trong stats
+
+        Returns:
+            Path tới file video đã ghép frame (file tạm, caller xóa khi dùng xong)
+
+        Raises:
+            VideoQueueFullError: hàng đợi đã đầy
+            VideoProcessingError: ffmpeg lỗi / timeout
+        """
+        preset = preset or settings.VIDEO_ENCODER_PRESET
+        if preset not in ENCODER_PRESETS:
+            raise ValueError(f"Unknown video encoder preset '{preset}', expected one of {', '.join(ENCODER_PRESETS)}")
+        if self.max_queue and self._queued_count() >= self.max_queue:
+            raise VideoQueueFullError(f"Video processing queue is full ({self.max_queue} jobs waiting)")
+
+        job = VideoJob(
+            job_id=f"video-{next(self._ids)}",
+            label=label or Path(video_path).name,
+            preset=preset,
+            enqueued_at=time.monotonic()
+        )
+        self._jobs[job.job_id] = job
+        logger.info(f"📥 Video job {job.job_id} queued ({job.label}, queue depth: {self._queued_count()})")
+
+        try:
+            async with self.slots:
+                job.started_at = time.monotonic()
+                output_path = await self._run_frame_job(job, Path(video_path), frame_url)
+            self._completed += 1
+            return output_path
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            if job.started_at is not None:
+                self._total_seconds += time.monotonic() - job.started_at
+            self._jobs.pop(job.job_id, None)
+
+    async def _run_frame_job(self, job: VideoJob, video_path: Path, frame_url: str) -> Path:
+        width, height, job.duration = await self.probe(video_path)
+        frame_path = await asyncio.to_thread(self._write_frame, frame_url, (width, height))
+
+        fd, output_name = tempfile.mkstemp(suffix=".mp4", prefix="framed_video_")
+        os.close(fd)
+        output_path = Path(output_name)
+
+        cmd = [
+            "ffmpeg", "-hide_banner", "-nostats", "-y",
+            "-i", str(video_path),
+            "-i", str(frame_path),
+            "-filter_complex", "[0:v][1:v]overlay=0:0",
+            *ENCODER_PRESETS[job.preset],
+            "-c:a", "copy",
+            "-movflags", "+faststart",
+            "-progress", "pipe:1",
+        ]
+        if settings.VIDEO_ENCODER_THREADS:
+            cmd += ["-threads", str(settings.VIDEO_ENCODER_THREADS)]
+        cmd.append(str(output_path))
+
+        logger.info(f"🎬 Video job {job.job_id} started ({width}x{height}, preset={job.preset})")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            self._processes[job.job_id] = process
+            stderr_tail: deque = deque(maxlen=STDERR_TAIL_LINES)
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(
+                        self._read_progress(job, process.stdout),
+                        self._read_stderr(process.stderr, stderr_tail),
+                        process.wait()
+                    ),
+                    timeout=settings.VIDEO_PROCESSING_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                raise VideoProcessingError(
+                    f"FFmpeg timed out after {settings.VIDEO_PROCESSING_TIMEOUT_SECONDS}s"
+                )
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                self._processes.pop(job.job_id, None)
+
+            if process.returncode != 0:
+                raise VideoProcessingError(f"FFmpeg error: {' | '.join(stderr_tail)}")
+        except BaseException:
+            output_path.unlink(missing_ok=True)
+            raise
+        finally:
+            frame_path.unlink(missing_ok=True)
+
+        logger.info(
+            f"✅ Video job {job.job_id} done in {time.monotonic() - job.started_at:.1f}s "
+            f"({output_path.stat().st_size} bytes)"
+        )
+        return output_path
+
+    @staticmethod
+    def _write_frame(frame_url: str, size: Tuple[int, int]) -> Path:
+        """Frame đã resize theo kích thước video (cache theo size) -> file PNG tạm riêng cho job"""
+        frame_resized = template_asset_cache.variant(
+            frame_url, ("frame", size),
+            lambda image: image.resize(size, Image.Resampling.LANCZOS)
+        )
+        fd, frame_name = tempfile.mkstemp(suffix=".png", prefix="frame_overlay_")
+        with os.fdopen(fd, "wb") as f:
+            frame_resized.save(f, format="PNG")
+        return Path(frame_name)
+
+    @staticmethod
+    async def _read_progress(job: VideoJob, stream: asyncio.StreamReader):
+        """Đọc block key=value của -progress (out_time_us, speed, progress=continue|end)"""
+        async for raw_line in stream:
+            key, _, value = raw_line.decode(errors="replace").strip().partition("=")
+            if key == "out_time_us" and value.isdigit():
+                job.out_time = int(value) / 1_000_000
+            elif key == "speed":
+                job.speed = value
+            elif key == "progress" and value == "end" and job.duration:
+                job.out_time = job.duration
+
+    @staticmethod
+    async def _read_stderr(stream: asyncio.StreamReader, tail: deque):
+        # Luôn đọc hết stderr để ffmpeg không bị chặn khi pipe đầy
+        async for raw_line in stream:
+            line = raw_line.decode(errors="replace").strip()
+            if line:
+                tail.append(line)
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        jobs = sorted(self._jobs.values(), key=lambda job: job.enqueued_at)
+        finished = self._completed + self._failed
+        return {
+            "slots": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "default_preset": settings.VIDEO_ENCODER_PRESET,
+            "running": sum(1 for job in jobs if job.started_at is not None),
+            "queue_depth": sum(1 for job in jobs if job.started_at is None),
+            "completed": self._completed,
+            "failed": self._failed,
+            "avg_seconds": round(self._total_seconds / finished, 1) if finished else 0,
+            "jobs": [
+                {
+                    "job_id": job.job_id,
+                    "label": job.label,
+                    "state": job.state,
+                    "preset": job.preset,
+                    "progress": job.progress,
+                    "speed": job.speed,
+                    "waited_seconds": round((job.started_at or now) - job.enqueued_at, 1),
+                    "running_seconds": round(now - job.started_at, 1) if job.started_at else 0
+                }
+                for job in jobs
+            ]
+        }
+
+    async def shutdown(self):
+        """Kill mọi ffmpeg đang chạy (job tương ứng raise, output dở bị xóa)"""
+        for process in list(self._processes.values()):
+            if process.returncode is None:
+                process.kill()
+        self._slots = None
+
+
+# Global instance
+video_processing_service = VideoProcessingService(
+    max_concurrency=settings.VIDEO_PROCESSING_CONCURRENCY,
+    max_queue=settings.VIDEO_PROCESSING_MAX_QUEUE
+)
@@ -1,12 +1,74 @@
 import os
-import requests
+import time
 import googleapiclient.discovery
+from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
 from datetime import datetime, timedelta
 from fastapi import HTTPException
 from dotenv import load_dotenv as loadenv
+from services.http_client import http_client
+from services.upload_executor import youtube_upload_executor, UploadCancelledError, UploadQueueFullError
+from services.rate_limiter import rate_limiter, RateLimitedError
+from core.config import settings
 loadenv()
 URL_FE = os.getenv("URL_FE")
+
+# Resumable upload: chunk size phải là bội số của 256KB
+YOUTUBE_CHUNK_ALIGNMENT = 256 * 1024
+
+
+def _align_chunk_size(size):
+    """Giới hạn chunk size trong [min, max] và làm tròn xuống bội số 256KB"""
+    size = max(settings.YOUTUBE_UPLOAD_MIN_CHUNK_SIZE, min(int(size), settings.YOUTUBE_UPLOAD_MAX_CHUNK_SIZE))
+    return max(YOUTUBE_CHUNK_ALIGNMENT, size - size % YOUTUBE_CHUNK_ALIGNMENT)
+
+
+def _http_error_info(error):
+    """
+    (HTTP status, reason) của HttpError googleapiclient, tìm cả exception gốc khi bị bọc lại (raise ... from)
+    reason lấy từ error.errors[].reason (VD: quotaExceeded, backendError); (None, None) nếu không phải lỗi HTTP
+    """
+    while error is not None and not isinstance(error, HttpError):
+        error = error.__cause__
+    if error is None:
+        return None, None
+    reason = None
+    if isinstance(error.error_details, list):
+        reason = next(
+            (detail.get("reason") for detail in error.error_details if isinstance(detail, dict) and detail.get("reason")),
+            None
+        )
+    return error.resp.status, reason
+
+
+def _set_upload_internals(insert_request, in_error_state=None, chunk_size=None):
+    """
+    Ghi các thuộc tính private của googleapiclient mà API public không cho đổi sau khi tạo request:
+    - HttpRequest._in_error_state = True: lần next_chunk tiếp theo hỏi server offset đã nhận
+      (PUT bytes */size) trước khi gửi tiếp; False: bắt đầu session mới
+    - MediaFileUpload._chunksize: chunk size của các chunk tiếp theo
+
+    Chỉ đúng với google-api-python-client==2.139.0 (pin trong requirements.txt),
+    nâng version phải kiểm tra lại HttpRequest.next_chunk
+    """
+    if in_error_state is not None:
+        insert_request._in_error_state = in_error_state
+    if chunk_size is not None:
+        insert_request.resumable._chunksize = chunk_size
+
+
+def _adapt_chunk_size(current, bytes_sent, elapsed):
+    """
+    Chọn chunk size tiếp theo theo throughput đo được, sao cho mỗi chunk mất
+    khoảng YOUTUBE_UPLOAD_CHUNK_TARGET_SECONDS (thay đổi tối đa x2 mỗi lần)
+    """
+    if bytes_sent <= 0 or elapsed <= 0:
+        return current
+    target = bytes_sent / elapsed * settings.YOUTUBE_UPLOAD_CHUNK_TARGET_SECONDS
+    target = max(current / 2, min(target, current * 2))
+    return _align_chunk_size(target)
+
+
 class YouTubeService:
     def __init__(self):
         # YouTube API endpoints
@@ -57,7 +119,7 @@ class YouTubeService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Lỗi tạo URL đăng nhập: {str(e)}")
 
-    def exchange_code_for_token(self, code):
+    async def exchange_code_for_token(self, code):
         """Đổi authorization code lấy access token"""
         token_data = {
             "client_id": self.client_id,
@@ -69,7 +131,7 @@ class YouTubeService:
         
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         
-        response = requests.post(self.token_url, data=token_data, headers=headers)
+        response = await http_client.post(self.token_url, data=token_data, headers=headers)
         token_info = response.json()
         
         if response.status_code != 200:
@@ -80,10 +142,10 @@ class YouTubeService:
         
         return token_info
 
-    def get_user_info(self, access_token):
+    async def get_user_info(self, access_token):
         """Lấy thông tin user từ Google"""
         headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(self.user_info_url, headers=headers)
+        response = await http_client.get(self.user_info_url, headers=headers)
         
         if response.status_code != 200:
             raise HTTPException(status_code=400, detail="Failed to get user information")
@@ -278,9 +340,9 @@ class YouTubeService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Lỗi lấy videos: {str(e)}")
 
-    def upload_video(self, access_token, file_path, title, description, tags=None, category_id=22, privacy_status="private", refresh_token=None):
+    def upload_video(self, access_token, file_path, title, description, tags=None, category_id=22, privacy_status="private", refresh_token=None, resume_state=None, on_progress=None, cancel_event=None):
         """
-        Upload video lên YouTube
+        Upload video lên YouTube (resumable, chunk size thích ứng theo throughput)
         
         Parameters:
         - access_token: YouTube access token
@@ -291,7 +353,9 @@ class YouTubeService:
         - category_id: YouTube category ID (default: 22 - People & Blogs)
         - privacy_status: private/unlisted/public
         - refresh_token: YouTube refresh token (optional but recommended)
-        - refresh_token: YouTube refresh token (optional but recommended)
+        - resume_state: Session đã lưu {"resumable_uri", "chunk_size"} để upload tiếp (optional)
+        - on_progress: Callback(state) sau mỗi chunk server đã xác nhận, dùng để lưu session (optional)
+        - cancel_event: threading.Event, set để dừng upload sau chunk hiện tại (optional)
         """
         try:
             import os
@@ -318,20 +382,10 @@ class YouTubeService:
             print(f"   Description length: {len(description)} chars")
             print(f"   Tags: {tags}")
             
-            # Đảm bảo credentials hợp lệ
-            print("🔐 Validating credentials...")
-            try:
-                valid_access_token = self.ensure_valid_credentials(access_token, refresh_token)
-                print(f"✓ Credentials validated successfully")
-            except Exception as cred_error:
-                error_msg = str(cred_error)
-                print(f"❌ Credentials validation failed: {error_msg}")
-                raise Exception(f"Credentials validation failed: {error_msg}")
-            
-            # Tạo credentials đầy đủ
+            # Tạo credentials đầy đủ (access token đã được validate trong upload_video_async)
             print("🔑 Creating credentials object...")
             try:
-                credentials = self.create_full_credentials(valid_access_token, refresh_token)
+                credentials = self.create_full_credentials(access_token, refresh_token)
                 print("✓ Credentials object created")
             except Exception as cred_obj_error:
                 error_msg = str(cred_obj_error)
@@ -376,9 +430,13 @@ class YouTubeService:
                         video_metadata["snippet"]["tags"] = valid_tags
             
             # Create media upload object từ file path
+            chunk_size = _align_chunk_size(
+                (resume_state or {}).get("chunk_size") or settings.YOUTUBE_UPLOAD_CHUNK_SIZE
+            )
             media = MediaFileUpload(
                 file_path,
                 mimetype="video/*",
+                chunksize=chunk_size,
                 resumable=True
             )
             
@@ -389,31 +447,73 @@ class YouTubeService:
                 media_body=media
             )
             
-            # Upload with progress (simplified version)
+            # Tiếp tục session cũ: next_chunk sẽ hỏi server offset đã nhận (PUT bytes */size)
+            # rồi upload tiếp từ chunk cuối cùng được xác nhận
+            resuming = bool(resume_state and resume_state.get("resumable_uri"))
+            if resuming:
+                insert_request.resumable_uri = resume_state["resumable_uri"]
+                insert_request.resumable_progress = 0
+                _set_upload_internals(insert_request, in_error_state=True)
+                print(f"⏯️ Resuming upload session (last saved offset: {resume_state.get('resumable_progress', 0)} bytes)")
+            
+            # Upload with progress
             response = None
             print("⏳ Starting upload...")
             
             while response is None:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise UploadCancelledError("Upload cancelled")
                 try:
+                    progress_before = insert_request.resumable_progress
+                    started = time.monotonic()
                     status, response = insert_request.next_chunk()
+                    elapsed = time.monotonic() - started
                     if status:
                         progress = int(status.progress() * 100)
-                        print(f"   Upload progress: {progress}%")
+                        print(f"   Upload progress: {progress}% (chunk: {media.chunksize() // 1024} KB)")
+                    
+                    if response is None:
+                        if on_progress:
+                            on_progress({
+                                "resumable_uri": insert_request.resumable_uri,
+                                "resumable_progress": insert_request.resumable_progress,
+                                "chunk_size": media.chunksize(),
+                                "size": media.size()
+                            })
+                        # Đổi chunk size cho chunk tiếp theo theo throughput vừa đo
+                        _set_upload_internals(insert_request, chunk_size=_adapt_chunk_size(
+                            media.chunksize(),
+                            insert_request.resumable_progress - progress_before,
+                            elapsed
+                        ))
                 except Exception as chunk_error:
                     error_msg = str(chunk_error)
+                    
+                    # Session cũ đã hết hạn (404/410) -> upload lại từ đầu với session mới
+                    status_code = getattr(getattr(chunk_error, "resp", None), "status", None)
+                    if resuming and status_code in (404, 410):
+                        print("⚠️ Resumable session expired, restarting upload from byte 0")
+                        resuming = False
+                        insert_request.resumable_uri = None
+                        insert_request.resumable_progress = 0
+                        _set_upload_internals(insert_request, in_error_state=False)
+                        continue
+                    
                     print(f"❌ Upload chunk error: {error_msg}")
                     
                     # Check for common errors
                     if "quota" in error_msg.lower():
-                        raise Exception("YouTube API quota exceeded. Please try again tomorrow or request quota increase.")
+                        rate_limiter.penalize("youtube", settings.RATE_LIMIT_YOUTUBE_QUOTA_BLOCK_SECONDS)
+                        raise Exception("YouTube API quota exceeded. Please try again tomorrow or request quota increase.") from chunk_error
                     elif "uploadlimitexceeded" in error_msg.lower():
-                        raise Exception("YouTube upload limit exceeded. Please verify your YouTube channel at https://www.youtube.com/verify or wait 24 hours.")
+                        raise Exception("YouTube upload limit exceeded. Please verify your YouTube channel at https://www.youtube.com/verify or wait 24 hours.") from chunk_error
                     elif "unauthorized" in error_msg.lower() or "credentials" in error_msg.lower():
-                        raise Exception("Invalid credentials. Please reconnect your YouTube channel.")
+                        raise Exception("Invalid credentials. Please reconnect your YouTube channel.") from chunk_error
                     elif "forbidden" in error_msg.lower():
-                        raise Exception("Permission denied. Check OAuth scopes and channel permissions.")
+                        raise Exception("Permission denied. Check OAuth scopes and channel permissions.") from chunk_error
                     else:
                         raise
+                resuming = False
             
             if response:
                 video_id = response.get("id")
@@ -436,13 +536,17 @@ class YouTubeService:
                 
         except Exception as e:
             print(f"❌ YouTube upload error: {e}")
+            # HTTP status / reason của Google để retry_service phân loại lỗi (không dựa vào nội dung message)
+            status_code, reason = _http_error_info(e)
             return {
                 "success": False,
                 "message": f"Upload failed: {str(e)}",
-                "error": str(e)
+                "error": str(e),
+                "status_code": status_code,
+                "reason": reason
             }
 
-    def refresh_access_token(self, refresh_token):
+    async def refresh_access_token(self, refresh_token):
         """
         Refresh YouTube access token using refresh token
         
@@ -462,7 +566,7 @@ class YouTubeService:
             
             headers = {"Content-Type": "application/x-www-form-urlencoded"}
             
-            response = requests.post(self.token_url, data=token_data, headers=headers)
+            response = await http_client.post(self.token_url, data=token_data, headers=headers)
             token_info = response.json()
             
             if response.status_code != 200:
@@ -474,7 +578,7 @@ class YouTubeService:
         except Exception as e:
             raise Exception(f"Token refresh error: {str(e)}")
 
-    def validate_access_token(self, access_token):
+    async def validate_access_token(self, access_token):
         """
         Validate YouTube access token and return token information
         
@@ -489,7 +593,7 @@ class YouTubeService:
             tokeninfo_url = "https://oauth2.googleapis.com/tokeninfo"
             params = {"access_token": access_token}
             
-            response = requests.get(tokeninfo_url, params=params)
+            response = await http_client.get(tokeninfo_url, params=params)
             
             if response.status_code != 200:
                 return {
@@ -525,7 +629,7 @@ class YouTubeService:
                 "error": str(e)
             }
 
-    def revoke_access_token(self, access_token):
+    async def revoke_access_token(self, access_token):
         """
         Revoke YouTube access token
         
@@ -539,7 +643,7 @@ class YouTubeService:
             revoke_url = "https://oauth2.googleapis.com/revoke"
             params = {"token": access_token}
             
-            response = requests.post(revoke_url, params=params)
+            response = await http_client.post(revoke_url, params=params)
             
             if response.status_code == 200:
                 return {
@@ -556,7 +660,7 @@ class YouTubeService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Token revocation error: {str(e)}")
 
-    def get_token_expiry_info(self, access_token):
+    async def get_token_expiry_info(self, access_token):
         """
         Get detailed token expiry information
         
@@ -567,7 +671,7 @@ class YouTubeService:
         - Detailed expiry information
         """
         try:
-            validation_info = self.validate_access_token(access_token)
+            validation_info = await self.validate_access_token(access_token)
             
             if not validation_info.get("valid"):
                 return {
@@ -596,7 +700,7 @@ class YouTubeService:
                 "message": f"Token expiry check error: {str(e)}"
             }
 
-    def auto_refresh_token_if_needed(self, access_token, refresh_token, threshold_minutes=5):
+    async def auto_refresh_token_if_needed(self, access_token, refresh_token, threshold_minutes=5):
         """
         Automatically refresh token if it's about to expire
         
@@ -610,11 +714,11 @@ class YouTubeService:
         """
         try:
             # Check current token expiry
-            expiry_info = self.get_token_expiry_info(access_token)
+            expiry_info = await self.get_token_expiry_info(access_token)
             
             if not expiry_info.get("valid") or expiry_info.get("expired"):
                 # Token is invalid or expired, refresh it
-                new_token_info = self.refresh_access_token(refresh_token)
+                new_token_info = await self.refresh_access_token(refresh_token)
                 return {
                     "refreshed": True,
                     "reason": "Token was invalid or expired",
@@ -627,7 +731,7 @@ class YouTubeService:
             
             if expires_in_minutes <= threshold_minutes:
                 # Token expires soon, refresh it
-                new_token_info = self.refresh_access_token(refresh_token)
+                new_token_info = await self.refresh_access_token(refresh_token)
                 return {
                     "refreshed": True,
                     "reason": f"Token expires in {expires_in_minutes} minutes",
@@ -646,7 +750,7 @@ class YouTubeService:
         except Exception as e:
             raise Exception(f"Auto refresh error: {str(e)}")
 
-    def ensure_valid_credentials(self, access_token, refresh_token=None):
+    async def ensure_valid_credentials(self, access_token, refresh_token=None):
         """
         Đảm bảo credentials hợp lệ, tự động refresh nếu cần
         
@@ -661,7 +765,7 @@ class YouTubeService:
             if not refresh_token:
                 # Chỉ có access token, validate và return
                 print("⚠️  No refresh_token provided, validating access_token only...")
-                validation = self.validate_access_token(access_token)
+                validation = await self.validate_access_token(access_token)
                 if validation.get("valid"):
                     print(f"✓ Access token is valid (expires in {validation.get('expires_in')}s)")
                     return access_token
@@ -672,7 +776,7 @@ class YouTubeService:
             
             # Có cả access và refresh token, thử auto refresh
             print("✓ Checking if token needs refresh...")
-            result = self.auto_refresh_token_if_needed(access_token, refresh_token, threshold_minutes=5)
+            result = await self.auto_refresh_token_if_needed(access_token, refresh_token, threshold_minutes=5)
             
             if result.get("refreshed"):
                 print(f"✓ Token refreshed successfully")
@@ -710,17 +814,52 @@ class YouTubeService:
         else:
             return Credentials(token=access_token)
 
-    async def upload_video_async(self, access_token, refresh_token, file_path, title, description, tags=None, category_id=22, privacy_status="private"):
+    async def upload_video_async(self, access_token, refresh_token, file_path, title, description, tags=None, category_id=22, privacy_status="private", resume_state=None, on_progress=None, job_id=None, validate_credentials=True):
         """
-        Async version của upload_video để sử dụng trong controller
+        Async version của upload_video
+        - Validate/refresh token bằng HTTP client async
+          (validate_credentials=False khi token lấy từ youtube_token_manager, đã biết còn hạn)
+        - Upload (googleapiclient, blocking) chạy trong youtube_upload_executor (số slot cố định,
+          có hàng đợi) để không block event loop và không chiếm default thread pool
+        - job_id: ID job trong hàng đợi upload (VD: post id), dùng để cancel
         """
-        return self.upload_video(
-            access_token=access_token,
-            file_path=file_path,
-            title=title,
-            description=description,
-            tags=tags,
-            category_id=category_id,
-            privacy_status=privacy_status,
-            refresh_token=refresh_token
-        )
\ No newline at end of file
+        valid_access_token = access_token
+        if validate_credentials:
+            print("🔐 Validating credentials...")
+            try:
+                valid_access_token = await self.ensure_valid_credentials(access_token, refresh_token)
+                print(f"✓ Credentials validated successfully")
+            except Exception as cred_error:
+                error_msg = f"Credentials validation failed: {str(cred_error)}"
+                print(f"❌ {error_msg}")
+                return {
+                    "success": False,
+                    "message": f"Upload failed: {error_msg}",
+                    "error": error_msg
+                }
+        
+        try:
+            # Quota YouTube hết -> không xếp thêm upload vào hàng đợi
+            await rate_limiter.acquire_key("youtube")
+            return await youtube_upload_executor.run(
+                self.upload_video,
+                job_id=job_id,
+                label=str(title)[:100],
+                access_token=valid_access_token,
+                file_path=file_path,
+                title=title,
+                description=description,
+                tags=tags,
+                category_id=category_id,
+                privacy_status=privacy_status,
+                refresh_token=refresh_token,
+                resume_state=resume_state,
+                on_progress=on_progress
+            )
+        except (UploadCancelledError, UploadQueueFullError, RateLimitedError, ValueError) as e:
+            print(f"❌ {str(e)}")
+            return {
+                "success": False,
+                "message": f"Upload failed: {str(e)}",
+                "error": str(e)
+            }
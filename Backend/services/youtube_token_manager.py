@@ -0,0 +1,171 @@
+"""
+YouTube Token Manager - Cache access token theo page và refresh trước khi hết hạn
+
+- Cache trong process: page.id -> (access_token, refresh_token, expires_at) dựa trên Page.token_expires_at
+- Upload/profile lấy token từ cache, không gọi tokeninfo trước mỗi request
+- Token sắp hết hạn được token_sweeper refresh nền (refresh_page),
+  ghi lại DB qua PageService.update_tokens
+- Chỉ refresh trực tiếp khi token đã hết hạn hoặc chưa biết hạn (VD: page cũ không có token_expires_at)
+"""
+
+import sys
+sys.path.append('..')
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from config.database import async_session_maker
+from core.config import settings
+from models.model import Page
+from services.page_service import PageService
+from utils.timezone_utils import now_utc
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedToken:
+    """Access token đã biết hạn của một page"""
+    access_token: str
+    refresh_token: Optional[str]
+    expires_at: Optional[datetime]
+    # API đã từ chối token (401 / invalid_grant) dù chưa hết hạn -> phải refresh
+    invalid: bool = False
+
+
+class YouTubeTokenManager:
+    """Cache credential YouTube theo page"""
+
+    def __init__(self):
+        self._tokens: Dict[int, CachedToken] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._youtube_service = None
+        self._refreshed = 0
+        self._refresh_failed = 0
+
+    @property
+    def youtube_service(self):
+        # Tạo lazy: YouTubeService() raise khi thiếu OAuth config
+        if self._youtube_service is None:
+            from services.youtube_service import YouTubeService
+            self._youtube_service = YouTubeService()
+        return self._youtube_service
+
+    def _lock(self, page_id: int) -> asyncio.Lock:
+        lock = self._locks.get(page_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[page_id] = lock
+        return lock
+
+    def _usable(self, token: CachedToken) -> bool:
+        """Token còn dùng được cho một request (còn hạn hơn YOUTUBE_TOKEN_EXPIRY_MARGIN_SECONDS)"""
+        if token.invalid or not token.access_token or token.expires_at is None:
+            return False
+        return token.expires_at - now_utc() > timedelta(seconds=settings.YOUTUBE_TOKEN_EXPIRY_MARGIN_SECONDS)
+
+    def _cached(self, page: Page) -> CachedToken:
+        """Token trong cache, hoặc token đang lưu trên page nếu cache cũ hơn (VD: page vừa reconnect)"""
+        cached = self._tokens.get(page.id)
+        from_page = CachedToken(page.access_token, page.refresh_token, page.token_expires_at)
+        if cached is not None and cached.invalid and from_page.access_token == cached.access_token:
+            # Bản trên page vẫn là token đã bị từ chối -> giữ trạng thái invalid để refresh
+            return cached
+        if cached is None or cached.invalid or (
+            from_page.expires_at is not None
+            and (cached.expires_at is None or from_page.expires_at > cached.expires_at)
+        ):
+            self._tokens[page.id] = from_page
+            return from_page
+        return cached
+
+    async def get_access_token(self, page: Page) -> str:
+        """
+        Access token dùng được cho page YouTube
+
+        Không validate token qua HTTP: token còn hạn lấy thẳng từ cache/DB,
+        chỉ refresh khi đã hết hạn hoặc chưa biết hạn
+
+        Raises:
+            Exception: token hết hạn mà không refresh được (cần reconnect channel)
+        """
+        token = self._cached(page)
+        if self._usable(token):
+            return token.access_token
+
+        if not token.refresh_token:
+            if token.expires_at is None and token.access_token and not token.invalid:
+                # Không biết hạn, không có refresh token -> dùng token hiện có, lỗi 401 sẽ báo khi upload
+                return token.access_token
+            raise Exception("Access token expired and no refresh token provided. Please reconnect YouTube channel.")
+
+        refreshed = await self.refresh(page.id, token)
+        return refreshed.access_token
+
+    async def refresh(self, page_id: int, token: Optional[CachedToken] = None) -> CachedToken:
+        """Refresh access token của page (một refresh mỗi page tại một thời điểm) và ghi lại DB"""
+        async with self._lock(page_id):
+            current = self._tokens.get(page_id) or token
+            # Request khác vừa refresh xong trong lúc chờ lock
+            if current is not None and token is not None and current is not token and self._usable(current):
+                return current
+            if current is None or not current.refresh_token:
+                raise Exception(f"No refresh token for YouTube page {page_id}")
+
+            try:
+                token_info = await self.youtube_service.refresh_access_token(current.refresh_token)
+            except Exception:
+                self._refresh_failed += 1
+                raise
+
+            refreshed = CachedToken(
+                access_token=token_info.get("access_token"),
+                refresh_token=token_info.get("refresh_token") or current.refresh_token,
+                expires_at=now_utc() + timedelta(seconds=int(token_info.get("expires_in") or 3600))
+            )
+            self._tokens[page_id] = refreshed
+            self._refreshed += 1
+
+        try:
+            async with async_session_maker() as session:
+                await PageService(session).update_tokens(
+                    page_id,
+                    access_token=refreshed.access_token,
+                    refresh_token=refreshed.refresh_token,
+                    expires_at=refreshed.expires_at
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not save refreshed YouTube token for page {page_id}: {str(e)}")
+
+        logger.info(f"🔑 Refreshed YouTube token for page {page_id} (expires {refreshed.expires_at.isoformat()})")
+        return refreshed
+
+    async def refresh_page(self, page: Page) -> CachedToken:
+        """Refresh token của page (token_sweeper gọi khi token sắp hết hạn)"""
+        return await self.refresh(page.id, self._cached(page))
+
+    def invalidate(self, page_id: int):
+        """Đánh dấu token bị từ chối (VD: API trả 401 với token tưởng còn hạn), lần dùng sau sẽ refresh"""
+        cached = self._tokens.get(page_id)
+        if cached is not None:
+            cached.invalid = True
+
+    def get_stats(self) -> dict:
+        now = now_utc()
+        return {
+            "cached": len(self._tokens),
+            "expiring_soon": sum(
+                1 for token in self._tokens.values()
+                if token.expires_at is not None
+                and token.expires_at - now < timedelta(seconds=settings.TOKEN_REFRESH_AHEAD_SECONDS)
+            ),
+            "refreshed": self._refreshed,
+            "refresh_failed": self._refresh_failed
+        }
+
+
+# Global instance
+youtube_token_manager = YouTubeTokenManager()
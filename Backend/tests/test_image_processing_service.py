@@ -0,0 +1,107 @@
+"""
+Watermark opacity: LUT trên alpha band phải cho kết quả giống hệt vòng lặp getpixel/putpixel cũ
+và nhanh hơn rõ rệt trên ảnh 2000px
+
+Chạy benchmark riêng: python tests/test_image_processing_service.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from PIL import Image, ImageChops
+
+from services.image_processing_service import ImageProcessingService
+
+CONTENT_SIZE = (2000, 1500)
+WATERMARK_SIZE = (1000, 500)
+
+
+def _noise_image(size, seed):
+    """Ảnh RGBA ngẫu nhiên cố định theo seed (alpha đủ mọi giá trị 0-255)"""
+    return Image.frombytes("RGBA", size, random.Random(seed).randbytes(size[0] * size[1] * 4))
+
+
+def _legacy_prepare_watermark(watermark_image, size, opacity):
+    """Bản cũ: resize rồi áp opacity bằng getpixel/putpixel từng pixel"""
+    watermark_resized = watermark_image.resize(size, Image.Resampling.LANCZOS)
+    watermark_with_opacity = Image.new('RGBA', watermark_resized.size)
+    for x in range(watermark_resized.size[0]):
+        for y in range(watermark_resized.size[1]):
+            r, g, b, a = watermark_resized.getpixel((x, y))
+            watermark_with_opacity.putpixel((x, y), (r, g, b, int(a * opacity)))
+    return watermark_with_opacity
+
+
+def _legacy_apply_watermark(content_image, watermark_image, opacity, margin=20):
+    """Bản cũ của apply_watermark_to_image (vị trí bottom-right)"""
+    content_image = content_image.convert('RGBA')
+    wm_width = min(watermark_image.size[0], int(content_image.size[0] * 0.2))
+    wm_height = int(wm_width * watermark_image.size[1] / watermark_image.size[0])
+    watermark = _legacy_prepare_watermark(watermark_image, (wm_width, wm_height), opacity)
+    result = content_image.copy()
+    x = content_image.size[0] - wm_width - margin
+    y = content_image.size[1] - wm_height - margin
+    result.paste(watermark, (x, y), watermark)
+    return result
+
+
+def _best_of(fn, runs=3):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+@pytest.fixture(scope="module")
+def images():
+    return _noise_image(CONTENT_SIZE, 1), _noise_image(WATERMARK_SIZE, 2)
+
+
+@pytest.mark.parametrize("opacity", [0.0, 0.35, 0.8, 1.0])
+def test_lut_opacity_matches_pixel_loop(images, opacity):
+    _, watermark = images
+    size = (400, 200)
+
+    expected = _legacy_prepare_watermark(watermark, size, opacity)
+    actual = ImageProcessingService._prepare_watermark(watermark, size, opacity)
+
+    assert actual.mode == expected.mode and actual.size == expected.size
+    assert ImageChops.difference(actual, expected).getbbox() is None
+
+
+def test_apply_watermark_matches_legacy_output(images):
+    content, watermark = images
+
+    expected = _legacy_apply_watermark(content, watermark, 0.8)
+    actual = ImageProcessingService.apply_watermark_to_image(content, watermark, opacity=0.8)
+
+    assert ImageChops.difference(actual, expected).getbbox() is None
+
+
+def test_lut_opacity_faster_than_pixel_loop(images):
+    content, watermark = images
+
+    legacy = _best_of(lambda: _legacy_apply_watermark(content, watermark, 0.8))
+    current = _best_of(lambda: ImageProcessingService.apply_watermark_to_image(content, watermark, opacity=0.8))
+    print(f"\nwatermark {CONTENT_SIZE[0]}x{CONTENT_SIZE[1]}: legacy {legacy * 1000:.1f} ms, lut {current * 1000:.1f} ms")
+
+    assert current * 3 < legacy
+
+
+if __name__ == "__main__":
+    content, watermark = _noise_image(CONTENT_SIZE, 1), _noise_image(WATERMARK_SIZE, 2)
+    size = (400, 200)
+    resized = watermark.resize(size, Image.Resampling.LANCZOS)
+    print(f"Content {CONTENT_SIZE[0]}x{CONTENT_SIZE[1]}, watermark {WATERMARK_SIZE[0]}x{WATERMARK_SIZE[1]} -> {size[0]}x{size[1]}")
+    print(f"  resize only:          {_best_of(lambda: watermark.resize(size, Image.Resampling.LANCZOS)) * 1000:8.1f} ms")
+    print(f"  opacity loop:         {_best_of(lambda: _legacy_prepare_watermark(resized, size, 0.8)) * 1000:8.1f} ms")
+    print(f"  opacity lut:          {_best_of(lambda: ImageProcessingService._prepare_watermark(resized, size, 0.8)) * 1000:8.1f} ms")
+    print(f"  full pass (legacy):   {_best_of(lambda: _legacy_apply_watermark(content, watermark, 0.8)) * 1000:8.1f} ms")
+    print(f"  full pass (lut):      {_best_of(lambda: ImageProcessingService.apply_watermark_to_image(content, watermark, opacity=0.8)) * 1000:8.1f} ms")
@@ -0,0 +1,90 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from services import youtube_token_manager as token_module
+from services.youtube_token_manager import YouTubeTokenManager
+from utils.timezone_utils import now_utc
+
+
+class FakeYouTubeService:
+    def __init__(self):
+        self.refreshed_with = []
+
+    async def refresh_access_token(self, refresh_token):
+        self.refreshed_with.append(refresh_token)
+        return {"access_token": f"fresh-{len(self.refreshed_with)}", "expires_in": 3600}
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakePageService:
+    saved = []
+
+    def __init__(self, session):
+        pass
+
+    async def update_tokens(self, page_id, **tokens):
+        FakePageService.saved.append((page_id, tokens))
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(token_module, "async_session_maker", FakeSession)
+    monkeypatch.setattr(token_module, "PageService", FakePageService)
+    FakePageService.saved = []
+    manager = YouTubeTokenManager()
+    manager._youtube_service = FakeYouTubeService()
+    return manager
+
+
+def make_page(access_token="stale", expires_in=timedelta(hours=1)):
+    return SimpleNamespace(
+        id=1,
+        access_token=access_token,
+        refresh_token="refresh",
+        token_expires_at=now_utc() + expires_in
+    )
+
+
+@pytest.mark.asyncio
+async def test_valid_token_is_served_from_cache(manager):
+    page = make_page()
+
+    assert await manager.get_access_token(page) == "stale"
+    assert manager.youtube_service.refreshed_with == []
+
+
+@pytest.mark.asyncio
+async def test_invalidate_after_401_forces_refresh(manager):
+    page = make_page()
+    assert await manager.get_access_token(page) == "stale"
+
+    # API trả 401: page (bản DB) vẫn giữ token cũ với hạn còn dài
+    manager.invalidate(page.id)
+
+    assert await manager.get_access_token(page) == "fresh-1"
+    assert manager.youtube_service.refreshed_with == ["refresh"]
+    assert FakePageService.saved[0][0] == page.id
+    # Token mới được cache, không refresh lại
+    assert await manager.get_access_token(page) == "fresh-1"
+    assert len(manager.youtube_service.refreshed_with) == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidated_token_replaced_by_new_page_token(manager):
+    page = make_page()
+    await manager.get_access_token(page)
+    manager.invalidate(page.id)
+
+    # Page vừa reconnect: token khác trên page được dùng luôn, không cần refresh
+    page.access_token = "reconnected"
+    assert await manager.get_access_token(page) == "reconnected"
+    assert manager.youtube_service.refreshed_with == []